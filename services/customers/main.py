@@ -1,6 +1,17 @@
 from fastapi import FastAPI
 
+from shared import metrics
+from shared.config import DB_DRIVER
+from shared.db import lifespan
+
 from .routes import router
+from .routes_async import router as async_router
 
-app = FastAPI(title="OMS - Customers Service", version="0.1.0")
+app = FastAPI(title="OMS - Customers Service", version="0.1.0", lifespan=lifespan)
+# Routes are matched in registration order, so in async mode the async handlers
+# shadow their sync twins and endpoints without an async variant stay on the
+# sync pool.
+if DB_DRIVER == "async":
+    app.include_router(async_router)
 app.include_router(router)
+app.include_router(metrics.router)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr
 
@@ -21,6 +21,11 @@ class CustomerOut(BaseModel):
     updated_at: datetime
 
 
+class CustomerMultiGetOut(BaseModel):
+    customers: List[CustomerOut]
+    missing: List[int]
+
+
 class CustomerUpdate(BaseModel):
     email: Optional[EmailStr] = None
     first_name: Optional[str] = None
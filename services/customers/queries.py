@@ -0,0 +1,70 @@
+from typing import Any, List, Optional, Tuple
+
+CUSTOMER_COLUMNS = "id, email, first_name, last_name, phone, created_at, updated_at"
+
+INSERT_CUSTOMER = f"""
+    INSERT INTO customers (email, first_name, last_name, phone)
+    VALUES (%s, %s, %s, %s)
+    RETURNING {CUSTOMER_COLUMNS}
+"""
+
+SELECT_CUSTOMER_BY_ID = f"""
+    SELECT {CUSTOMER_COLUMNS}
+    FROM customers
+    WHERE id = %s
+"""
+
+SELECT_CUSTOMERS_BY_IDS = f"""
+    SELECT {CUSTOMER_COLUMNS}
+    FROM customers
+    WHERE id = ANY(%s)
+"""
+
+DELETE_CUSTOMER = """
+    DELETE FROM customers
+    WHERE id = %s
+"""
+
+
+def build_update_customer(
+    customer_id: int,
+    email: Optional[str],
+    first_name: Optional[str],
+    last_name: Optional[str],
+    phone: Optional[str],
+) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+    fields = []
+    params: List[Any] = []
+
+    if email is not None:
+        fields.append("email = %s")
+        params.append(email)
+    if first_name is not None:
+        fields.append("first_name = %s")
+        params.append(first_name)
+    if last_name is not None:
+        fields.append("last_name = %s")
+        params.append(last_name)
+    if phone is not None:
+        fields.append("phone = %s")
+        params.append(phone)
+
+    if not fields:
+        return None
+
+    params.append(customer_id)
+    sql = f"""
+        UPDATE customers
+        SET {", ".join(fields)}, updated_at = now()
+        WHERE id = %s
+        RETURNING {CUSTOMER_COLUMNS}
+    """
+    return sql, tuple(params)
+
+
+# Plans checked by `python -m shared.migrate --check` against seeded data.
+EXPLAIN_CHECKS = [
+    ("select_customer_by_id", lambda s: (SELECT_CUSTOMER_BY_ID, (s["customer_id"],))),
+    ("select_customers_by_ids", lambda s: (SELECT_CUSTOMERS_BY_IDS, ([s["customer_id"]],))),
+    ("delete_customer", lambda s: (DELETE_CUSTOMER, (s["customer_id"],))),
+]
@@ -1,17 +1,25 @@
-from fastapi import APIRouter, HTTPException
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from psycopg2.errors import IntegrityError, UniqueViolation
 
-from shared.db import get_conn
+from shared.db import get_db
+from shared.multiget import requested_ids
 
-from .models import CustomerCreate, CustomerOut, CustomerUpdate
-from .service import create_customer, delete_customer, get_customer_by_id, update_customer
+from .models import CustomerCreate, CustomerMultiGetOut, CustomerOut, CustomerUpdate
+from .service import (
+    create_customer,
+    delete_customer,
+    get_customer_by_id,
+    get_customers_by_ids,
+    update_customer,
+)
 
 router = APIRouter()
 
 
 @router.post("/customers", response_model=CustomerOut, status_code=201)
-def create_customer_endpoint(payload: CustomerCreate):
-    conn = get_conn()
+def create_customer_endpoint(payload: CustomerCreate, conn=Depends(get_db)):
     try:
         customer = create_customer(
             conn,
@@ -27,25 +35,26 @@ def create_customer_endpoint(payload: CustomerCreate):
     except IntegrityError:
         conn.rollback()
         raise HTTPException(status_code=400, detail="Invalid customer data")
-    finally:
-        conn.close()
+
+
+@router.get("/customers", response_model=CustomerMultiGetOut)
+def get_customers_endpoint(
+    ids: List[str] = Query(..., description="Comma-separated customer ids"),
+    conn=Depends(get_db),
+):
+    return get_customers_by_ids(conn, requested_ids(ids))
 
 
 @router.get("/customers/{customer_id}", response_model=CustomerOut)
-def get_customer_endpoint(customer_id: int):
-    conn = get_conn()
-    try:
-        customer = get_customer_by_id(conn, customer_id)
-        if not customer:
-            raise HTTPException(status_code=404, detail="Customer not found")
-        return customer
-    finally:
-        conn.close()
+def get_customer_endpoint(customer_id: int, conn=Depends(get_db)):
+    customer = get_customer_by_id(conn, customer_id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer
 
 
 @router.put("/customers/{customer_id}", response_model=CustomerOut)
-def update_customer_endpoint(customer_id: int, payload: CustomerUpdate):
-    conn = get_conn()
+def update_customer_endpoint(customer_id: int, payload: CustomerUpdate, conn=Depends(get_db)):
     try:
         row = update_customer(
             conn,
@@ -61,13 +70,10 @@ def update_customer_endpoint(customer_id: int, payload: CustomerUpdate):
     except UniqueViolation:
         conn.rollback()
         raise HTTPException(status_code=409, detail="Email already exists")
-    finally:
-        conn.close()
 
 
 @router.delete("/customers/{customer_id}", status_code=204)
-def delete_customer_endpoint(customer_id: int):
-    conn = get_conn()
+def delete_customer_endpoint(customer_id: int, conn=Depends(get_db)):
     try:
         deleted = delete_customer(conn, customer_id)
         if not deleted:
@@ -75,5 +81,3 @@ def delete_customer_endpoint(customer_id: int):
     except IntegrityError:
         conn.rollback()
         raise HTTPException(status_code=409, detail="Customer has existing orders")
-    finally:
-        conn.close()
@@ -0,0 +1,85 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from psycopg.errors import IntegrityError, UniqueViolation
+
+from shared.db import get_async_db
+from shared.multiget import requested_ids
+
+from .models import CustomerCreate, CustomerMultiGetOut, CustomerOut, CustomerUpdate
+from .service_async import (
+    create_customer,
+    delete_customer,
+    get_customer_by_id,
+    get_customers_by_ids,
+    update_customer,
+)
+
+router = APIRouter()
+
+
+@router.post("/customers", response_model=CustomerOut, status_code=201)
+async def create_customer_endpoint(payload: CustomerCreate, conn=Depends(get_async_db)):
+    try:
+        customer = await create_customer(
+            conn,
+            email=str(payload.email),
+            first_name=payload.first_name,
+            last_name=payload.last_name,
+            phone=payload.phone,
+        )
+        return customer
+    except UniqueViolation:
+        await conn.rollback()
+        raise HTTPException(status_code=409, detail="Email already exists")
+    except IntegrityError:
+        await conn.rollback()
+        raise HTTPException(status_code=400, detail="Invalid customer data")
+
+
+@router.get("/customers", response_model=CustomerMultiGetOut)
+async def get_customers_endpoint(
+    ids: List[str] = Query(..., description="Comma-separated customer ids"),
+    conn=Depends(get_async_db),
+):
+    return await get_customers_by_ids(conn, requested_ids(ids))
+
+
+@router.get("/customers/{customer_id}", response_model=CustomerOut)
+async def get_customer_endpoint(customer_id: int, conn=Depends(get_async_db)):
+    customer = await get_customer_by_id(conn, customer_id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return customer
+
+
+@router.put("/customers/{customer_id}", response_model=CustomerOut)
+async def update_customer_endpoint(
+    customer_id: int, payload: CustomerUpdate, conn=Depends(get_async_db)
+):
+    try:
+        row = await update_customer(
+            conn,
+            customer_id,
+            payload.email,
+            payload.first_name,
+            payload.last_name,
+            payload.phone,
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        return row
+    except UniqueViolation:
+        await conn.rollback()
+        raise HTTPException(status_code=409, detail="Email already exists")
+
+
+@router.delete("/customers/{customer_id}", status_code=204)
+async def delete_customer_endpoint(customer_id: int, conn=Depends(get_async_db)):
+    try:
+        deleted = await delete_customer(conn, customer_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Customer not found")
+    except IntegrityError:
+        await conn.rollback()
+        raise HTTPException(status_code=409, detail="Customer has existing orders")
@@ -1,5 +1,15 @@
 from typing import Any, Dict, List, Optional
 
+from shared.multiget import order_by_ids
+
+from .queries import (
+    DELETE_CUSTOMER,
+    INSERT_CUSTOMER,
+    SELECT_CUSTOMER_BY_ID,
+    SELECT_CUSTOMERS_BY_IDS,
+    build_update_customer,
+)
+
 
 def create_customer(
     conn,
@@ -9,14 +19,7 @@ def create_customer(
     phone: Optional[str],
 ) -> Dict[str, Any]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO customers (email, first_name, last_name, phone)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, email, first_name, last_name, phone, created_at, updated_at
-            """,
-            (email, first_name, last_name, phone),
-        )
+        cur.execute(INSERT_CUSTOMER, (email, first_name, last_name, phone))
         row = cur.fetchone()
 
     conn.commit()
@@ -25,17 +28,17 @@ def create_customer(
 
 def get_customer_by_id(conn, customer_id: int) -> Optional[Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, email, first_name, last_name, phone, created_at, updated_at
-            FROM customers
-            WHERE id = %s
-            """,
-            (customer_id,),
-        )
+        cur.execute(SELECT_CUSTOMER_BY_ID, (customer_id,))
         return cur.fetchone()
 
 
+def get_customers_by_ids(conn, customer_ids: List[int]) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_CUSTOMERS_BY_IDS, (customer_ids,))
+        customers, missing = order_by_ids(cur.fetchall() or [], customer_ids)
+    return {"customers": customers, "missing": missing}
+
+
 def update_customer(
     conn,
     customer_id: int,
@@ -44,36 +47,12 @@ def update_customer(
     last_name: Optional[str],
     phone: Optional[str],
 ) -> Optional[Dict[str, Any]]:
-    fields = []
-    params: List[Any] = []
-
-    if email is not None:
-        fields.append("email = %s")
-        params.append(email)
-    if first_name is not None:
-        fields.append("first_name = %s")
-        params.append(first_name)
-    if last_name is not None:
-        fields.append("last_name = %s")
-        params.append(last_name)
-    if phone is not None:
-        fields.append("phone = %s")
-        params.append(phone)
-
-    if not fields:
+    update = build_update_customer(customer_id, email, first_name, last_name, phone)
+    if update is None:
         return get_customer_by_id(conn, customer_id)
 
-    params.append(customer_id)
     with conn.cursor() as cur:
-        cur.execute(
-            f"""
-            UPDATE customers
-            SET {", ".join(fields)}, updated_at = now()
-            WHERE id = %s
-            RETURNING id, email, first_name, last_name, phone, created_at, updated_at
-            """,
-            tuple(params),
-        )
+        cur.execute(*update)
         row = cur.fetchone()
     conn.commit()
     return row
@@ -81,13 +60,7 @@ def update_customer(
 
 def delete_customer(conn, customer_id: int) -> bool:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            DELETE FROM customers
-            WHERE id = %s
-            """,
-            (customer_id,),
-        )
+        cur.execute(DELETE_CUSTOMER, (customer_id,))
         deleted = cur.rowcount > 0
     conn.commit()
     return deleted
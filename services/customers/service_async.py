@@ -0,0 +1,66 @@
+from typing import Any, Dict, List, Optional
+
+from shared.multiget import order_by_ids
+
+from .queries import (
+    DELETE_CUSTOMER,
+    INSERT_CUSTOMER,
+    SELECT_CUSTOMER_BY_ID,
+    SELECT_CUSTOMERS_BY_IDS,
+    build_update_customer,
+)
+
+
+async def create_customer(
+    conn,
+    email: str,
+    first_name: str,
+    last_name: str,
+    phone: Optional[str],
+) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(INSERT_CUSTOMER, (email, first_name, last_name, phone))
+        row = await cur.fetchone()
+
+    await conn.commit()
+    return row
+
+
+async def get_customer_by_id(conn, customer_id: int) -> Optional[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_CUSTOMER_BY_ID, (customer_id,))
+        return await cur.fetchone()
+
+
+async def get_customers_by_ids(conn, customer_ids: List[int]) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_CUSTOMERS_BY_IDS, (customer_ids,))
+        customers, missing = order_by_ids(await cur.fetchall() or [], customer_ids)
+    return {"customers": customers, "missing": missing}
+
+
+async def update_customer(
+    conn,
+    customer_id: int,
+    email: Optional[str],
+    first_name: Optional[str],
+    last_name: Optional[str],
+    phone: Optional[str],
+) -> Optional[Dict[str, Any]]:
+    update = build_update_customer(customer_id, email, first_name, last_name, phone)
+    if update is None:
+        return await get_customer_by_id(conn, customer_id)
+
+    async with conn.cursor() as cur:
+        await cur.execute(*update)
+        row = await cur.fetchone()
+    await conn.commit()
+    return row
+
+
+async def delete_customer(conn, customer_id: int) -> bool:
+    async with conn.cursor() as cur:
+        await cur.execute(DELETE_CUSTOMER, (customer_id,))
+        deleted = cur.rowcount > 0
+    await conn.commit()
+    return deleted
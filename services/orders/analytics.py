@@ -0,0 +1,265 @@
+import io
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from shared import metrics
+from shared.config import (
+    ANALYTICS_FULL_REFRESH_SECONDS,
+    ANALYTICS_LAG_SECONDS,
+    ANALYTICS_REFRESH_SECONDS,
+)
+from shared.db import request_db
+
+from .queries import (
+    ANALYTICS_ORDER_ITEMS,
+    ANALYTICS_ORDERS,
+    ANALYTICS_STATUSES,
+    BEGIN_ANALYTICS_SNAPSHOT,
+    SELECT_PRODUCT_LABELS,
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DAY_US = 86_400_000_000
+CANCELLED = ANALYTICS_STATUSES.index("CANCELLED")
+
+
+def to_us(dt: datetime) -> int:
+    # Naive datetimes are taken as UTC, as in build_top_selling_products.
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def copy_columns(cur, sql: str, params: Dict[str, Any], columns: int) -> np.ndarray:
+    # COPY ... (FORMAT csv) parsed by numpy is several times faster than
+    # building rows through the cursor.
+    buf = io.BytesIO()
+    cur.copy_expert(f"COPY ({cur.mogrify(sql, params).decode()}) TO STDOUT (FORMAT csv)", buf)
+    if not buf.tell():
+        return np.empty((0, columns), dtype=np.int64)
+    buf.seek(0)
+    return np.loadtxt(buf, delimiter=",", dtype=np.int64, ndmin=2)
+
+
+def top_indexes(values: np.ndarray, candidates: np.ndarray, limit: int) -> np.ndarray:
+    # The `limit` candidates with the largest values, ties broken by index.
+    if len(candidates) > limit:
+        cut = values[candidates]
+        kth = np.partition(cut, len(cut) - limit)[len(cut) - limit]
+        candidates = candidates[cut >= kth]
+    return candidates[np.lexsort((candidates, -values[candidates]))][:limit]
+
+
+# Orders and their items as column arrays. Orders are sorted by id and every
+# item knows the row of its order, so per-order attributes reach the items
+# with one gather. Products and customers get dense codes, which lets every
+# report group with np.bincount instead of sorting.
+class SalesSnapshot:
+    def __init__(self, orders: np.ndarray, items: np.ndarray, as_of: datetime):
+        # orders: id, customer_id, status, total_cents, created_us;
+        # items: order_id, product_id, quantity, line_total_cents.
+        self.orders = np.ascontiguousarray(orders[np.argsort(orders[:, 0], kind="stable")].T)
+        self.items = np.ascontiguousarray(items.T)
+        self.as_of = as_of
+
+        self.order_ids, self.customer_ids, statuses, self.totals, self.created = self.orders
+        self.statuses = statuses.astype(np.int8)
+        self.customers, self.order_customers = np.unique(self.customer_ids, return_inverse=True)
+
+        item_order_ids, product_ids, self.quantities, self.item_totals = self.items
+        self.item_rows = np.searchsorted(self.order_ids, item_order_ids)
+        self.products, self.item_products = np.unique(product_ids, return_inverse=True)
+        self.order_units = np.bincount(
+            self.item_rows, weights=self.quantities, minlength=len(self.order_ids)
+        ).astype(np.int64)
+
+    def merged(self, orders: np.ndarray, items: np.ndarray, as_of: datetime) -> "SalesSnapshot":
+        # Changed orders replace their old rows and all of their items.
+        changed = orders[:, 0]
+        keep_orders = ~np.isin(self.orders[0], changed)
+        keep_items = ~np.isin(self.items[0], changed)
+        return SalesSnapshot(
+            np.concatenate([self.orders[:, keep_orders].T, orders]),
+            np.concatenate([self.items[:, keep_items].T, items]),
+            as_of,
+        )
+
+    def orders_in(self, start: datetime, end: datetime, sold: bool = True) -> np.ndarray:
+        mask = (self.created >= to_us(start)) & (self.created <= to_us(end))
+        if sold:
+            mask &= self.statuses != CANCELLED
+        return mask
+
+    def top_products(
+        self, start: datetime, end: datetime, limit: int
+    ) -> List[Tuple[int, int, int]]:
+        items = self.orders_in(start, end)[self.item_rows]
+        codes = self.item_products[items]
+        n = len(self.products)
+        quantity = np.bincount(codes, weights=self.quantities[items], minlength=n).astype(np.int64)
+        sales = np.bincount(codes, weights=self.item_totals[items], minlength=n).astype(np.int64)
+        top = top_indexes(quantity, np.flatnonzero(quantity), limit)
+        return [(int(self.products[i]), int(quantity[i]), int(sales[i])) for i in top]
+
+    def sales_by_day(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        orders = self.orders_in(start, end)
+        days = self.created[orders] // DAY_US
+        if not len(days):
+            return []
+        first = int(days.min())
+        days -= first
+        counts = np.bincount(days)
+        units = np.bincount(days, weights=self.order_units[orders]).astype(np.int64)
+        sales = np.bincount(days, weights=self.totals[orders]).astype(np.int64)
+        return [
+            {
+                "day": date.fromordinal(EPOCH.toordinal() + first + int(i)),
+                "orders": int(counts[i]),
+                "units": int(units[i]),
+                "sales_cents": int(sales[i]),
+            }
+            for i in np.flatnonzero(counts)
+        ]
+
+    def top_customers(self, start: datetime, end: datetime, limit: int) -> List[Dict[str, Any]]:
+        orders = self.orders_in(start, end)
+        codes = self.order_customers[orders]
+        n = len(self.customers)
+        counts = np.bincount(codes, minlength=n)
+        sales = np.bincount(codes, weights=self.totals[orders], minlength=n).astype(np.int64)
+        return [
+            {
+                "customer_id": int(self.customers[i]),
+                "orders": int(counts[i]),
+                "sales_cents": int(sales[i]),
+            }
+            for i in top_indexes(sales, np.flatnonzero(counts), limit)
+        ]
+
+    def basket_sizes(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        counts = np.bincount(self.order_units[self.orders_in(start, end)])
+        return [{"units": int(u), "orders": int(counts[u])} for u in np.flatnonzero(counts)]
+
+    def status_funnel(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        orders = self.orders_in(start, end, sold=False)
+        statuses = self.statuses[orders]
+        n = len(ANALYTICS_STATUSES)
+        counts = np.bincount(statuses, minlength=n)
+        totals = np.bincount(statuses, weights=self.totals[orders], minlength=n).astype(np.int64)
+        # An order has reached a stage if it is there or further along;
+        # cancelled orders only count as cancelled.
+        reached = counts.copy()
+        reached[:CANCELLED] = np.cumsum(counts[:CANCELLED][::-1])[::-1]
+        return [
+            {
+                "status": status,
+                "orders": int(counts[i]),
+                "reached": int(reached[i]),
+                "total_cents": int(totals[i]),
+            }
+            for i, status in enumerate(ANALYTICS_STATUSES)
+        ]
+
+
+class AnalyticsEngine:
+    def __init__(self, refresh_seconds: float, full_refresh_seconds: float, lag_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self.lag_seconds = lag_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Optional[SalesSnapshot] = None
+        self._since: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self._full_at = 0.0
+        metrics.register_gauges(self.stats)
+
+    @property
+    def enabled(self) -> bool:
+        return self.refresh_seconds > 0
+
+    def _stale(self) -> bool:
+        return self._snapshot is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def snapshot(self) -> SalesSnapshot:
+        snapshot = self._snapshot
+        if not self._stale():
+            return snapshot
+        # One request refreshes a stale snapshot while the others keep
+        # answering from it; only the first load makes them wait.
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._stale():
+                self._refresh()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def _refresh(self) -> None:
+        started = time.monotonic()
+        full = self._snapshot is None or started - self._full_at >= self.full_refresh_seconds
+        params = {"since": "-infinity" if full else self._since}
+        with request_db() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(BEGIN_ANALYTICS_SNAPSHOT)
+                    cur.execute("SELECT now() AS now")
+                    as_of = cur.fetchone()["now"]
+                    orders = copy_columns(cur, ANALYTICS_ORDERS, params, 5)
+                    items = copy_columns(cur, ANALYTICS_ORDER_ITEMS, params, 4)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if full:
+            self._snapshot = SalesSnapshot(orders, items, as_of)
+            self._full_at = started
+        else:
+            self._snapshot = self._snapshot.merged(orders, items, as_of)
+        self._since = as_of - timedelta(seconds=self.lag_seconds)
+        self._loaded_at = started
+        metrics.incr("analytics_full_loads" if full else "analytics_refreshes")
+        metrics.incr("analytics_load_seconds", time.monotonic() - started)
+
+    def stats(self) -> Dict[str, float]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}
+        return {
+            "analytics_orders": len(snapshot.order_ids),
+            "analytics_order_items": len(snapshot.item_rows),
+            "analytics_snapshot_age_seconds": time.monotonic() - self._loaded_at,
+        }
+
+
+analytics = AnalyticsEngine(
+    ANALYTICS_REFRESH_SECONDS, ANALYTICS_FULL_REFRESH_SECONDS, ANALYTICS_LAG_SECONDS
+)
+
+
+# GET /reports/top-products from the snapshot; only the product labels of
+# the winners are read from the database.
+def top_products_report(start: datetime, end: datetime, limit: int) -> List[Dict[str, Any]]:
+    top = analytics.snapshot().top_products(start, end, limit)
+    if not top:
+        return []
+    with request_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SELECT_PRODUCT_LABELS, ([pid for pid, _, _ in top],))
+            labels = {r["id"]: r for r in cur.fetchall() or []}
+    return [
+        {
+            "product_id": pid,
+            "sku": labels[pid]["sku"],
+            "name": labels[pid]["name"],
+            "total_quantity": quantity,
+            "total_sales_cents": sales,
+        }
+        for pid, quantity, sales in top
+        if pid in labels
+    ]
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+
+from shared.cache import TTLCache
+from shared.config import (
+    ORDER_CACHE_MAX_SIZE,
+    ORDER_CACHE_TTL_SECONDS,
+    REPORT_CACHE_BUCKET_SECONDS,
+    REPORT_CACHE_MAX_SIZE,
+    REPORT_CACHE_PAST_TTL_SECONDS,
+    REPORT_CACHE_TTL_SECONDS,
+)
+
+from .models import OrderOut, TopProductOut
+
+order_cache = TTLCache("order_cache", ORDER_CACHE_MAX_SIZE, ORDER_CACHE_TTL_SECONDS)
+report_cache = TTLCache("report_cache", REPORT_CACHE_MAX_SIZE, REPORT_CACHE_TTL_SECONDS)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+TOP_PRODUCTS = TypeAdapter(List[TopProductOut])
+
+
+def order_json(order: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    if not order:
+        return None
+    return OrderOut.model_validate(order).model_dump_json().encode()
+
+
+def top_products_json(rows: List[Dict[str, Any]]) -> bytes:
+    return TOP_PRODUCTS.dump_json(TOP_PRODUCTS.validate_python(rows))
+
+
+def align_report_window(
+    start: datetime, end: datetime, bucket_seconds: int = REPORT_CACHE_BUCKET_SECONDS
+) -> Tuple[datetime, datetime]:
+    # Widens [start, end] to whole buckets: start moves back to a bucket
+    # boundary and end forward to just before the next one. Naive datetimes
+    # are taken as UTC.
+    if bucket_seconds <= 0:
+        return start, end
+    start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    step = timedelta(seconds=bucket_seconds)
+    aligned_start = EPOCH + (start - EPOCH) // step * step
+    aligned_end = EPOCH + ((end - EPOCH) // step + 1) * step - timedelta(microseconds=1)
+    return aligned_start, aligned_end
+
+
+def report_ttl(end: datetime) -> float:
+    if end.replace(tzinfo=end.tzinfo or timezone.utc) < datetime.now(timezone.utc):
+        return REPORT_CACHE_PAST_TTL_SECONDS
+    return REPORT_CACHE_TTL_SECONDS
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# On-disk layout written by `python -m services.orders.dump` and read with
+# numpy.memmap. Only numpy is needed to read it, so analysts can copy this
+# module next to the files:
+#
+#   <root>/day=2024-03-01/_meta.json
+#   <root>/day=2024-03-01/orders.id.i8
+#   <root>/day=2024-03-01/order_items.quantity.i4
+#   ...
+#
+# One headerless little-endian file per column. Orders are in id order and
+# items in (order_id, product_id) order, each partition holding the orders
+# created that UTC day. _meta.json is written last; a directory without it
+# is an interrupted dump and is ignored.
+ORDER_COLUMNS = {
+    "id": "<i8",
+    "customer_id": "<i8",
+    "status": "u1",
+    "total_cents": "<i8",
+    "created_at_us": "<i8",
+}
+ORDER_ITEM_COLUMNS = {
+    "order_id": "<i8",
+    "product_id": "<i8",
+    "quantity": "<i4",
+    "line_total_cents": "<i8",
+}
+TABLES = {"orders": ORDER_COLUMNS, "order_items": ORDER_ITEM_COLUMNS}
+META_FILE = "_meta.json"
+FORMAT_VERSION = 1
+
+
+def partition_dir(root: Path, day: date) -> Path:
+    return Path(root) / f"day={day.isoformat()}"
+
+
+def _column_file(directory: Path, table: str, name: str, dtype: str) -> Path:
+    return directory / f"{table}.{name}.{np.dtype(dtype).kind}{np.dtype(dtype).itemsize}"
+
+
+def partition_days(root: Path) -> List[date]:
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(
+        date.fromisoformat(p.name[len("day="):])
+        for p in root.glob("day=*")
+        if (p / META_FILE).exists()
+    )
+
+
+# Writes one day from (rows, columns) int64 arrays in ORDER_COLUMNS /
+# ORDER_ITEM_COLUMNS order. The partition is built in a temporary directory
+# and renamed into place, replacing any earlier dump of the day.
+def write_partition(
+    root: Path, day: date, statuses: List[str], orders: np.ndarray, items: np.ndarray
+) -> Path:
+    final = partition_dir(root, day)
+    tmp = final.with_name(final.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    meta = {"version": FORMAT_VERSION, "day": day.isoformat(), "statuses": statuses, "rows": {}}
+    for table, rows in (("orders", orders), ("order_items", items)):
+        for i, (name, dtype) in enumerate(TABLES[table].items()):
+            rows[:, i].astype(dtype).tofile(_column_file(tmp, table, name, dtype))
+        meta["rows"][table] = len(rows)
+    with open(tmp / META_FILE, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    old = final.with_name(final.name + ".old")
+    if final.exists():
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+def _open_column(path: Path, dtype: str, rows: int) -> np.ndarray:
+    # np.memmap cannot map an empty file.
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+class Partition:
+    def __init__(self, directory: Path):
+        meta = json.loads((directory / META_FILE).read_text())
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"{directory}: unsupported format version {meta['version']}")
+        self.day = date.fromisoformat(meta["day"])
+        self.statuses: List[str] = meta["statuses"]
+        self.orders: Dict[str, np.ndarray] = {}
+        self.order_items: Dict[str, np.ndarray] = {}
+        for table, columns in TABLES.items():
+            target = getattr(self, table)
+            for name, dtype in columns.items():
+                target[name] = _open_column(
+                    _column_file(directory, table, name, dtype), dtype, meta["rows"][table]
+                )
+
+    def item_statuses(self) -> np.ndarray:
+        # Status code of each item's order; orders are sorted by id.
+        rows = np.searchsorted(self.orders["id"], self.order_items["order_id"])
+        return self.orders["status"][rows]
+
+
+def open_partitions(
+    root: Path, start: Optional[date] = None, end: Optional[date] = None
+) -> List[Partition]:
+    # Days in [start, end], both inclusive.
+    return [
+        Partition(partition_dir(root, day))
+        for day in partition_days(root)
+        if (start is None or day >= start) and (end is None or day <= end)
+    ]
+
+
+# Same totals as GET /reports/top-products over whole days: items of orders
+# that are not cancelled, grouped per partition and then across partitions.
+def top_products(partitions: List[Partition], limit: int) -> List[Tuple[int, int, int]]:
+    ids, quantities, sales = [], [], []
+    for p in partitions:
+        items = p.order_items
+        sold = p.item_statuses() != p.statuses.index("CANCELLED")
+        product_ids, codes = np.unique(items["product_id"][sold], return_inverse=True)
+        ids.append(product_ids)
+        quantities.append(np.bincount(codes, weights=items["quantity"][sold]))
+        sales.append(np.bincount(codes, weights=items["line_total_cents"][sold]))
+    if not ids:
+        return []
+    product_ids, codes = np.unique(np.concatenate(ids), return_inverse=True)
+    quantity = np.bincount(codes, weights=np.concatenate(quantities)).astype(np.int64)
+    cents = np.bincount(codes, weights=np.concatenate(sales)).astype(np.int64)
+    top = np.lexsort((product_ids, -quantity))[:limit]
+    return [(int(product_ids[i]), int(quantity[i]), int(cents[i])) for i in top]
@@ -0,0 +1,92 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from shared.db import get_conn
+
+from .analytics import copy_columns
+from .columnar import partition_days, write_partition
+from .queries import (
+    ANALYTICS_STATUSES,
+    BEGIN_ANALYTICS_SNAPSHOT,
+    DUMP_DAY_ORDER_ITEMS,
+    DUMP_DAY_ORDERS,
+)
+from .rollup import order_day_range
+
+
+def fetch_day(conn, day: date) -> Tuple[np.ndarray, np.ndarray]:
+    # Orders and items come from one snapshot so every item has its order.
+    try:
+        with conn.cursor() as cur:
+            cur.execute(BEGIN_ANALYTICS_SNAPSHOT)
+            orders = copy_columns(cur, DUMP_DAY_ORDERS, {"day": day}, 5)
+            items = copy_columns(cur, DUMP_DAY_ORDER_ITEMS, {"day": day}, 4)
+        conn.commit()
+        return orders, items
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def dump_day(conn, root: Path, day: date) -> Tuple[int, int]:
+    orders, items = fetch_day(conn, day)
+    write_partition(root, day, ANALYTICS_STATUSES, orders, items)
+    return len(orders), len(items)
+
+
+# Days to dump when none are given: those after the last partition written
+# (or from the first order) up to yesterday, so earlier partitions are never
+# rewritten and today's, which is still changing, is left for the next run.
+def pending_days(conn, root: Path, today: date) -> List[date]:
+    written = partition_days(root)
+    if written:
+        first = written[-1] + timedelta(days=1)
+    else:
+        first, _ = order_day_range(conn)
+        if first is None:
+            return []
+    return [first + timedelta(days=i) for i in range((today - first).days)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Dump orders and order items into day-partitioned columnar files."
+    )
+    parser.add_argument("--dir", type=Path, required=True, help="snapshot root directory")
+    parser.add_argument(
+        "--start", type=date.fromisoformat, help="first UTC day to (re)dump, replacing it"
+    )
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        help="last UTC day to (re)dump, inclusive (default: --start)",
+    )
+    args = parser.parse_args(argv)
+    if args.end and not args.start:
+        parser.error("--end needs --start")
+
+    conn = get_conn()
+    try:
+        if args.start:
+            end = args.end or args.start
+            days = [args.start + timedelta(days=i) for i in range((end - args.start).days + 1)]
+        else:
+            days = pending_days(conn, args.dir, datetime.now(timezone.utc).date())
+        if not days:
+            print("nothing to dump")
+            return 0
+        for day in days:
+            orders, items = dump_day(conn, args.dir, day)
+            print(f"{day}: {orders} orders, {items} items")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import csv
+import io
+from typing import Any, Dict, Iterator, List
+
+from .models import OrderOut, OrderSummaryOut
+from .queries import EXPORT_ORDERS, EXPORT_ORDERS_WITH_ITEMS, ORDER_COLUMNS, ORDER_ITEM_COLUMNS
+
+EXPORT_ORDER_FIELDS = [c.strip() for c in ORDER_COLUMNS.split(",")]
+EXPORT_ITEM_FIELDS = [c.strip() for c in ORDER_ITEM_COLUMNS.split(",")]
+
+
+def fetch_export_chunks(
+    conn, start_dt, end_dt, include_items: bool, fetch_size: int
+) -> Iterator[List[Dict[str, Any]]]:
+    # A named cursor keeps the result set on the server; only fetch_size rows
+    # are held in memory at a time.
+    with conn.cursor(name="orders_export") as cur:
+        cur.itersize = fetch_size
+        query = EXPORT_ORDERS_WITH_ITEMS if include_items else EXPORT_ORDERS
+        cur.execute(query, (start_dt, end_dt))
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def ndjson_chunks(
+    chunks: Iterator[List[Dict[str, Any]]], include_items: bool
+) -> Iterator[bytes]:
+    model = OrderOut if include_items else OrderSummaryOut
+    for rows in chunks:
+        yield b"".join(
+            model.model_validate(r).model_dump_json(exclude_unset=True).encode() + b"\n"
+            for r in rows
+        )
+
+
+def csv_chunks(chunks: Iterator[List[Dict[str, Any]]], include_items: bool) -> Iterator[bytes]:
+    # With items there is one line per order item; orders without items get
+    # one line with empty item columns.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_ORDER_FIELDS + (EXPORT_ITEM_FIELDS if include_items else []))
+    yield _drain(buf)
+    for rows in chunks:
+        for r in rows:
+            order = [
+                r[f].isoformat() if f in ("created_at", "updated_at") else r[f]
+                for f in EXPORT_ORDER_FIELDS
+            ]
+            if not include_items:
+                writer.writerow(order)
+                continue
+            for item in r["items"] or [{}]:
+                writer.writerow(order + [item.get(f, "") for f in EXPORT_ITEM_FIELDS])
+        yield _drain(buf)
+
+
+def _drain(buf: io.StringIO) -> bytes:
+    data = buf.getvalue().encode()
+    buf.seek(0)
+    buf.truncate()
+    return data
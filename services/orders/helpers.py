@@ -1,4 +1,21 @@
-from typing import Any, Dict, Iterable, List, Tuple
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from shared.inventory import adjust_bucketed_stock, lock_product_stock
+from shared.product_events import notify_product_changes
+
+from .queries import (
+    APPLY_ORDER_ITEMS_DIFF,
+    APPLY_ORDERS_TO_DAILY_SALES,
+    APPLY_STOCK_DELTAS,
+    INSERT_BATCH_ORDER_ITEMS,
+    INSERT_ORDER_ITEMS,
+    SELECT_ORDER_ITEMS,
+    SELECT_ORDERS_ITEMS,
+    SELECT_PRODUCTS_FOR_UPDATE,
+)
 
 
 def normalize_items(items: List[Dict[str, int]]) -> List[Tuple[int, int]]:
@@ -17,15 +34,7 @@ def normalize_items(items: List[Dict[str, int]]) -> List[Tuple[int, int]]:
 
 def fetch_products_for_update(conn, product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, price_cents, stock_quantity, is_active
-            FROM products
-            WHERE id = ANY(%s)
-            FOR UPDATE
-            """,
-            (list(product_ids),),
-        )
+        cur.execute(SELECT_PRODUCTS_FOR_UPDATE, {"product_ids": list(product_ids)})
         rows = cur.fetchall() or []
     return {r["id"]: r for r in rows}
 
@@ -42,6 +51,19 @@ def ensure_products_active(by_id: Dict[int, Dict[str, Any]], product_ids: Iterab
             raise ValueError(f"PRODUCT_INACTIVE:{pid}")
 
 
+def lock_bucketed_stock(conn, by_id: Dict[int, Dict[str, Any]]) -> None:
+    # fetch_products_for_update leaves bucketed products unlocked; callers that
+    # decide on stock up front lock them here (after the plain rows, in id
+    # order) and replace the snapshot with the exact total.
+    for pid in sorted(pid for pid, r in by_id.items() if r["stock_buckets"] > 0):
+        locked = lock_product_stock(conn, pid)
+        if locked is None:
+            del by_id[pid]
+            continue
+        central, bucket_rows = locked
+        by_id[pid]["stock_quantity"] = central + sum(r["quantity"] for r in bucket_rows)
+
+
 def ensure_stock_available(
     by_id: Dict[int, Dict[str, Any]],
     deltas: Iterable[Tuple[int, int]],
@@ -55,34 +77,148 @@ def ensure_stock_available(
             raise out_of_stock_error(pid, available, delta)
 
 
-def apply_stock_delta(conn, deltas: Iterable[Tuple[int, int]]) -> None:
+def price_lines(
+    by_id: Dict[int, Dict[str, Any]], normalized: Iterable[Tuple[int, int]]
+) -> List[Tuple[int, int, int, int]]:
+    lines = []
+    for pid, qty in normalized:
+        unit = by_id[pid]["price_cents"]
+        lines.append((pid, qty, unit, unit * qty))
+    return lines
+
+
+def order_item_params(order_id: int, lines: List[Tuple[int, int, int, int]]) -> Tuple[Any, ...]:
+    product_ids, quantities, unit_prices, line_totals = (list(col) for col in zip(*lines))
+    return (order_id, product_ids, quantities, unit_prices, line_totals)
+
+
+def insert_order_items(
+    conn, order_id: int, lines: List[Tuple[int, int, int, int]]
+) -> List[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(INSERT_ORDER_ITEMS, order_item_params(order_id, lines))
+        return cur.fetchall() or []
+
+
+def insert_batch_order_items(
+    conn, lines_by_order: Dict[int, List[Tuple[int, int, int, int]]]
+) -> Dict[int, List[Dict[str, Any]]]:
+    rows = [
+        (order_id, *line) for order_id, lines in lines_by_order.items() for line in lines
+    ]
+    items_by_order: Dict[int, List[Dict[str, Any]]] = {oid: [] for oid in lines_by_order}
+    if not rows:
+        return items_by_order
+    with conn.cursor() as cur:
+        cur.execute(INSERT_BATCH_ORDER_ITEMS, tuple(list(col) for col in zip(*rows)))
+        for item in cur.fetchall() or []:
+            items_by_order[item.pop("order_id")].append(item)
+    return items_by_order
+
+
+def order_items_diff_params(
+    order_id: int, lines: List[Tuple[int, int, int, int]]
+) -> Dict[str, Any]:
+    _, product_ids, quantities, unit_prices, _ = order_item_params(order_id, lines)
+    return {
+        "order_id": order_id,
+        "product_ids": product_ids,
+        "quantities": quantities,
+        "unit_prices": unit_prices,
+    }
+
+
+def apply_order_items_diff(
+    conn, order_id: int, lines: List[Tuple[int, int, int, int]]
+) -> Dict[str, Any]:
     with conn.cursor() as cur:
-        for pid, delta in deltas:
-            if delta == 0:
-                continue
-            cur.execute(
-                """
-                UPDATE products
-                SET stock_quantity = stock_quantity - %s, updated_at = now()
-                WHERE id = %s
-                """,
-                (delta, pid),
+        cur.execute(APPLY_ORDER_ITEMS_DIFF, order_items_diff_params(order_id, lines))
+        return cur.fetchone()
+
+
+def stock_delta_params(deltas: Iterable[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    nonzero = [(pid, delta) for pid, delta in deltas if delta != 0]
+    return [pid for pid, _ in nonzero], [delta for _, delta in nonzero]
+
+
+def check_stock_levels(rows: Iterable[Dict[str, Any]], out_of_stock_error) -> Dict[int, int]:
+    levels: Dict[int, int] = {}
+    for r in rows:
+        if r["bucketed"]:
+            continue
+        if not r["applied"]:
+            raise out_of_stock_error(r["product_id"], r["stock_quantity"], r["delta"])
+        levels[r["product_id"]] = r["stock_quantity"]
+    return levels
+
+
+def apply_stock_delta(
+    conn, deltas: Iterable[Tuple[int, int]], out_of_stock_error
+) -> Dict[int, int]:
+    product_ids, amounts = stock_delta_params(deltas)
+    if not product_ids:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(APPLY_STOCK_DELTAS, (product_ids, amounts))
+        rows = cur.fetchall() or []
+    levels = check_stock_levels(rows, out_of_stock_error)
+    notify_product_changes(conn, product_ids)
+    for r in rows:
+        if r["bucketed"]:
+            levels[r["product_id"]] = adjust_bucketed_stock(
+                conn, r["product_id"], r["delta"], out_of_stock_error, r["stock_quantity"]
             )
+    return levels
 
 
 def fetch_order_items(conn, order_id: int) -> List[Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT product_id, quantity, unit_price_cents, line_total_cents
-            FROM order_items
-            WHERE order_id = %s
-            ORDER BY product_id
-            """,
-            (order_id,),
-        )
+        cur.execute(SELECT_ORDER_ITEMS, (order_id,))
         return cur.fetchall() or []
 
 
-def compute_total(items: Iterable[Dict[str, Any]]) -> int:
-    return sum(i["line_total_cents"] for i in items)
+def fetch_orders_items(conn, order_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    items_by_order: Dict[int, List[Dict[str, Any]]] = {oid: [] for oid in order_ids}
+    with conn.cursor() as cur:
+        cur.execute(SELECT_ORDERS_ITEMS, (order_ids,))
+        for item in cur.fetchall() or []:
+            items_by_order[item.pop("order_id")].append(item)
+    return items_by_order
+
+
+# Items for a whole list of orders come from one ANY query and are stitched
+# back onto each order through the dict index.
+def embed_order_items(conn, orders: List[Dict[str, Any]]) -> None:
+    if not orders:
+        return
+    items_by_order = fetch_orders_items(conn, [o["id"] for o in orders])
+    for order in orders:
+        order["items"] = items_by_order[order["id"]]
+
+
+def record_daily_sales(conn, order_ids: List[int], sign: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute(APPLY_ORDERS_TO_DAILY_SALES, {"order_ids": order_ids, "sign": sign})
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"].isoformat(), row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, order_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError):
+        raise ValueError("INVALID_CURSOR")
+
+
+def orders_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    # Callers fetch limit + 1 rows; the extra row only signals another page.
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
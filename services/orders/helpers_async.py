@@ -0,0 +1,90 @@
+from typing import Any, Dict, Iterable, List, Tuple
+
+from shared.inventory import adjust_bucketed_stock_async
+from shared.product_events import notify_product_changes_async
+
+from .helpers import (
+    check_stock_levels,
+    order_item_params,
+    order_items_diff_params,
+    stock_delta_params,
+)
+from .queries import (
+    APPLY_ORDER_ITEMS_DIFF,
+    APPLY_ORDERS_TO_DAILY_SALES,
+    APPLY_STOCK_DELTAS,
+    INSERT_ORDER_ITEMS,
+    SELECT_ORDER_ITEMS,
+    SELECT_ORDERS_ITEMS,
+    SELECT_PRODUCTS_FOR_UPDATE,
+)
+
+
+async def fetch_products_for_update(conn, product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_PRODUCTS_FOR_UPDATE, {"product_ids": list(product_ids)})
+        rows = await cur.fetchall() or []
+    return {r["id"]: r for r in rows}
+
+
+async def insert_order_items(
+    conn, order_id: int, lines: List[Tuple[int, int, int, int]]
+) -> List[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(INSERT_ORDER_ITEMS, order_item_params(order_id, lines))
+        return await cur.fetchall() or []
+
+
+async def apply_order_items_diff(
+    conn, order_id: int, lines: List[Tuple[int, int, int, int]]
+) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(APPLY_ORDER_ITEMS_DIFF, order_items_diff_params(order_id, lines))
+        return await cur.fetchone()
+
+
+async def apply_stock_delta(
+    conn, deltas: Iterable[Tuple[int, int]], out_of_stock_error
+) -> Dict[int, int]:
+    product_ids, amounts = stock_delta_params(deltas)
+    if not product_ids:
+        return {}
+    async with conn.cursor() as cur:
+        await cur.execute(APPLY_STOCK_DELTAS, (product_ids, amounts))
+        rows = await cur.fetchall() or []
+    levels = check_stock_levels(rows, out_of_stock_error)
+    await notify_product_changes_async(conn, product_ids)
+    for r in rows:
+        if r["bucketed"]:
+            levels[r["product_id"]] = await adjust_bucketed_stock_async(
+                conn, r["product_id"], r["delta"], out_of_stock_error, r["stock_quantity"]
+            )
+    return levels
+
+
+async def fetch_order_items(conn, order_id: int) -> List[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_ORDER_ITEMS, (order_id,))
+        return await cur.fetchall() or []
+
+
+async def fetch_orders_items(conn, order_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    items_by_order: Dict[int, List[Dict[str, Any]]] = {oid: [] for oid in order_ids}
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_ORDERS_ITEMS, (order_ids,))
+        for item in await cur.fetchall() or []:
+            items_by_order[item.pop("order_id")].append(item)
+    return items_by_order
+
+
+async def embed_order_items(conn, orders: List[Dict[str, Any]]) -> None:
+    if not orders:
+        return
+    items_by_order = await fetch_orders_items(conn, [o["id"] for o in orders])
+    for order in orders:
+        order["items"] = items_by_order[order["id"]]
+
+
+async def record_daily_sales(conn, order_ids: List[int], sign: int) -> None:
+    async with conn.cursor() as cur:
+        await cur.execute(APPLY_ORDERS_TO_DAILY_SALES, {"order_ids": order_ids, "sign": sign})
@@ -0,0 +1,172 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Optional
+
+import psycopg2.errors
+
+from shared import metrics
+from shared.config import (
+    REPORT_JOB_MAX_QUEUED,
+    REPORT_JOB_MAX_STORED,
+    REPORT_JOB_STATEMENT_TIMEOUT_SECONDS,
+    REPORT_JOB_TTL_SECONDS,
+    REPORT_JOB_WORKERS,
+)
+from shared.db import lifespan as db_lifespan
+from shared.db import pooled_conn
+
+from .analytics import analytics, top_products_report
+from .queries import SET_LOCAL_STATEMENT_TIMEOUT
+from .service import top_selling_products
+
+logger = logging.getLogger(__name__)
+
+
+class ReportQueueFull(Exception):
+    pass
+
+
+def run_top_products(params: Dict[str, Any], timeout_ms: int) -> Any:
+    if analytics.enabled:
+        return top_products_report(params["start"], params["end"], params["limit"])
+    with pooled_conn() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(SET_LOCAL_STATEMENT_TIMEOUT, (timeout_ms,))
+            return top_selling_products(conn, params["start"], params["end"], params["limit"])
+        finally:
+            conn.rollback()
+
+
+# Report name -> fn(params, statement timeout in ms) -> JSON-able result.
+REPORTS: Dict[str, Callable[[Dict[str, Any], int], Any]] = {
+    "top-products": run_top_products,
+}
+
+
+# Reports run off the request path on a fixed pool of threads. A request for
+# a report that is already queued or running gets that job back instead of a
+# new one. Finished jobs are kept for ttl_seconds (and at most max_stored of
+# them) for clients to poll. Jobs live in this process only.
+class ReportJobs:
+    def __init__(
+        self,
+        workers: int,
+        max_queued: int,
+        max_stored: int,
+        ttl_seconds: float,
+        statement_timeout_seconds: float,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_stored = max_stored
+        self.ttl_seconds = ttl_seconds
+        self.statement_timeout_ms = int(statement_timeout_seconds * 1000)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[Hashable, str] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        metrics.register_gauges(self.stats)
+
+    def _expire(self, now: datetime) -> None:
+        finished = [j for j in self._jobs.values() if j["finished_at"] is not None]
+        overflow = len(self._jobs) - self.max_stored
+        for i, job in enumerate(sorted(finished, key=lambda j: j["finished_at"])):
+            if i < overflow or job["expires_at"] <= now:
+                del self._jobs[job["id"]]
+
+    def submit(self, report: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        key = (report, *sorted(params.items()))
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self._expire(now)
+            job_id = self._pending.get(key)
+            if job_id is not None:
+                metrics.incr("report_jobs_deduplicated")
+                return dict(self._jobs[job_id])
+            if len(self._pending) >= self.max_queued:
+                raise ReportQueueFull()
+            job = {
+                "id": uuid.uuid4().hex,
+                "report": report,
+                "status": "queued",
+                "created_at": now,
+                "started_at": None,
+                "finished_at": None,
+                "expires_at": None,
+                "error": None,
+                "result": None,
+            }
+            self._jobs[job["id"]] = job
+            self._pending[key] = job["id"]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="report-job")
+            self._executor.submit(self._run, job, key, params)
+        metrics.incr("report_jobs_submitted")
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._expire(datetime.now(timezone.utc))
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, job: Dict[str, Any], key: Hashable, params: Dict[str, Any]) -> None:
+        with self._lock:
+            job["status"] = "running"
+            job["started_at"] = datetime.now(timezone.utc)
+        status, result, error = "succeeded", None, None
+        try:
+            result = REPORTS[job["report"]](params, self.statement_timeout_ms)
+        except psycopg2.errors.QueryCanceled:
+            status, error = "failed", "STATEMENT_TIMEOUT"
+        except Exception:
+            logger.exception("Report job %s failed", job["id"])
+            status, error = "failed", "REPORT_FAILED"
+        metrics.incr(f"report_jobs_{status}")
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            job.update(
+                status=status,
+                result=result,
+                error=error,
+                finished_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            )
+            self._pending.pop(key, None)
+
+    def stop(self) -> None:
+        # Queued jobs are dropped; running ones finish on their own.
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "report_jobs_pending": len(self._pending),
+                "report_jobs_stored": len(self._jobs),
+            }
+
+
+report_jobs = ReportJobs(
+    REPORT_JOB_WORKERS,
+    REPORT_JOB_MAX_QUEUED,
+    REPORT_JOB_MAX_STORED,
+    REPORT_JOB_TTL_SECONDS,
+    REPORT_JOB_STATEMENT_TIMEOUT_SECONDS,
+)
+
+
+@asynccontextmanager
+async def lifespan(app) -> AsyncIterator[None]:
+    async with db_lifespan(app):
+        try:
+            yield
+        finally:
+            report_jobs.stop()
@@ -0,0 +1,47 @@
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Tuple
+
+from shared.config import LIVE_TOPK_BUCKET_SECONDS, LIVE_TOPK_CAPACITY, LIVE_TOPK_WINDOW_MINUTES
+from shared.topk import SlidingTopK
+
+# Approximate units sold per product over the last LIVE_TOPK_WINDOW_MINUTES,
+# fed by this process's order mutations after they commit. Orders count in
+# the bucket of their created_at, so edits and cancellations of recent orders
+# correct the bucket that originally counted them.
+LIVE_TOPK_BUCKETS = (
+    LIVE_TOPK_WINDOW_MINUTES * 60 // LIVE_TOPK_BUCKET_SECONDS if LIVE_TOPK_BUCKET_SECONDS > 0 else 0
+)
+live_sales = SlidingTopK(LIVE_TOPK_CAPACITY, LIVE_TOPK_BUCKET_SECONDS, LIVE_TOPK_BUCKETS)
+
+
+def in_live_window(created_at: datetime) -> bool:
+    return live_sales.enabled and created_at.timestamp() >= live_sales.window_start(
+        live_sales.buckets
+    )
+
+
+def record_live_sales(
+    created_at: datetime, quantities: Iterable[Tuple[int, int]], sign: int = 1
+) -> None:
+    if in_live_window(created_at):
+        live_sales.add(created_at.timestamp(), [(pid, sign * qty) for pid, qty in quantities])
+
+
+def live_top_products(window_minutes: int, limit: int) -> Dict[str, Any]:
+    now = time.time()
+    buckets = math.ceil(window_minutes * 60 / max(live_sales.bucket_seconds, 1))
+    buckets = max(1, min(buckets, live_sales.buckets))
+    top, floor = live_sales.top(buckets, limit, now)
+    return {
+        "window_start": datetime.fromtimestamp(
+            live_sales.window_start(buckets, now), timezone.utc
+        ),
+        "as_of": datetime.fromtimestamp(now, timezone.utc),
+        "max_unlisted_quantity": floor,
+        "items": [
+            {"product_id": pid, "quantity": upper, "error": upper - lower}
+            for pid, upper, lower in top
+        ],
+    }
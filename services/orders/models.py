@@ -1,7 +1,7 @@
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class OrderItemIn(BaseModel):
@@ -22,6 +22,12 @@ class OrderStatusUpdate(BaseModel):
     status: str
 
 
+class OrderStatusBatchUpdate(BaseModel):
+    order_ids: List[int]
+    status: str
+    include_items: bool = False
+
+
 class OrderItemOut(BaseModel):
     product_id: int
     quantity: int
@@ -39,18 +45,147 @@ class OrderOut(BaseModel):
     updated_at: datetime
 
 
+class OrderBatchError(BaseModel):
+    code: str
+    product_id: Optional[int] = None
+    available: Optional[int] = None
+    requested: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class OrderBatchResult(BaseModel):
+    index: int
+    order: Optional[OrderOut] = None
+    error: Optional[OrderBatchError] = None
+
+
+class OrderBatchOut(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBatchResult]
+
+
+class OrderStatusBatchResult(BaseModel):
+    id: int
+    status: Optional[str] = None
+    previous_status: Optional[str] = None
+    error: Optional[str] = None
+    items: Optional[List[OrderItemOut]] = None
+
+
+class OrderStatusBatchOut(BaseModel):
+    updated: int
+    failed: int
+    results: List[OrderStatusBatchResult]
+
+
 class OrderSummaryOut(BaseModel):
     id: int
     customer_id: int
     status: str
     total_cents: int
+    items: Optional[List[OrderItemOut]] = None
     created_at: datetime
     updated_at: datetime
 
 
+class OrderSummaryPageOut(BaseModel):
+    items: List[OrderSummaryOut]
+    next_cursor: Optional[str] = None
+
+
+# Keyed by "orders" rather than "items" so GET /orders can tell it apart from
+# a listing page.
+class OrderMultiGetOut(BaseModel):
+    orders: List[OrderOut]
+    missing: List[int]
+
+
 class TopProductOut(BaseModel):
     product_id: int
     sku: str
     name: str
     total_quantity: int
     total_sales_cents: int
+
+
+# The true quantity sold lies in [quantity - error, quantity].
+class LiveTopProductOut(BaseModel):
+    product_id: int
+    quantity: int
+    error: int
+
+
+class LiveTopProductsOut(BaseModel):
+    window_start: datetime
+    as_of: datetime
+    # No product missing from items sold more than this in the window.
+    max_unlisted_quantity: int
+    items: List[LiveTopProductOut]
+
+
+# Reports computed from the analytics snapshot; as_of is when it was read.
+class DailySalesOut(BaseModel):
+    day: date
+    orders: int
+    units: int
+    sales_cents: int
+
+
+class DailySalesReportOut(BaseModel):
+    as_of: datetime
+    items: List[DailySalesOut]
+
+
+class CustomerSalesOut(BaseModel):
+    customer_id: int
+    orders: int
+    sales_cents: int
+
+
+class CustomerSalesReportOut(BaseModel):
+    as_of: datetime
+    items: List[CustomerSalesOut]
+
+
+class BasketSizeOut(BaseModel):
+    units: int
+    orders: int
+
+
+class BasketSizeReportOut(BaseModel):
+    as_of: datetime
+    items: List[BasketSizeOut]
+
+
+class StatusFunnelOut(BaseModel):
+    status: str
+    orders: int
+    # Orders at this status or past it; cancelled orders only count once.
+    reached: int
+    total_cents: int
+
+
+class StatusFunnelReportOut(BaseModel):
+    as_of: datetime
+    items: List[StatusFunnelOut]
+
+
+class ReportJobCreate(BaseModel):
+    report: Literal["top-products"]
+    start: datetime
+    end: datetime
+    limit: int = Field(10, ge=1, le=100)
+
+
+class ReportJobOut(BaseModel):
+    id: str
+    report: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # The job and its result are dropped after this.
+    expires_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result: Optional[List[TopProductOut]] = None
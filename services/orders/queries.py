@@ -0,0 +1,568 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+ORDER_COLUMNS = "id, customer_id, status, total_cents, created_at, updated_at"
+ORDER_ITEM_COLUMNS = "product_id, quantity, unit_price_cents, line_total_cents"
+
+# Bucketed products are read without a row lock; their stock is adjusted per
+# bucket (see shared.inventory) and reported here as the bucketed total.
+SELECT_PRODUCTS_FOR_UPDATE = """
+    WITH locked AS MATERIALIZED (
+        SELECT id, price_cents, stock_quantity, is_active, stock_buckets
+        FROM products
+        WHERE id = ANY(%(product_ids)s) AND stock_buckets = 0
+        ORDER BY id
+        FOR UPDATE
+    )
+    SELECT id, price_cents, stock_quantity, is_active, stock_buckets
+    FROM locked
+    UNION ALL
+    SELECT
+        p.id,
+        p.price_cents,
+        p.stock_quantity + COALESCE(
+            (SELECT SUM(b.quantity) FROM product_stock_buckets b WHERE b.product_id = p.id), 0
+        ) AS stock_quantity,
+        p.is_active,
+        p.stock_buckets
+    FROM products p
+    WHERE p.id = ANY(%(product_ids)s) AND p.stock_buckets > 0
+"""
+
+# Product rows are always locked in id order so concurrent order mutations
+# touching overlapping products cannot deadlock on each other. Bucketed
+# products are left untouched and flagged for a per-bucket adjustment.
+APPLY_STOCK_DELTAS = """
+    WITH d AS (
+        SELECT product_id, delta
+        FROM unnest(%s::bigint[], %s::int[]) AS d(product_id, delta)
+    ),
+    locked AS MATERIALIZED (
+        SELECT p.id
+        FROM products p
+        JOIN d ON d.product_id = p.id
+        WHERE p.stock_buckets = 0
+        ORDER BY p.id
+        FOR UPDATE OF p
+    ),
+    updated AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity - d.delta, updated_at = now()
+        FROM d
+        JOIN locked l ON l.id = d.product_id
+        WHERE p.id = d.product_id
+          AND p.stock_quantity >= d.delta
+        RETURNING p.id, p.stock_quantity
+    )
+    SELECT
+        d.product_id,
+        d.delta,
+        CASE
+            WHEN p.stock_buckets > 0 THEN p.stock_quantity + COALESCE(
+                (SELECT SUM(b.quantity) FROM product_stock_buckets b WHERE b.product_id = p.id), 0
+            )
+            ELSE COALESCE(u.stock_quantity, p.stock_quantity)
+        END AS stock_quantity,
+        u.id IS NOT NULL AS applied,
+        p.stock_buckets > 0 AS bucketed
+    FROM d
+    JOIN products p ON p.id = d.product_id
+    LEFT JOIN updated u ON u.id = d.product_id
+    ORDER BY d.product_id
+"""
+
+SELECT_ORDER_ITEMS = f"""
+    SELECT {ORDER_ITEM_COLUMNS}
+    FROM order_items
+    WHERE order_id = %s
+    ORDER BY product_id
+"""
+
+SELECT_CUSTOMER_EXISTS = "SELECT id FROM customers WHERE id = %s"
+
+INSERT_ORDER = f"""
+    INSERT INTO orders (customer_id, status, total_cents)
+    VALUES (%s, 'PENDING', %s)
+    RETURNING {ORDER_COLUMNS}
+"""
+
+INSERT_ORDER_ITEMS = f"""
+    INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
+    SELECT %s, i.product_id, i.quantity, i.unit_price_cents, i.line_total_cents
+    FROM unnest(%s::bigint[], %s::int[], %s::int[], %s::int[])
+        AS i(product_id, quantity, unit_price_cents, line_total_cents)
+    RETURNING {ORDER_ITEM_COLUMNS}
+"""
+
+SELECT_EXISTING_CUSTOMERS = "SELECT id FROM customers WHERE id = ANY(%s)"
+
+ALLOCATE_ORDER_IDS = """
+    SELECT nextval(pg_get_serial_sequence('orders', 'id')) AS id
+    FROM generate_series(1, %s)
+"""
+
+INSERT_ORDERS = f"""
+    INSERT INTO orders (id, customer_id, status, total_cents)
+    SELECT o.id, o.customer_id, 'PENDING', o.total_cents
+    FROM unnest(%s::bigint[], %s::bigint[], %s::int[]) AS o(id, customer_id, total_cents)
+    RETURNING {ORDER_COLUMNS}
+"""
+
+INSERT_BATCH_ORDER_ITEMS = f"""
+    INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
+    SELECT i.order_id, i.product_id, i.quantity, i.unit_price_cents, i.line_total_cents
+    FROM unnest(%s::bigint[], %s::bigint[], %s::int[], %s::int[], %s::int[])
+        AS i(order_id, product_id, quantity, unit_price_cents, line_total_cents)
+    RETURNING order_id, {ORDER_ITEM_COLUMNS}
+"""
+
+ORDER_ITEMS_JSON = f"""
+    COALESCE(
+        (
+            SELECT json_agg(i ORDER BY i.product_id)
+            FROM (
+                SELECT {ORDER_ITEM_COLUMNS}
+                FROM order_items
+                WHERE order_id = orders.id
+            ) i
+        ),
+        '[]'::json
+    )
+"""
+
+SELECT_ORDER_WITH_ITEMS = f"""
+    SELECT {ORDER_COLUMNS}, {ORDER_ITEMS_JSON} AS items
+    FROM orders
+    WHERE id = %s
+"""
+
+SELECT_ORDERS_BY_IDS = f"""
+    SELECT {ORDER_COLUMNS}
+    FROM orders
+    WHERE id = ANY(%s)
+"""
+
+SELECT_ORDER_STATUS_FOR_UPDATE = """
+    SELECT id, status, created_at
+    FROM orders
+    WHERE id = %s
+    FOR UPDATE
+"""
+
+SELECT_ORDER_ITEMS_FOR_UPDATE = """
+    SELECT o.status, oi.product_id, oi.quantity
+    FROM orders o
+    LEFT JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.id = %s
+    FOR UPDATE OF o
+"""
+
+# Replaces the order's lines with the given set in one statement: lines that
+# are no longer present are deleted, new lines are inserted at the given unit
+# price, and kept lines retain their original unit price.
+APPLY_ORDER_ITEMS_DIFF = f"""
+    WITH new_items AS (
+        SELECT product_id, quantity, unit_price_cents
+        FROM unnest(%(product_ids)s::bigint[], %(quantities)s::int[], %(unit_prices)s::int[])
+            AS n(product_id, quantity, unit_price_cents)
+    ),
+    removed AS (
+        DELETE FROM order_items oi
+        WHERE oi.order_id = %(order_id)s
+          AND NOT EXISTS (SELECT 1 FROM new_items n WHERE n.product_id = oi.product_id)
+    ),
+    upserted AS (
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
+        SELECT %(order_id)s, product_id, quantity, unit_price_cents, quantity * unit_price_cents
+        FROM new_items
+        ON CONFLICT (order_id, product_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity,
+            line_total_cents = order_items.unit_price_cents * EXCLUDED.quantity
+        RETURNING {ORDER_ITEM_COLUMNS}
+    ),
+    updated_order AS (
+        UPDATE orders
+        SET total_cents = (SELECT COALESCE(SUM(line_total_cents), 0) FROM upserted),
+            updated_at = now()
+        WHERE id = %(order_id)s
+        RETURNING {ORDER_COLUMNS}
+    )
+    SELECT
+        o.*,
+        (SELECT json_agg(u ORDER BY u.product_id) FROM upserted u) AS items
+    FROM updated_order o
+"""
+
+SELECT_ORDER_FOR_UPDATE = f"""
+    SELECT {ORDER_COLUMNS}
+    FROM orders
+    WHERE id = %s
+    FOR UPDATE
+"""
+
+SELECT_ORDER_ITEM_QUANTITIES = """
+    SELECT product_id, quantity
+    FROM order_items
+    WHERE order_id = %s
+"""
+
+# Locks the requested orders in id order and moves those whose current status
+# is one of from_statuses; every found order is returned with its previous
+# status and whether it was updated.
+UPDATE_ORDER_STATUSES = """
+    WITH req AS (
+        SELECT DISTINCT id
+        FROM unnest(%(order_ids)s::bigint[]) AS r(id)
+    ),
+    locked AS MATERIALIZED (
+        SELECT o.id, o.status, o.created_at
+        FROM orders o
+        JOIN req ON req.id = o.id
+        ORDER BY o.id
+        FOR UPDATE OF o
+    ),
+    updated AS (
+        UPDATE orders o
+        SET status = %(status)s, updated_at = now()
+        FROM locked l
+        WHERE o.id = l.id AND l.status::text = ANY(%(from_statuses)s)
+        RETURNING o.id, o.status
+    )
+    SELECT
+        l.id,
+        l.status AS previous_status,
+        COALESCE(u.status, l.status) AS status,
+        u.id IS NOT NULL AS updated,
+        l.created_at
+    FROM locked l
+    LEFT JOIN updated u ON u.id = l.id
+    ORDER BY l.id
+"""
+
+SELECT_ORDERS_ITEM_TOTALS = """
+    SELECT product_id, SUM(quantity)::int AS quantity
+    FROM order_items
+    WHERE order_id = ANY(%s)
+    GROUP BY product_id
+    ORDER BY product_id
+"""
+
+SELECT_ORDERS_ITEMS = f"""
+    SELECT order_id, {ORDER_ITEM_COLUMNS}
+    FROM order_items
+    WHERE order_id = ANY(%s)
+    ORDER BY order_id, product_id
+"""
+
+UPDATE_ORDER_STATUS = f"""
+    UPDATE orders
+    SET status = %s, updated_at = now()
+    WHERE id = %s
+    RETURNING {ORDER_COLUMNS}
+"""
+
+DELETE_ORDER = """
+    DELETE FROM orders
+    WHERE id = %s
+"""
+
+
+# Listings page newest first on (created_at, id). Later pages seek past the
+# last row of the previous one with a row comparison, which the
+# (..., created_at DESC, id DESC) indexes serve without an OFFSET scan.
+def _build_orders_page(
+    conditions: List[str], params: List[Any], limit: int, after: Optional[Tuple[Any, int]]
+) -> Tuple[str, Tuple[Any, ...]]:
+    if after is not None:
+        conditions = [*conditions, "(created_at, id) < (%s, %s)"]
+        params = [*params, *after]
+    sql = f"""
+        SELECT {ORDER_COLUMNS}
+        FROM orders
+        WHERE {" AND ".join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """
+    return sql, (*params, limit)
+
+
+def build_list_orders_by_customer(
+    customer_id: int, limit: int, after: Optional[Tuple[Any, int]] = None
+) -> Tuple[str, Tuple[Any, ...]]:
+    return _build_orders_page(["customer_id = %s"], [customer_id], limit, after)
+
+
+def build_list_orders_by_date_range(
+    start_dt, end_dt, limit: int, after: Optional[Tuple[Any, int]] = None
+) -> Tuple[str, Tuple[Any, ...]]:
+    return _build_orders_page(
+        ["created_at >= %s", "created_at <= %s"], [start_dt, end_dt], limit, after
+    )
+
+
+# Oldest first, so an export that is cut short can be resumed from its last row.
+EXPORT_ORDERS = f"""
+    SELECT {ORDER_COLUMNS}
+    FROM orders
+    WHERE created_at >= %s AND created_at <= %s
+    ORDER BY created_at, id
+"""
+
+EXPORT_ORDERS_WITH_ITEMS = f"""
+    SELECT {ORDER_COLUMNS}, {ORDER_ITEMS_JSON} AS items
+    FROM orders
+    WHERE created_at >= %s AND created_at <= %s
+    ORDER BY created_at, id
+"""
+
+# Aggregates by product id first so only the top rows are joined to products.
+DAILY_SALES_SHARDS = 16
+DAILY_SALES_DAY = "(o.created_at AT TIME ZONE 'UTC')::date"
+
+# Adds (sign 1) or removes (sign -1) the current items of the given orders
+# to or from the rollup. Non-bucketed products are already row-locked by the
+# order mutation, so they share shard 0; bucketed products spread over
+# DAILY_SALES_SHARDS rows by order id, the same way their stock is spread
+# over buckets. Rows are upserted in key order so concurrent statements lock
+# them in the same order.
+APPLY_ORDERS_TO_DAILY_SALES = f"""
+    INSERT INTO product_daily_sales AS s (day, product_id, shard, quantity, sales_cents)
+    SELECT
+        {DAILY_SALES_DAY},
+        oi.product_id,
+        CASE WHEN p.stock_buckets > 0 THEN o.id %% {DAILY_SALES_SHARDS} ELSE 0 END,
+        %(sign)s * SUM(oi.quantity),
+        %(sign)s * SUM(oi.line_total_cents)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    JOIN products p ON p.id = oi.product_id
+    WHERE o.id = ANY(%(order_ids)s)
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, product_id, shard) DO UPDATE
+    SET quantity = s.quantity + EXCLUDED.quantity,
+        sales_cents = s.sales_cents + EXCLUDED.sales_cents
+"""
+
+# Blocks order mutations from writing the rollup while a range is rebuilt;
+# mutations that already wrote it are waited for and then included.
+LOCK_DAILY_SALES = "LOCK TABLE product_daily_sales IN SHARE ROW EXCLUSIVE MODE"
+
+DELETE_DAILY_SALES_RANGE = """
+    DELETE FROM product_daily_sales
+    WHERE day >= %(first_day)s AND day < %(last_day)s
+"""
+
+REBUILD_DAILY_SALES_RANGE = f"""
+    INSERT INTO product_daily_sales (day, product_id, shard, quantity, sales_cents)
+    SELECT
+        {DAILY_SALES_DAY},
+        oi.product_id,
+        0,
+        SUM(oi.quantity),
+        SUM(oi.line_total_cents)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.created_at >= %(first_day)s::timestamp AT TIME ZONE 'UTC'
+      AND o.created_at < %(last_day)s::timestamp AT TIME ZONE 'UTC'
+      AND o.status <> 'CANCELLED'
+    GROUP BY 1, 2, 3
+"""
+
+SELECT_ORDER_DAY_RANGE = """
+    SELECT
+        (min(created_at) AT TIME ZONE 'UTC')::date AS first_day,
+        (max(created_at) AT TIME ZONE 'UTC')::date AS last_day
+    FROM orders
+"""
+
+# Whole UTC days come from product_daily_sales; only the partial days at
+# either end of the window are aggregated from order_items.
+TOP_SELLING_PRODUCTS = """
+    WITH sales AS (
+        SELECT product_id, quantity, sales_cents
+        FROM product_daily_sales
+        WHERE day >= %(first_day)s AND day < %(last_day)s
+        UNION ALL
+        SELECT oi.product_id, oi.quantity, oi.line_total_cents
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.created_at >= %(start)s
+          AND o.created_at < %(head_end)s
+          AND o.status != 'CANCELLED'
+        UNION ALL
+        SELECT oi.product_id, oi.quantity, oi.line_total_cents
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.created_at >= %(tail_start)s
+          AND o.created_at <= %(end)s
+          AND o.status != 'CANCELLED'
+    ),
+    top AS (
+        SELECT
+            product_id,
+            SUM(quantity)::bigint AS total_quantity,
+            SUM(sales_cents)::bigint AS total_sales_cents
+        FROM sales
+        GROUP BY product_id
+        HAVING SUM(quantity) > 0
+        ORDER BY total_quantity DESC
+        LIMIT %(limit)s
+    )
+    SELECT top.product_id, p.sku, p.name, top.total_quantity, top.total_sales_cents
+    FROM top
+    JOIN products p ON p.id = top.product_id
+    ORDER BY top.total_quantity DESC
+"""
+
+
+def build_top_selling_products(
+    start_dt: datetime, end_dt: datetime, limit: int
+) -> Tuple[str, Dict[str, Any]]:
+    # Naive datetimes are taken as UTC, the timezone the rollup days use.
+    start = start_dt if start_dt.tzinfo else start_dt.replace(tzinfo=timezone.utc)
+    end = end_dt if end_dt.tzinfo else end_dt.replace(tzinfo=timezone.utc)
+    midnight = {"hour": 0, "minute": 0, "second": 0, "microsecond": 0}
+    first = start.astimezone(timezone.utc).replace(**midnight)
+    if first < start:
+        first += timedelta(days=1)
+    last = end.astimezone(timezone.utc).replace(**midnight)
+    if first >= last:
+        # No whole day in the window: read it all from order_items.
+        first = last = start
+    return TOP_SELLING_PRODUCTS, {
+        "first_day": first.date(),
+        "last_day": last.date(),
+        "start": start,
+        "head_end": first,
+        "tail_start": last,
+        "end": end,
+        "limit": limit,
+    }
+
+
+# Columnar feeds for the analytics snapshot (services/orders/analytics.py).
+# Every column is an integer: statuses are their position in
+# ANALYTICS_STATUSES and timestamps microseconds since the epoch. A full load
+# passes '-infinity' as since; refreshes pass the last load time less a lag.
+ANALYTICS_STATUSES = ["PENDING", "CONFIRMED", "SHIPPED", "DELIVERED", "CANCELLED"]
+
+BEGIN_ANALYTICS_SNAPSHOT = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"
+
+# A CASE rather than array_position(enum_range(...)), which is four times
+# slower per row.
+ANALYTICS_STATUS_CODE = "CASE status {} END".format(
+    " ".join(f"WHEN '{status}' THEN {i}" for i, status in enumerate(ANALYTICS_STATUSES))
+)
+
+ANALYTICS_ORDERS = f"""
+    SELECT
+        id,
+        customer_id,
+        {ANALYTICS_STATUS_CODE},
+        total_cents,
+        (extract(epoch FROM created_at) * 1000000)::bigint
+    FROM orders
+    WHERE updated_at > %(since)s
+"""
+
+ANALYTICS_ORDER_ITEMS = """
+    SELECT oi.order_id, oi.product_id, oi.quantity, oi.line_total_cents
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.updated_at > %(since)s
+"""
+
+SELECT_PRODUCT_LABELS = "SELECT id, sku, name FROM products WHERE id = ANY(%s)"
+
+# Milliseconds; lasts until the end of the current transaction.
+SET_LOCAL_STATEMENT_TIMEOUT = "SET LOCAL statement_timeout = %s"
+
+# One UTC day of orders and their items for the columnar dump
+# (services/orders/dump.py), in the analytics column layout and id order.
+DUMP_DAY_WHERE = """
+    o.created_at >= %(day)s::timestamp AT TIME ZONE 'UTC'
+    AND o.created_at < (%(day)s::timestamp + interval '1 day') AT TIME ZONE 'UTC'
+"""
+
+DUMP_DAY_ORDERS = f"""
+    SELECT
+        o.id,
+        o.customer_id,
+        {ANALYTICS_STATUS_CODE},
+        o.total_cents,
+        (extract(epoch FROM o.created_at) * 1000000)::bigint
+    FROM orders o
+    WHERE {DUMP_DAY_WHERE}
+    ORDER BY o.id
+"""
+
+DUMP_DAY_ORDER_ITEMS = f"""
+    SELECT oi.order_id, oi.product_id, oi.quantity, oi.line_total_cents
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE {DUMP_DAY_WHERE}
+    ORDER BY oi.order_id, oi.product_id
+"""
+
+
+# Plans checked by `python -m shared.migrate --check` against seeded data.
+EXPLAIN_CHECKS = [
+    (
+        "select_products_for_update",
+        lambda s: (SELECT_PRODUCTS_FOR_UPDATE, {"product_ids": s["product_ids"]}),
+    ),
+    (
+        "apply_stock_deltas",
+        lambda s: (APPLY_STOCK_DELTAS, (s["product_ids"], [1] * len(s["product_ids"]))),
+    ),
+    ("select_existing_customers", lambda s: (SELECT_EXISTING_CUSTOMERS, ([s["customer_id"]],))),
+    ("select_order_with_items", lambda s: (SELECT_ORDER_WITH_ITEMS, (s["order_id"],))),
+    ("select_orders_by_ids", lambda s: (SELECT_ORDERS_BY_IDS, (s["order_ids"],))),
+    ("select_order_items_for_update", lambda s: (SELECT_ORDER_ITEMS_FOR_UPDATE, (s["order_id"],))),
+    (
+        "apply_order_items_diff",
+        lambda s: (
+            APPLY_ORDER_ITEMS_DIFF,
+            {
+                "order_id": s["order_id"],
+                "product_ids": s["product_ids"],
+                "quantities": [1] * len(s["product_ids"]),
+                "unit_prices": [100] * len(s["product_ids"]),
+            },
+        ),
+    ),
+    ("select_order_item_quantities", lambda s: (SELECT_ORDER_ITEM_QUANTITIES, (s["order_id"],))),
+    (
+        "update_order_statuses",
+        lambda s: (
+            UPDATE_ORDER_STATUSES,
+            {"order_ids": s["order_ids"], "status": "CONFIRMED", "from_statuses": ["PENDING"]},
+        ),
+    ),
+    ("select_orders_item_totals", lambda s: (SELECT_ORDERS_ITEM_TOTALS, (s["order_ids"],))),
+    ("select_orders_items", lambda s: (SELECT_ORDERS_ITEMS, (s["order_ids"],))),
+    ("delete_order", lambda s: (DELETE_ORDER, (s["order_id"],))),
+    (
+        "list_orders_by_customer",
+        lambda s: build_list_orders_by_customer(s["customer_id"], 101, s["after"]),
+    ),
+    (
+        "list_orders_by_date_range",
+        lambda s: build_list_orders_by_date_range(s["start"], s["end"], 101, s["after"]),
+    ),
+    ("export_orders_with_items", lambda s: (EXPORT_ORDERS_WITH_ITEMS, (s["start"], s["end"]))),
+    (
+        "top_selling_products",
+        lambda s: build_top_selling_products(s["start"] - timedelta(days=30), s["end"], 10),
+    ),
+    (
+        "apply_orders_to_daily_sales",
+        lambda s: (APPLY_ORDERS_TO_DAILY_SALES, {"order_ids": s["order_ids"], "sign": 1}),
+    ),
+    ("analytics_orders_refresh", lambda s: (ANALYTICS_ORDERS, {"since": s["end"]})),
+    ("analytics_order_items_refresh", lambda s: (ANALYTICS_ORDER_ITEMS, {"since": s["end"]})),
+    ("select_product_labels", lambda s: (SELECT_PRODUCT_LABELS, (s["product_ids"],))),
+    ("dump_day_orders", lambda s: (DUMP_DAY_ORDERS, {"day": s["start"].date()})),
+    ("dump_day_order_items", lambda s: (DUMP_DAY_ORDER_ITEMS, {"day": s["start"].date()})),
+]
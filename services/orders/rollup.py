@@ -0,0 +1,92 @@
+import argparse
+import sys
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from shared.db import get_conn
+
+from .queries import (
+    DELETE_DAILY_SALES_RANGE,
+    LOCK_DAILY_SALES,
+    REBUILD_DAILY_SALES_RANGE,
+    SELECT_ORDER_DAY_RANGE,
+)
+
+
+# Recomputes product_daily_sales for the UTC days [first_day, last_day) from
+# order_items. Order mutations wait on the table lock for the duration of one
+# call, so large ranges are rebuilt a chunk at a time by rebuild_range.
+def rebuild_daily_sales(conn, first_day: date, last_day: date) -> int:
+    params = {"first_day": first_day, "last_day": last_day}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LOCK_DAILY_SALES)
+            cur.execute(DELETE_DAILY_SALES_RANGE, params)
+            cur.execute(REBUILD_DAILY_SALES_RANGE, params)
+            rows = cur.rowcount
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def rebuild_range(
+    conn, first_day: date, last_day: date, chunk_days: int
+) -> Iterator[Tuple[date, date, int]]:
+    day = first_day
+    while day < last_day:
+        chunk_end = min(day + timedelta(days=chunk_days), last_day)
+        yield day, chunk_end, rebuild_daily_sales(conn, day, chunk_end)
+        day = chunk_end
+
+
+def order_day_range(conn) -> Tuple[Optional[date], Optional[date]]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_ORDER_DAY_RANGE)
+        row = cur.fetchone()
+    conn.commit()
+    return row["first_day"], row["last_day"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the product_daily_sales rollup from order items."
+    )
+    parser.add_argument(
+        "--start", type=date.fromisoformat, help="first UTC day (default: day of the first order)"
+    )
+    parser.add_argument(
+        "--end",
+        type=date.fromisoformat,
+        help="last UTC day, inclusive (default: day of the latest order)",
+    )
+    parser.add_argument(
+        "--chunk-days", type=int, default=7, help="days rebuilt per transaction (default 7)"
+    )
+    args = parser.parse_args(argv)
+    if args.chunk_days < 1:
+        parser.error("--chunk-days must be at least 1")
+
+    conn = get_conn()
+    try:
+        first_day, last_day = args.start, args.end
+        if first_day is None or last_day is None:
+            order_first, order_last = order_day_range(conn)
+            first_day = first_day or order_first
+            last_day = last_day or order_last
+        if first_day is None or last_day is None:
+            print("no orders")
+            return 0
+
+        for day, chunk_end, rows in rebuild_range(
+            conn, first_day, last_day + timedelta(days=1), args.chunk_days
+        ):
+            print(f"{day} .. {chunk_end - timedelta(days=1)}: {rows} rows")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,82 +1,146 @@
 from datetime import datetime
-from typing import List
+from typing import List, Literal, Optional, Union
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
-from shared.db import get_conn
+from shared.config import (
+    LIVE_TOPK_WINDOW_MINUTES,
+    ORDER_BATCH_MAX_SIZE,
+    ORDER_EXPORT_FETCH_SIZE,
+    ORDER_PAGE_DEFAULT_SIZE,
+    ORDER_PAGE_MAX_SIZE,
+)
+from shared.db import get_db, request_db, streaming_db_response
+from shared.multiget import requested_ids
 
+from .analytics import SalesSnapshot, analytics, top_products_report
+from .cache import (
+    align_report_window,
+    order_cache,
+    order_json,
+    report_cache,
+    report_ttl,
+    top_products_json,
+)
+from .export import csv_chunks, fetch_export_chunks, ndjson_chunks
+from .jobs import ReportQueueFull, report_jobs
+from .live import live_top_products
 from .models import (
+    BasketSizeReportOut,
+    CustomerSalesReportOut,
+    DailySalesReportOut,
+    LiveTopProductsOut,
+    OrderBatchOut,
     OrderCreate,
+    OrderMultiGetOut,
     OrderOut,
+    OrderStatusBatchOut,
+    OrderStatusBatchUpdate,
     OrderStatusUpdate,
-    OrderSummaryOut,
+    OrderSummaryPageOut,
     OrderUpdate,
+    ReportJobCreate,
+    ReportJobOut,
+    StatusFunnelReportOut,
     TopProductOut,
 )
 from .service import (
     OutOfStockError,
     create_order,
+    create_orders_batch,
     delete_order,
     get_order_by_id,
+    get_orders_by_ids,
     list_orders_by_customer,
     list_orders_by_date_range,
     top_selling_products,
     update_order_items,
     update_order_status,
+    update_orders_status_batch,
 )
 
 router = APIRouter()
 
 
 @router.post("/orders", response_model=OrderOut, status_code=201)
-def create_order_endpoint(payload: OrderCreate):
-    conn = get_conn()
-    try:
-        try:
-            order = create_order(conn, payload.customer_id, [i.model_dump() for i in payload.items])
-            return order
-        except OutOfStockError as e:
-            raise HTTPException(
-                status_code=409,
-                detail={
-                    "code": "OUT_OF_STOCK",
-                    "product_id": e.product_id,
-                    "available": e.available,
-                    "requested": e.requested,
-                },
-            )
-        except KeyError as e:
-            msg = str(e)
-            if msg == "'CUSTOMER_NOT_FOUND'":
-                raise HTTPException(status_code=404, detail="Customer not found")
-            if msg.startswith("'PRODUCT_NOT_FOUND:"):
-                pid = msg.split(":")[1].strip("'")
-                raise HTTPException(status_code=404, detail=f"Product not found: {pid}")
-            raise
-        except ValueError as e:
-            if str(e).startswith("PRODUCT_INACTIVE:"):
-                pid = str(e).split(":")[1]
-                raise HTTPException(status_code=409, detail=f"Product inactive: {pid}")
-            raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        conn.close()
-
-
-@router.get("/orders/{order_id}", response_model=OrderOut)
-def get_order_endpoint(order_id: int):
-    conn = get_conn()
+def create_order_endpoint(payload: OrderCreate, conn=Depends(get_db)):
     try:
-        order = get_order_by_id(conn, order_id)
-        if not order:
-            raise HTTPException(status_code=404, detail="Order not found")
+        order = create_order(conn, payload.customer_id, [i.model_dump() for i in payload.items])
         return order
-    finally:
-        conn.close()
+    except OutOfStockError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "code": "OUT_OF_STOCK",
+                "product_id": e.product_id,
+                "available": e.available,
+                "requested": e.requested,
+            },
+        )
+    except KeyError as e:
+        msg = str(e)
+        if msg == "'CUSTOMER_NOT_FOUND'":
+            raise HTTPException(status_code=404, detail="Customer not found")
+        if msg.startswith("'PRODUCT_NOT_FOUND:"):
+            pid = msg.split(":")[1].strip("'")
+            raise HTTPException(status_code=404, detail=f"Product not found: {pid}")
+        raise
+    except ValueError as e:
+        if str(e).startswith("PRODUCT_INACTIVE:"):
+            pid = str(e).split(":")[1]
+            raise HTTPException(status_code=409, detail=f"Product inactive: {pid}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/orders:batch", response_model=OrderBatchOut)
+def create_orders_batch_endpoint(payload: List[OrderCreate], conn=Depends(get_db)):
+    if len(payload) > ORDER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds {ORDER_BATCH_MAX_SIZE} orders"
+        )
+    results = create_orders_batch(
+        conn,
+        [
+            {"customer_id": o.customer_id, "items": [i.model_dump() for i in o.items]}
+            for o in payload
+        ],
+    )
+    created = sum(1 for r in results if "order" in r)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.get("/orders/export")
+def export_orders_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    include_items: bool = Query(False),
+):
+    def build(conn):
+        chunks = fetch_export_chunks(conn, start, end, include_items, ORDER_EXPORT_FETCH_SIZE)
+        if format == "csv":
+            return csv_chunks(chunks, include_items)
+        return ndjson_chunks(chunks, include_items)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return streaming_db_response(build, media_type)
+
+
+@router.get("/orders/{order_id:int}", response_model=OrderOut)
+def get_order_endpoint(order_id: int):
+    # A pooled connection is only checked out on a cache miss.
+    def load():
+        with request_db() as conn:
+            return order_json(get_order_by_id(conn, order_id))
+
+    body = order_cache.load(order_id, load)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return Response(content=body, media_type="application/json")
 
 
 @router.put("/orders/{order_id}", response_model=OrderOut)
-def update_order_endpoint(order_id: int, payload: OrderUpdate):
-    conn = get_conn()
+def update_order_endpoint(order_id: int, payload: OrderUpdate, conn=Depends(get_db)):
     try:
         order = update_order_items(conn, order_id, [i.model_dump() for i in payload.items])
         return order
@@ -105,13 +169,10 @@ def update_order_endpoint(order_id: int, payload: OrderUpdate):
             pid = str(e).split(":")[1]
             raise HTTPException(status_code=409, detail=f"Product inactive: {pid}")
         raise
-    finally:
-        conn.close()
 
 
 @router.patch("/orders/{order_id}/status", response_model=OrderOut)
-def update_order_status_endpoint(order_id: int, payload: OrderStatusUpdate):
-    conn = get_conn()
+def update_order_status_endpoint(order_id: int, payload: OrderStatusUpdate, conn=Depends(get_db)):
     try:
         order = update_order_status(conn, order_id, payload.status)
         return order
@@ -125,13 +186,30 @@ def update_order_status_endpoint(order_id: int, payload: OrderStatusUpdate):
         if str(e) == "INVALID_STATUS_TRANSITION":
             raise HTTPException(status_code=409, detail="Invalid status transition")
         raise
-    finally:
-        conn.close()
+
+
+@router.post(
+    "/orders/status:batch", response_model=OrderStatusBatchOut, response_model_exclude_none=True
+)
+def update_orders_status_batch_endpoint(payload: OrderStatusBatchUpdate, conn=Depends(get_db)):
+    if len(payload.order_ids) > ORDER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds {ORDER_BATCH_MAX_SIZE} orders"
+        )
+    try:
+        results = update_orders_status_batch(
+            conn, payload.order_ids, payload.status, payload.include_items
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_STATUS":
+            raise HTTPException(status_code=400, detail="Invalid status")
+        raise
+    failed = sum(1 for r in results if "error" in r)
+    return {"updated": len(results) - failed, "failed": failed, "results": results}
 
 
 @router.delete("/orders/{order_id}", status_code=204)
-def delete_order_endpoint(order_id: int):
-    conn = get_conn()
+def delete_order_endpoint(order_id: int, conn=Depends(get_db)):
     try:
         deleted = delete_order(conn, order_id)
         if not deleted:
@@ -140,29 +218,57 @@ def delete_order_endpoint(order_id: int):
         if str(e) == "ORDER_NOT_PENDING":
             raise HTTPException(status_code=409, detail="Only PENDING orders can be deleted")
         raise
-    finally:
-        conn.close()
 
 
-@router.get("/customers/{customer_id}/orders", response_model=List[OrderSummaryOut])
-def list_customer_orders_endpoint(customer_id: int):
-    conn = get_conn()
+# Summaries only carry "items" when include=items asks for them.
+@router.get(
+    "/customers/{customer_id}/orders",
+    response_model=OrderSummaryPageOut,
+    response_model_exclude_unset=True,
+)
+def list_customer_orders_endpoint(
+    customer_id: int,
+    limit: int = Query(ORDER_PAGE_DEFAULT_SIZE, ge=1, le=ORDER_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include: Optional[Literal["items"]] = Query(None, description="items: embed order lines"),
+    conn=Depends(get_db),
+):
     try:
-        return list_orders_by_customer(conn, customer_id)
-    finally:
-        conn.close()
+        return list_orders_by_customer(
+            conn, customer_id, limit, cursor, include_items=include == "items"
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
 
 
-@router.get("/orders", response_model=List[OrderSummaryOut])
-def list_orders_by_date_endpoint(
-    start: datetime = Query(..., description="Start datetime (inclusive)"),
-    end: datetime = Query(..., description="End datetime (inclusive)"),
+@router.get(
+    "/orders",
+    response_model=Union[OrderSummaryPageOut, OrderMultiGetOut],
+    response_model_exclude_unset=True,
+)
+def list_orders_endpoint(
+    start: Optional[datetime] = Query(None, description="Start datetime (inclusive)"),
+    end: Optional[datetime] = Query(None, description="End datetime (inclusive)"),
+    limit: int = Query(ORDER_PAGE_DEFAULT_SIZE, ge=1, le=ORDER_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include: Optional[Literal["items"]] = Query(None, description="items: embed order lines"),
+    ids: Optional[List[str]] = Query(None, description="Comma-separated order ids"),
+    conn=Depends(get_db),
 ):
-    conn = get_conn()
+    if ids is not None:
+        return get_orders_by_ids(conn, requested_ids(ids))
+    if start is None or end is None:
+        raise HTTPException(status_code=422, detail="start and end are required without ids")
     try:
-        return list_orders_by_date_range(conn, start, end)
-    finally:
-        conn.close()
+        return list_orders_by_date_range(
+            conn, start, end, limit, cursor, include_items=include == "items"
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
 
 
 @router.get("/reports/top-products", response_model=List[TopProductOut])
@@ -171,8 +277,85 @@ def top_products_report_endpoint(
     end: datetime = Query(..., description="End datetime (inclusive)"),
     limit: int = Query(10, ge=1, le=100),
 ):
-    conn = get_conn()
+    if analytics.enabled:
+        return top_products_report(start, end, limit)
+    if report_cache.enabled:
+        start, end = align_report_window(start, end)
+
+    def load():
+        with request_db() as conn:
+            return top_products_json(top_selling_products(conn, start, end, limit))
+
+    body = report_cache.load((start, end, limit), load, ttl_seconds=report_ttl(end))
+    return Response(content=body, media_type="application/json")
+
+
+# Served from this process's in-memory summary; no database access.
+@router.get("/reports/top-products/live", response_model=LiveTopProductsOut)
+def live_top_products_endpoint(
+    window_minutes: int = Query(5, ge=1, le=max(LIVE_TOPK_WINDOW_MINUTES, 1)),
+    limit: int = Query(10, ge=1, le=100),
+):
+    return live_top_products(window_minutes, limit)
+
+
+def analytics_snapshot() -> SalesSnapshot:
+    if not analytics.enabled:
+        raise HTTPException(status_code=503, detail="Analytics snapshot is disabled")
+    return analytics.snapshot()
+
+
+@router.get("/reports/sales-by-day", response_model=DailySalesReportOut)
+def sales_by_day_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+):
+    snapshot = analytics_snapshot()
+    return {"as_of": snapshot.as_of, "items": snapshot.sales_by_day(start, end)}
+
+
+@router.get("/reports/top-customers", response_model=CustomerSalesReportOut)
+def top_customers_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    snapshot = analytics_snapshot()
+    return {"as_of": snapshot.as_of, "items": snapshot.top_customers(start, end, limit)}
+
+
+@router.get("/reports/basket-sizes", response_model=BasketSizeReportOut)
+def basket_sizes_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+):
+    snapshot = analytics_snapshot()
+    return {"as_of": snapshot.as_of, "items": snapshot.basket_sizes(start, end)}
+
+
+@router.get("/reports/status-funnel", response_model=StatusFunnelReportOut)
+def status_funnel_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+):
+    snapshot = analytics_snapshot()
+    return {"as_of": snapshot.as_of, "items": snapshot.status_funnel(start, end)}
+
+
+@router.post("/reports/jobs", response_model=ReportJobOut, status_code=202)
+def create_report_job_endpoint(payload: ReportJobCreate):
+    params = payload.model_dump(exclude={"report"})
     try:
-        return top_selling_products(conn, start, end, limit)
-    finally:
-        conn.close()
+        return report_jobs.submit(payload.report, params)
+    except ReportQueueFull:
+        raise HTTPException(
+            status_code=503, detail="Report queue is full", headers={"Retry-After": "5"}
+        )
+
+
+@router.get("/reports/jobs/{job_id}", response_model=ReportJobOut)
+def get_report_job_endpoint(job_id: str):
+    job = report_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
@@ -0,0 +1,226 @@
+from datetime import datetime
+from typing import List, Literal, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from starlette.concurrency import run_in_threadpool
+
+from shared.config import ORDER_PAGE_DEFAULT_SIZE, ORDER_PAGE_MAX_SIZE
+from shared.db import async_request_db, get_async_db
+from shared.multiget import requested_ids
+
+from .analytics import analytics, top_products_report
+from .cache import (
+    align_report_window,
+    order_cache,
+    order_json,
+    report_cache,
+    report_ttl,
+    top_products_json,
+)
+from .models import (
+    OrderCreate,
+    OrderMultiGetOut,
+    OrderOut,
+    OrderStatusUpdate,
+    OrderSummaryPageOut,
+    OrderUpdate,
+    TopProductOut,
+)
+from .service import OutOfStockError
+from .service_async import (
+    create_order,
+    delete_order,
+    get_order_by_id,
+    get_orders_by_ids,
+    list_orders_by_customer,
+    list_orders_by_date_range,
+    top_selling_products,
+    update_order_items,
+    update_order_status,
+)
+
+router = APIRouter()
+
+
+@router.post("/orders", response_model=OrderOut, status_code=201)
+async def create_order_endpoint(payload: OrderCreate, conn=Depends(get_async_db)):
+    try:
+        order = await create_order(
+            conn, payload.customer_id, [i.model_dump() for i in payload.items]
+        )
+        return order
+    except OutOfStockError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "code": "OUT_OF_STOCK",
+                "product_id": e.product_id,
+                "available": e.available,
+                "requested": e.requested,
+            },
+        )
+    except KeyError as e:
+        msg = str(e)
+        if msg == "'CUSTOMER_NOT_FOUND'":
+            raise HTTPException(status_code=404, detail="Customer not found")
+        if msg.startswith("'PRODUCT_NOT_FOUND:"):
+            pid = msg.split(":")[1].strip("'")
+            raise HTTPException(status_code=404, detail=f"Product not found: {pid}")
+        raise
+    except ValueError as e:
+        if str(e).startswith("PRODUCT_INACTIVE:"):
+            pid = str(e).split(":")[1]
+            raise HTTPException(status_code=409, detail=f"Product inactive: {pid}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# The int converter keeps sync-only paths such as /orders/export reachable
+# when this router is mounted ahead of the sync one.
+@router.get("/orders/{order_id:int}", response_model=OrderOut)
+async def get_order_endpoint(order_id: int):
+    async def load():
+        async with async_request_db() as conn:
+            return order_json(await get_order_by_id(conn, order_id))
+
+    body = await order_cache.load_async(order_id, load)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return Response(content=body, media_type="application/json")
+
+
+@router.put("/orders/{order_id}", response_model=OrderOut)
+async def update_order_endpoint(
+    order_id: int, payload: OrderUpdate, conn=Depends(get_async_db)
+):
+    try:
+        order = await update_order_items(
+            conn, order_id, [i.model_dump() for i in payload.items]
+        )
+        return order
+    except OutOfStockError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "code": "OUT_OF_STOCK",
+                "product_id": e.product_id,
+                "available": e.available,
+                "requested": e.requested,
+            },
+        )
+    except KeyError as e:
+        msg = str(e)
+        if msg == "'ORDER_NOT_FOUND'":
+            raise HTTPException(status_code=404, detail="Order not found")
+        if msg.startswith("'PRODUCT_NOT_FOUND:"):
+            pid = msg.split(":")[1].strip("'")
+            raise HTTPException(status_code=404, detail=f"Product not found: {pid}")
+        raise
+    except ValueError as e:
+        if str(e) == "ORDER_NOT_PENDING":
+            raise HTTPException(status_code=409, detail="Order must be PENDING to edit")
+        if str(e).startswith("PRODUCT_INACTIVE:"):
+            pid = str(e).split(":")[1]
+            raise HTTPException(status_code=409, detail=f"Product inactive: {pid}")
+        raise
+
+
+@router.patch("/orders/{order_id}/status", response_model=OrderOut)
+async def update_order_status_endpoint(
+    order_id: int, payload: OrderStatusUpdate, conn=Depends(get_async_db)
+):
+    try:
+        order = await update_order_status(conn, order_id, payload.status)
+        return order
+    except KeyError as e:
+        if str(e) == "'ORDER_NOT_FOUND'":
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise
+    except ValueError as e:
+        if str(e) == "INVALID_STATUS":
+            raise HTTPException(status_code=400, detail="Invalid status")
+        if str(e) == "INVALID_STATUS_TRANSITION":
+            raise HTTPException(status_code=409, detail="Invalid status transition")
+        raise
+
+
+@router.delete("/orders/{order_id}", status_code=204)
+async def delete_order_endpoint(order_id: int, conn=Depends(get_async_db)):
+    try:
+        deleted = await delete_order(conn, order_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Order not found")
+    except ValueError as e:
+        if str(e) == "ORDER_NOT_PENDING":
+            raise HTTPException(status_code=409, detail="Only PENDING orders can be deleted")
+        raise
+
+
+# Summaries only carry "items" when include=items asks for them.
+@router.get(
+    "/customers/{customer_id}/orders",
+    response_model=OrderSummaryPageOut,
+    response_model_exclude_unset=True,
+)
+async def list_customer_orders_endpoint(
+    customer_id: int,
+    limit: int = Query(ORDER_PAGE_DEFAULT_SIZE, ge=1, le=ORDER_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include: Optional[Literal["items"]] = Query(None, description="items: embed order lines"),
+    conn=Depends(get_async_db),
+):
+    try:
+        return await list_orders_by_customer(
+            conn, customer_id, limit, cursor, include_items=include == "items"
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
+
+
+@router.get(
+    "/orders",
+    response_model=Union[OrderSummaryPageOut, OrderMultiGetOut],
+    response_model_exclude_unset=True,
+)
+async def list_orders_endpoint(
+    start: Optional[datetime] = Query(None, description="Start datetime (inclusive)"),
+    end: Optional[datetime] = Query(None, description="End datetime (inclusive)"),
+    limit: int = Query(ORDER_PAGE_DEFAULT_SIZE, ge=1, le=ORDER_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include: Optional[Literal["items"]] = Query(None, description="items: embed order lines"),
+    ids: Optional[List[str]] = Query(None, description="Comma-separated order ids"),
+    conn=Depends(get_async_db),
+):
+    if ids is not None:
+        return await get_orders_by_ids(conn, requested_ids(ids))
+    if start is None or end is None:
+        raise HTTPException(status_code=422, detail="start and end are required without ids")
+    try:
+        return await list_orders_by_date_range(
+            conn, start, end, limit, cursor, include_items=include == "items"
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
+
+
+@router.get("/reports/top-products", response_model=List[TopProductOut])
+async def top_products_report_endpoint(
+    start: datetime = Query(..., description="Start datetime (inclusive)"),
+    end: datetime = Query(..., description="End datetime (inclusive)"),
+    limit: int = Query(10, ge=1, le=100),
+):
+    # Snapshot loads and numpy work run off the event loop.
+    if analytics.enabled:
+        return await run_in_threadpool(top_products_report, start, end, limit)
+    if report_cache.enabled:
+        start, end = align_report_window(start, end)
+
+    async def load():
+        async with async_request_db() as conn:
+            return top_products_json(await top_selling_products(conn, start, end, limit))
+
+    body = await report_cache.load_async((start, end, limit), load, ttl_seconds=report_ttl(end))
+    return Response(content=body, media_type="application/json")
@@ -1,14 +1,48 @@
 from typing import Any, Dict, List, Optional
 
+from shared.db import retry_on_conflict
+from shared.multiget import order_by_ids
+
+from .cache import order_cache
 from .helpers import (
+    apply_order_items_diff,
     apply_stock_delta,
-    compute_total,
+    decode_cursor,
+    embed_order_items,
     ensure_products_active,
     ensure_products_exist,
     ensure_stock_available,
     fetch_order_items,
+    fetch_orders_items,
     fetch_products_for_update,
+    insert_batch_order_items,
+    insert_order_items,
+    lock_bucketed_stock,
     normalize_items,
+    orders_page,
+    price_lines,
+    record_daily_sales,
+)
+from .live import in_live_window, record_live_sales
+from .queries import (
+    ALLOCATE_ORDER_IDS,
+    DELETE_ORDER,
+    INSERT_ORDER,
+    INSERT_ORDERS,
+    SELECT_CUSTOMER_EXISTS,
+    SELECT_EXISTING_CUSTOMERS,
+    SELECT_ORDER_FOR_UPDATE,
+    SELECT_ORDER_ITEMS_FOR_UPDATE,
+    SELECT_ORDER_ITEM_QUANTITIES,
+    SELECT_ORDER_STATUS_FOR_UPDATE,
+    SELECT_ORDER_WITH_ITEMS,
+    SELECT_ORDERS_BY_IDS,
+    SELECT_ORDERS_ITEM_TOTALS,
+    UPDATE_ORDER_STATUS,
+    UPDATE_ORDER_STATUSES,
+    build_list_orders_by_customer,
+    build_list_orders_by_date_range,
+    build_top_selling_products,
 )
 
 ALLOWED_STATUS_TRANSITIONS = {
@@ -30,66 +64,130 @@ class OutOfStockError(Exception):
         )
 
 
+@retry_on_conflict
 def create_order(conn, customer_id: int, items: List[Dict[str, int]]) -> Dict[str, Any]:
     normalized = normalize_items(items)
     product_ids = [pid for pid, _ in normalized]
 
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT id FROM customers WHERE id = %s", (customer_id,))
+            cur.execute(SELECT_CUSTOMER_EXISTS, (customer_id,))
             if not cur.fetchone():
                 raise KeyError("CUSTOMER_NOT_FOUND")
 
             by_id = fetch_products_for_update(conn, product_ids)
             ensure_products_exist(by_id, product_ids)
             ensure_products_active(by_id, product_ids)
-            ensure_stock_available(by_id, normalized, OutOfStockError)
+            apply_stock_delta(conn, normalized, OutOfStockError)
 
-            cur.execute(
-                """
-                INSERT INTO orders (customer_id, status, total_cents)
-                VALUES (%s, 'PENDING', 0)
-                RETURNING id, customer_id, status, total_cents, created_at, updated_at
-                """,
-                (customer_id,),
-            )
+            lines = price_lines(by_id, normalized)
+            total = sum(line_total for _, _, _, line_total in lines)
+            cur.execute(INSERT_ORDER, (customer_id, total))
             order = cur.fetchone()
-            order_id = order["id"]
+            order["items"] = insert_order_items(conn, order["id"], lines)
+            record_daily_sales(conn, [order["id"]], 1)
 
-            total = 0
-            stock_deltas: List[tuple[int, int]] = []
-            created_items: List[Dict[str, Any]] = []
-            for pid, qty in normalized:
-                unit = by_id[pid]["price_cents"]
-                line_total = unit * qty
-                total += line_total
+        conn.commit()
+        order_cache.invalidate(order["id"])
+        record_live_sales(order["created_at"], normalized)
+        return order
+    except Exception:
+        conn.rollback()
+        raise
 
-                cur.execute(
-                    """
-                    INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING product_id, quantity, unit_price_cents, line_total_cents
-                    """,
-                    (order_id, pid, qty, unit, line_total),
-                )
-                created_items.append(cur.fetchone())
-                stock_deltas.append((pid, qty))
 
-            apply_stock_delta(conn, stock_deltas)
-            cur.execute(
-                """
-                UPDATE orders
-                SET total_cents = %s, updated_at = now()
-                WHERE id = %s
-                RETURNING id, customer_id, status, total_cents, created_at, updated_at
-                """,
-                (total, order_id),
+def batch_error(exc: Exception) -> Dict[str, Any]:
+    if isinstance(exc, OutOfStockError):
+        return {
+            "code": "OUT_OF_STOCK",
+            "product_id": exc.product_id,
+            "available": exc.available,
+            "requested": exc.requested,
+        }
+    msg = exc.args[0] if exc.args else str(exc)
+    code, _, pid = msg.partition(":")
+    if code in {"PRODUCT_NOT_FOUND", "PRODUCT_INACTIVE"}:
+        return {"code": code, "product_id": int(pid)}
+    if code == "CUSTOMER_NOT_FOUND":
+        return {"code": code}
+    return {"code": "INVALID_ORDER", "detail": msg}
+
+
+@retry_on_conflict
+def create_orders_batch(conn, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = [{"index": i} for i in range(len(orders))]
+    candidates = []
+    for i, o in enumerate(orders):
+        try:
+            candidates.append((i, o["customer_id"], normalize_items(o["items"])))
+        except ValueError as e:
+            results[i]["error"] = batch_error(e)
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SELECT_EXISTING_CUSTOMERS, (list({c for _, c, _ in candidates}),))
+            customer_ids = {r["id"] for r in cur.fetchall() or []}
+
+            # Every product in the batch is locked once, in id order, and
+            # orders are then accepted in input order against the running stock.
+            by_id = fetch_products_for_update(
+                conn, sorted({pid for _, _, n in candidates for pid, _ in n})
             )
-            order = cur.fetchone()
-            order["items"] = created_items
+            lock_bucketed_stock(conn, by_id)
+            remaining = {pid: dict(r) for pid, r in by_id.items()}
+
+            accepted = []
+            for i, customer_id, normalized in candidates:
+                product_ids = [pid for pid, _ in normalized]
+                try:
+                    if customer_id not in customer_ids:
+                        raise KeyError("CUSTOMER_NOT_FOUND")
+                    ensure_products_exist(by_id, product_ids)
+                    ensure_products_active(by_id, product_ids)
+                    ensure_stock_available(remaining, normalized, OutOfStockError)
+                except (KeyError, ValueError, OutOfStockError) as e:
+                    results[i]["error"] = batch_error(e)
+                    continue
+                for pid, qty in normalized:
+                    remaining[pid]["stock_quantity"] -= qty
+                accepted.append((i, customer_id, price_lines(by_id, normalized)))
+
+            if accepted:
+                totals: Dict[int, int] = {}
+                for _, _, lines in accepted:
+                    for pid, qty, _, _ in lines:
+                        totals[pid] = totals.get(pid, 0) + qty
+                apply_stock_delta(conn, totals.items(), OutOfStockError)
+
+                cur.execute(ALLOCATE_ORDER_IDS, (len(accepted),))
+                order_ids = [r["id"] for r in cur.fetchall()]
+                cur.execute(
+                    INSERT_ORDERS,
+                    (
+                        order_ids,
+                        [customer_id for _, customer_id, _ in accepted],
+                        [sum(line[3] for line in lines) for _, _, lines in accepted],
+                    ),
+                )
+                order_by_id = {r["id"]: r for r in cur.fetchall()}
+                items_by_order = insert_batch_order_items(
+                    conn, {oid: lines for oid, (_, _, lines) in zip(order_ids, accepted)}
+                )
+                record_daily_sales(conn, order_ids, 1)
+                for oid, (i, _, _) in zip(order_ids, accepted):
+                    order = order_by_id[oid]
+                    order["items"] = items_by_order[oid]
+                    results[i]["order"] = order
 
         conn.commit()
-        return order
+        order_cache.invalidate(*(r["order"]["id"] for r in results if "order" in r))
+        for r in results:
+            if "order" in r:
+                record_live_sales(
+                    r["order"]["created_at"],
+                    [(item["product_id"], item["quantity"]) for item in r["order"]["items"]],
+                )
+        return results
     except Exception:
         conn.rollback()
         raise
@@ -97,21 +195,22 @@ def create_order(conn, customer_id: int, items: List[Dict[str, int]]) -> Dict[st
 
 def get_order_by_id(conn, order_id: int) -> Optional[Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, customer_id, status, total_cents, created_at, updated_at
-            FROM orders
-            WHERE id = %s
-            """,
-            (order_id,),
-        )
-        order = cur.fetchone()
-        if not order:
-            return None
-    order["items"] = fetch_order_items(conn, order_id)
-    return order
+        cur.execute(SELECT_ORDER_WITH_ITEMS, (order_id,))
+        return cur.fetchone()
 
 
+# One query for the orders and one for all of their items, instead of a
+# SELECT_ORDER_WITH_ITEMS round trip per id.
+def get_orders_by_ids(conn, order_ids: List[int]) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_ORDERS_BY_IDS, (order_ids,))
+        rows = cur.fetchall() or []
+    embed_order_items(conn, rows)
+    orders, missing = order_by_ids(rows, order_ids)
+    return {"orders": orders, "missing": missing}
+
+
+@retry_on_conflict
 def update_order_items(conn, order_id: int, items: List[Dict[str, int]]) -> Dict[str, Any]:
     normalized = normalize_items(items)
     new_qty_by_id = {pid: qty for pid, qty in normalized}
@@ -119,106 +218,42 @@ def update_order_items(conn, order_id: int, items: List[Dict[str, int]]) -> Dict
 
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, status
-                FROM orders
-                WHERE id = %s
-                FOR UPDATE
-                """,
-                (order_id,),
-            )
-            order_row = cur.fetchone()
-            if not order_row:
+            cur.execute(SELECT_ORDER_ITEMS_FOR_UPDATE, (order_id,))
+            existing_rows = cur.fetchall() or []
+            if not existing_rows:
                 raise KeyError("ORDER_NOT_FOUND")
-            if order_row["status"] != "PENDING":
+            if existing_rows[0]["status"] != "PENDING":
                 raise ValueError("ORDER_NOT_PENDING")
-
-            cur.execute(
-                """
-                SELECT product_id, quantity, unit_price_cents
-                FROM order_items
-                WHERE order_id = %s
-                """,
-                (order_id,),
-            )
-            existing_items = cur.fetchall() or []
-            old_qty_by_id = {r["product_id"]: r["quantity"] for r in existing_items}
-            old_unit_by_id = {r["product_id"]: r["unit_price_cents"] for r in existing_items}
-
-            all_product_ids = list({*product_ids, *old_qty_by_id.keys()})
-            by_id = fetch_products_for_update(conn, all_product_ids)
-            ensure_products_exist(by_id, all_product_ids)
-            ensure_products_active(by_id, product_ids)
-            deltas = [
-                (pid, new_qty_by_id.get(pid, 0) - old_qty_by_id.get(pid, 0))
-                for pid in all_product_ids
-            ]
-            ensure_stock_available(by_id, deltas, OutOfStockError)
-
-            apply_stock_delta(conn, deltas)
-
-            for pid in all_product_ids:
-                old_qty = old_qty_by_id.get(pid, 0)
-                new_qty = new_qty_by_id.get(pid, 0)
-                delta = new_qty - old_qty
-
-                if old_qty == 0 and new_qty > 0:
-                    unit = by_id[pid]["price_cents"]
-                    line_total = unit * new_qty
-                    cur.execute(
-                        """
-                        INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
-                        VALUES (%s, %s, %s, %s, %s)
-                        RETURNING product_id, quantity, unit_price_cents, line_total_cents
-                        """,
-                        (order_id, pid, new_qty, unit, line_total),
-                    )
-                    cur.fetchone()
-                elif old_qty > 0 and new_qty == 0:
-                    cur.execute(
-                        """
-                        DELETE FROM order_items
-                        WHERE order_id = %s AND product_id = %s
-                        """,
-                        (order_id, pid),
-                    )
-                elif old_qty > 0 and new_qty > 0:
-                    unit = old_unit_by_id[pid]
-                    line_total = unit * new_qty
-                    cur.execute(
-                        """
-                        UPDATE order_items
-                        SET quantity = %s, line_total_cents = %s
-                        WHERE order_id = %s AND product_id = %s
-                        RETURNING product_id, quantity, unit_price_cents, line_total_cents
-                        """,
-                        (new_qty, line_total, order_id, pid),
-                    )
-                    cur.fetchone()
-
-            items_out = fetch_order_items(conn, order_id)
-            total = compute_total(items_out)
-
-            cur.execute(
-                """
-                UPDATE orders
-                SET total_cents = %s, updated_at = now()
-                WHERE id = %s
-                RETURNING id, customer_id, status, total_cents, created_at, updated_at
-                """,
-                (total, order_id),
-            )
-            order = cur.fetchone()
-            order["items"] = items_out
+            old_qty_by_id = {
+                r["product_id"]: r["quantity"]
+                for r in existing_rows
+                if r["product_id"] is not None
+            }
+
+        all_product_ids = list({*product_ids, *old_qty_by_id.keys()})
+        by_id = fetch_products_for_update(conn, all_product_ids)
+        ensure_products_exist(by_id, all_product_ids)
+        ensure_products_active(by_id, product_ids)
+        deltas = [
+            (pid, new_qty_by_id.get(pid, 0) - old_qty_by_id.get(pid, 0))
+            for pid in all_product_ids
+        ]
+        apply_stock_delta(conn, deltas, OutOfStockError)
+
+        record_daily_sales(conn, [order_id], -1)
+        order = apply_order_items_diff(conn, order_id, price_lines(by_id, normalized))
+        record_daily_sales(conn, [order_id], 1)
 
         conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(order["created_at"], deltas)
         return order
     except Exception:
         conn.rollback()
         raise
 
 
+@retry_on_conflict
 def update_order_status(conn, order_id: int, new_status: str) -> Dict[str, Any]:
     new_status = new_status.upper()
     if new_status not in ALLOWED_STATUS_TRANSITIONS:
@@ -226,20 +261,13 @@ def update_order_status(conn, order_id: int, new_status: str) -> Dict[str, Any]:
 
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, status, customer_id, total_cents, created_at, updated_at
-                FROM orders
-                WHERE id = %s
-                FOR UPDATE
-                """,
-                (order_id,),
-            )
+            cur.execute(SELECT_ORDER_FOR_UPDATE, (order_id,))
             order = cur.fetchone()
             if not order:
                 raise KeyError("ORDER_NOT_FOUND")
 
             current = order["status"]
+            items = []
             if current == new_status:
                 order["items"] = fetch_order_items(conn, order_id)
                 return order
@@ -248,139 +276,163 @@ def update_order_status(conn, order_id: int, new_status: str) -> Dict[str, Any]:
                 raise ValueError("INVALID_STATUS_TRANSITION")
 
             if new_status == "CANCELLED" and current in {"PENDING", "CONFIRMED"}:
-                cur.execute(
-                    """
-                    SELECT product_id, quantity
-                    FROM order_items
-                    WHERE order_id = %s
-                    """,
-                    (order_id,),
-                )
+                cur.execute(SELECT_ORDER_ITEM_QUANTITIES, (order_id,))
                 items = cur.fetchall() or []
-                product_ids = [r["product_id"] for r in items]
-                if product_ids:
-                    fetch_products_for_update(conn, product_ids)
-                    apply_stock_delta(
-                        conn, [(r["product_id"], -r["quantity"]) for r in items]
-                    )
+                apply_stock_delta(
+                    conn, [(r["product_id"], -r["quantity"]) for r in items], OutOfStockError
+                )
+                record_daily_sales(conn, [order_id], -1)
 
-            cur.execute(
-                """
-                UPDATE orders
-                SET status = %s, updated_at = now()
-                WHERE id = %s
-                RETURNING id, customer_id, status, total_cents, created_at, updated_at
-                """,
-                (new_status, order_id),
-            )
+            cur.execute(UPDATE_ORDER_STATUS, (new_status, order_id))
             order = cur.fetchone()
             order["items"] = fetch_order_items(conn, order_id)
 
         conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(
+            order["created_at"], [(r["product_id"], r["quantity"]) for r in items], -1
+        )
         return order
     except Exception:
         conn.rollback()
         raise
 
 
-def delete_order(conn, order_id: int) -> bool:
+@retry_on_conflict
+def update_orders_status_batch(
+    conn, order_ids: List[int], new_status: str, include_items: bool = False
+) -> List[Dict[str, Any]]:
+    new_status = new_status.upper()
+    if new_status not in ALLOWED_STATUS_TRANSITIONS:
+        raise ValueError("INVALID_STATUS")
+    from_statuses = [
+        status for status, targets in ALLOWED_STATUS_TRANSITIONS.items() if new_status in targets
+    ]
+
+    live_items: Dict[int, List[Dict[str, Any]]] = {}
     try:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                SELECT id, status
-                FROM orders
-                WHERE id = %s
-                FOR UPDATE
-                """,
-                (order_id,),
+                UPDATE_ORDER_STATUSES,
+                {"order_ids": order_ids, "status": new_status, "from_statuses": from_statuses},
             )
+            found = {r["id"]: r for r in cur.fetchall() or []}
+
+            if new_status == "CANCELLED":
+                cancelled = [oid for oid, r in found.items() if r["updated"]]
+                if cancelled:
+                    cur.execute(SELECT_ORDERS_ITEM_TOTALS, (cancelled,))
+                    apply_stock_delta(
+                        conn,
+                        [(r["product_id"], -r["quantity"]) for r in cur.fetchall() or []],
+                        OutOfStockError,
+                    )
+                    record_daily_sales(conn, cancelled, -1)
+                    recent = [oid for oid in cancelled if in_live_window(found[oid]["created_at"])]
+                    if recent:
+                        live_items = fetch_orders_items(conn, recent)
+
+        results = []
+        for oid in dict.fromkeys(order_ids):
+            row = found.get(oid)
+            if row is None:
+                results.append({"id": oid, "error": "ORDER_NOT_FOUND"})
+            elif not row["updated"] and row["previous_status"] != new_status:
+                results.append(
+                    {"id": oid, "status": row["status"], "error": "INVALID_STATUS_TRANSITION"}
+                )
+            else:
+                results.append(
+                    {"id": oid, "status": row["status"], "previous_status": row["previous_status"]}
+                )
+
+        if include_items:
+            ok_ids = [r["id"] for r in results if "error" not in r]
+            items_by_order = fetch_orders_items(conn, ok_ids) if ok_ids else {}
+            for r in results:
+                if "error" not in r:
+                    r["items"] = items_by_order[r["id"]]
+
+        conn.commit()
+        order_cache.invalidate(*(r["id"] for r in results if "error" not in r))
+        for oid, items in live_items.items():
+            record_live_sales(
+                found[oid]["created_at"], [(i["product_id"], i["quantity"]) for i in items], -1
+            )
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+
+
+@retry_on_conflict
+def delete_order(conn, order_id: int) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SELECT_ORDER_STATUS_FOR_UPDATE, (order_id,))
             order = cur.fetchone()
             if not order:
                 return False
             if order["status"] != "PENDING":
                 raise ValueError("ORDER_NOT_PENDING")
 
-            cur.execute(
-                """
-                SELECT product_id, quantity
-                FROM order_items
-                WHERE order_id = %s
-                """,
-                (order_id,),
-            )
+            cur.execute(SELECT_ORDER_ITEM_QUANTITIES, (order_id,))
             items = cur.fetchall() or []
-            product_ids = [r["product_id"] for r in items]
-            if product_ids:
-                fetch_products_for_update(conn, product_ids)
-                apply_stock_delta(
-                    conn, [(r["product_id"], -r["quantity"]) for r in items]
-                )
-
-            cur.execute(
-                """
-                DELETE FROM orders
-                WHERE id = %s
-                """,
-                (order_id,),
+            apply_stock_delta(
+                conn, [(r["product_id"], -r["quantity"]) for r in items], OutOfStockError
             )
+
+            record_daily_sales(conn, [order_id], -1)
+            cur.execute(DELETE_ORDER, (order_id,))
             deleted = cur.rowcount > 0
 
         conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(
+            order["created_at"], [(r["product_id"], r["quantity"]) for r in items], -1
+        )
         return deleted
     except Exception:
         conn.rollback()
         raise
 
 
-def list_orders_by_customer(conn, customer_id: int) -> List[Dict[str, Any]]:
+def list_orders_by_customer(
+    conn,
+    customer_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    sql, params = build_list_orders_by_customer(customer_id, limit + 1, decode_cursor(cursor))
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, customer_id, status, total_cents, created_at, updated_at
-            FROM orders
-            WHERE customer_id = %s
-            ORDER BY created_at DESC
-            """,
-            (customer_id,),
-        )
-        return cur.fetchall() or []
-
-
-def list_orders_by_date_range(conn, start_dt, end_dt) -> List[Dict[str, Any]]:
+        cur.execute(sql, params)
+        page = orders_page(cur.fetchall() or [], limit)
+    if include_items:
+        embed_order_items(conn, page["items"])
+    return page
+
+
+def list_orders_by_date_range(
+    conn,
+    start_dt,
+    end_dt,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    sql, params = build_list_orders_by_date_range(
+        start_dt, end_dt, limit + 1, decode_cursor(cursor)
+    )
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, customer_id, status, total_cents, created_at, updated_at
-            FROM orders
-            WHERE created_at >= %s AND created_at <= %s
-            ORDER BY created_at DESC
-            """,
-            (start_dt, end_dt),
-        )
-        return cur.fetchall() or []
+        cur.execute(sql, params)
+        page = orders_page(cur.fetchall() or [], limit)
+    if include_items:
+        embed_order_items(conn, page["items"])
+    return page
 
 
 def top_selling_products(conn, start_dt, end_dt, limit: int) -> List[Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT
-                p.id AS product_id,
-                p.sku,
-                p.name,
-                SUM(oi.quantity) AS total_quantity,
-                SUM(oi.line_total_cents) AS total_sales_cents
-            FROM order_items oi
-            JOIN orders o ON o.id = oi.order_id
-            JOIN products p ON p.id = oi.product_id
-            WHERE o.created_at >= %s
-              AND o.created_at <= %s
-              AND o.status != 'CANCELLED'
-            GROUP BY p.id, p.sku, p.name
-            ORDER BY total_quantity DESC
-            LIMIT %s
-            """,
-            (start_dt, end_dt, limit),
-        )
+        cur.execute(*build_top_selling_products(start_dt, end_dt, limit))
         return cur.fetchall() or []
@@ -0,0 +1,250 @@
+from typing import Any, Dict, List, Optional
+
+from shared.db import retry_on_conflict_async
+from shared.multiget import order_by_ids
+
+from .cache import order_cache
+from .helpers import (
+    decode_cursor,
+    ensure_products_active,
+    ensure_products_exist,
+    normalize_items,
+    orders_page,
+    price_lines,
+)
+from .helpers_async import (
+    apply_order_items_diff,
+    apply_stock_delta,
+    embed_order_items,
+    fetch_order_items,
+    fetch_products_for_update,
+    insert_order_items,
+    record_daily_sales,
+)
+from .live import record_live_sales
+from .queries import (
+    DELETE_ORDER,
+    INSERT_ORDER,
+    SELECT_CUSTOMER_EXISTS,
+    SELECT_ORDER_FOR_UPDATE,
+    SELECT_ORDER_ITEMS_FOR_UPDATE,
+    SELECT_ORDER_ITEM_QUANTITIES,
+    SELECT_ORDER_STATUS_FOR_UPDATE,
+    SELECT_ORDER_WITH_ITEMS,
+    SELECT_ORDERS_BY_IDS,
+    UPDATE_ORDER_STATUS,
+    build_list_orders_by_customer,
+    build_list_orders_by_date_range,
+    build_top_selling_products,
+)
+from .service import ALLOWED_STATUS_TRANSITIONS, OutOfStockError
+
+
+@retry_on_conflict_async
+async def create_order(conn, customer_id: int, items: List[Dict[str, int]]) -> Dict[str, Any]:
+    normalized = normalize_items(items)
+    product_ids = [pid for pid, _ in normalized]
+
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(SELECT_CUSTOMER_EXISTS, (customer_id,))
+            if not await cur.fetchone():
+                raise KeyError("CUSTOMER_NOT_FOUND")
+
+            by_id = await fetch_products_for_update(conn, product_ids)
+            ensure_products_exist(by_id, product_ids)
+            ensure_products_active(by_id, product_ids)
+            await apply_stock_delta(conn, normalized, OutOfStockError)
+
+            lines = price_lines(by_id, normalized)
+            total = sum(line_total for _, _, _, line_total in lines)
+            await cur.execute(INSERT_ORDER, (customer_id, total))
+            order = await cur.fetchone()
+            order["items"] = await insert_order_items(conn, order["id"], lines)
+            await record_daily_sales(conn, [order["id"]], 1)
+
+        await conn.commit()
+        order_cache.invalidate(order["id"])
+        record_live_sales(order["created_at"], normalized)
+        return order
+    except Exception:
+        await conn.rollback()
+        raise
+
+
+async def get_order_by_id(conn, order_id: int) -> Optional[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_ORDER_WITH_ITEMS, (order_id,))
+        return await cur.fetchone()
+
+
+# One query for the orders and one for all of their items, instead of a
+# SELECT_ORDER_WITH_ITEMS round trip per id.
+async def get_orders_by_ids(conn, order_ids: List[int]) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_ORDERS_BY_IDS, (order_ids,))
+        rows = await cur.fetchall() or []
+    await embed_order_items(conn, rows)
+    orders, missing = order_by_ids(rows, order_ids)
+    return {"orders": orders, "missing": missing}
+
+
+@retry_on_conflict_async
+async def update_order_items(conn, order_id: int, items: List[Dict[str, int]]) -> Dict[str, Any]:
+    normalized = normalize_items(items)
+    new_qty_by_id = {pid: qty for pid, qty in normalized}
+    product_ids = list(new_qty_by_id.keys())
+
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(SELECT_ORDER_ITEMS_FOR_UPDATE, (order_id,))
+            existing_rows = await cur.fetchall() or []
+            if not existing_rows:
+                raise KeyError("ORDER_NOT_FOUND")
+            if existing_rows[0]["status"] != "PENDING":
+                raise ValueError("ORDER_NOT_PENDING")
+            old_qty_by_id = {
+                r["product_id"]: r["quantity"]
+                for r in existing_rows
+                if r["product_id"] is not None
+            }
+
+        all_product_ids = list({*product_ids, *old_qty_by_id.keys()})
+        by_id = await fetch_products_for_update(conn, all_product_ids)
+        ensure_products_exist(by_id, all_product_ids)
+        ensure_products_active(by_id, product_ids)
+        deltas = [
+            (pid, new_qty_by_id.get(pid, 0) - old_qty_by_id.get(pid, 0))
+            for pid in all_product_ids
+        ]
+        await apply_stock_delta(conn, deltas, OutOfStockError)
+
+        await record_daily_sales(conn, [order_id], -1)
+        order = await apply_order_items_diff(conn, order_id, price_lines(by_id, normalized))
+        await record_daily_sales(conn, [order_id], 1)
+
+        await conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(order["created_at"], deltas)
+        return order
+    except Exception:
+        await conn.rollback()
+        raise
+
+
+@retry_on_conflict_async
+async def update_order_status(conn, order_id: int, new_status: str) -> Dict[str, Any]:
+    new_status = new_status.upper()
+    if new_status not in ALLOWED_STATUS_TRANSITIONS:
+        raise ValueError("INVALID_STATUS")
+
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(SELECT_ORDER_FOR_UPDATE, (order_id,))
+            order = await cur.fetchone()
+            if not order:
+                raise KeyError("ORDER_NOT_FOUND")
+
+            current = order["status"]
+            items = []
+            if current == new_status:
+                order["items"] = await fetch_order_items(conn, order_id)
+                return order
+
+            if new_status not in ALLOWED_STATUS_TRANSITIONS[current]:
+                raise ValueError("INVALID_STATUS_TRANSITION")
+
+            if new_status == "CANCELLED" and current in {"PENDING", "CONFIRMED"}:
+                await cur.execute(SELECT_ORDER_ITEM_QUANTITIES, (order_id,))
+                items = await cur.fetchall() or []
+                await apply_stock_delta(
+                    conn, [(r["product_id"], -r["quantity"]) for r in items], OutOfStockError
+                )
+                await record_daily_sales(conn, [order_id], -1)
+
+            await cur.execute(UPDATE_ORDER_STATUS, (new_status, order_id))
+            order = await cur.fetchone()
+            order["items"] = await fetch_order_items(conn, order_id)
+
+        await conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(
+            order["created_at"], [(r["product_id"], r["quantity"]) for r in items], -1
+        )
+        return order
+    except Exception:
+        await conn.rollback()
+        raise
+
+
+@retry_on_conflict_async
+async def delete_order(conn, order_id: int) -> bool:
+    try:
+        async with conn.cursor() as cur:
+            await cur.execute(SELECT_ORDER_STATUS_FOR_UPDATE, (order_id,))
+            order = await cur.fetchone()
+            if not order:
+                return False
+            if order["status"] != "PENDING":
+                raise ValueError("ORDER_NOT_PENDING")
+
+            await cur.execute(SELECT_ORDER_ITEM_QUANTITIES, (order_id,))
+            items = await cur.fetchall() or []
+            await apply_stock_delta(
+                conn, [(r["product_id"], -r["quantity"]) for r in items], OutOfStockError
+            )
+
+            await record_daily_sales(conn, [order_id], -1)
+            await cur.execute(DELETE_ORDER, (order_id,))
+            deleted = cur.rowcount > 0
+
+        await conn.commit()
+        order_cache.invalidate(order_id)
+        record_live_sales(
+            order["created_at"], [(r["product_id"], r["quantity"]) for r in items], -1
+        )
+        return deleted
+    except Exception:
+        await conn.rollback()
+        raise
+
+
+async def list_orders_by_customer(
+    conn,
+    customer_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    sql, params = build_list_orders_by_customer(customer_id, limit + 1, decode_cursor(cursor))
+    async with conn.cursor() as cur:
+        await cur.execute(sql, params)
+        page = orders_page(await cur.fetchall() or [], limit)
+    if include_items:
+        await embed_order_items(conn, page["items"])
+    return page
+
+
+async def list_orders_by_date_range(
+    conn,
+    start_dt,
+    end_dt,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = False,
+) -> Dict[str, Any]:
+    sql, params = build_list_orders_by_date_range(
+        start_dt, end_dt, limit + 1, decode_cursor(cursor)
+    )
+    async with conn.cursor() as cur:
+        await cur.execute(sql, params)
+        page = orders_page(await cur.fetchall() or [], limit)
+    if include_items:
+        await embed_order_items(conn, page["items"])
+    return page
+
+
+async def top_selling_products(conn, start_dt, end_dt, limit: int) -> List[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(*build_top_selling_products(start_dt, end_dt, limit))
+        return await cur.fetchall() or []
@@ -0,0 +1,105 @@
+import argparse
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.db import get_conn
+
+from .helpers import encode_cursor
+from .service import list_products
+
+SEED_PRODUCTS = """
+    INSERT INTO products (sku, name, price_cents, stock_quantity, is_active)
+    SELECT
+        'BENCH-' || lpad(g::text, 8, '0'),
+        (ARRAY['Blue', 'Red', 'Green', 'Black', 'White', 'Small', 'Large', 'Classic',
+               'Deluxe', 'Compact'])[1 + g %% 10]
+        || ' '
+        || (ARRAY['Widget', 'Gadget', 'Bracket', 'Hinge', 'Lamp', 'Cable', 'Valve', 'Spring',
+                  'Filter', 'Panel'])[1 + g / 10 %% 10]
+        || ' ' || g,
+        g::bigint * 7919 %% 10000,
+        CASE WHEN g %% 7 = 0 THEN 0 ELSE g %% 100 END,
+        g %% 11 <> 0
+    FROM generate_series(%(first)s, %(last)s) g
+"""
+
+SELECT_MIDDLE_PRODUCT = """
+    SELECT id, name
+    FROM products
+    WHERE sku = 'BENCH-' || lpad(%s::text, 8, '0')
+"""
+
+# name -> (sort, listing filters, start from the middle of the seeded rows).
+SCENARIOS: List[Tuple[str, str, Dict[str, Any], bool]] = [
+    ("first page", "id", {}, False),
+    ("middle page", "id", {}, True),
+    ("by name, middle page", "name", {}, True),
+    ("active, in stock", "id", {"is_active": True, "in_stock": True}, True),
+    ("price 1000-1099", "id", {"min_price_cents": 1000, "max_price_cents": 1099}, False),
+    ("sku prefix", "id", {"sku": "BENCH-0000"}, False),
+    ("name prefix", "id", {"name": "blue gad"}, False),
+    ("name prefix, by name", "name", {"name": "blue gad"}, False),
+    ("text search", "id", {"q": "idget 12"}, False),
+]
+
+
+def seed(conn, first: int, last: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute(SEED_PRODUCTS, {"first": first, "last": last})
+        cur.execute("ANALYZE products")
+
+
+def time_scenarios(conn, size: int, runs: int, limit: int) -> List[Tuple[str, float, float]]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_MIDDLE_PRODUCT, (size // 2,))
+        middle = cur.fetchone()
+    results = []
+    for name, sort, filters, from_middle in SCENARIOS:
+        cursor = encode_cursor(middle, sort) if from_middle else None
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            list_products(conn, limit, cursor, sort, **filters)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results.append((name, statistics.median(timings), timings[int(len(timings) * 0.95)]))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Seed products and time GET /products listings at growing catalog sizes."
+        " Everything seeded is rolled back."
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000,5000000",
+        help="comma-separated catalog sizes, ascending",
+    )
+    parser.add_argument("--runs", type=int, default=30, help="timed calls per scenario")
+    parser.add_argument("--limit", type=int, default=50, help="page size")
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if sizes != sorted(sizes):
+        parser.error("--sizes must be ascending")
+
+    conn = get_conn()
+    try:
+        seeded = 0
+        for size in sizes:
+            started = time.perf_counter()
+            seed(conn, seeded + 1, size)
+            seeded = size
+            print(f"{size} products (seeded in {time.perf_counter() - started:.1f}s)")
+            for name, p50, p95 in time_scenarios(conn, size, args.runs, args.limit):
+                print(f"  {name:<22} p50 {p50:7.2f} ms   p95 {p95:7.2f} ms")
+        return 0
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import logging
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from shared import metrics
+from shared.cache import TTLCache
+from shared.config import PRODUCT_CACHE_MAX_SIZE, PRODUCT_CACHE_TTL_SECONDS
+from shared.db import get_conn
+from shared.product_events import PRODUCT_CHANGES_CHANNEL, parse_product_changes
+
+from .models import ProductOut
+
+logger = logging.getLogger(__name__)
+
+# Serialized ProductOut bodies keyed by product id, plus ("sku", sku) -> id
+# entries for lookups by SKU. Only id keys are ever published, so SKU entries
+# are checked against the body they lead to and dropped when it disagrees.
+product_cache = TTLCache("product_cache", PRODUCT_CACHE_MAX_SIZE, PRODUCT_CACHE_TTL_SECONDS)
+
+
+def product_json(product: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    if not product:
+        return None
+    return ProductOut.model_validate(product).model_dump_json().encode()
+
+
+def sku_key(sku: str) -> tuple:
+    return ("sku", sku)
+
+
+def body_has_sku(body: Optional[bytes], sku: str) -> bool:
+    return body is not None and ProductOut.model_validate_json(body).sku == sku
+
+
+def apply_product_changes(cache: TTLCache, payload: str) -> None:
+    product_ids, sent_at = parse_product_changes(payload)
+    cache.invalidate(*product_ids)
+    # Lag from the writer's NOTIFY to the eviction here: how long this
+    # process may have served the old product after the change.
+    metrics.incr("product_cache_notifications")
+    metrics.incr("product_cache_invalidation_lag_seconds", max(time.time() - sent_at, 0.0))
+
+
+# Keeps a dedicated connection LISTENing on the product changes channel and
+# evicts the published ids. Changes made while the connection is down are
+# lost, so the cache is cleared every time listening (re)starts; in between,
+# the cache TTL bounds how stale an entry can get.
+class ProductCacheListener:
+    def __init__(
+        self,
+        cache: TTLCache,
+        connect: Callable[[], Any] = get_conn,
+        poll_seconds: float = 1.0,
+        retry_seconds: float = 1.0,
+    ):
+        self.cache = cache
+        self.connect = connect
+        self.poll_seconds = poll_seconds
+        self.retry_seconds = retry_seconds
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.register_gauges(self.stats)
+
+    def start(self) -> None:
+        if not self.cache.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="product-cache-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 5)
+            self._thread = None
+
+    def listen_once(self) -> None:
+        conn = self.connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {PRODUCT_CHANGES_CHANNEL}")
+            self.cache.clear()
+            self.connected = True
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.poll_seconds)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        apply_product_changes(self.cache, conn.notifies.pop(0).payload)
+        finally:
+            self.connected = False
+            conn.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.listen_once()
+            except Exception:
+                metrics.incr("product_cache_listener_reconnects")
+                logger.exception("Product cache listener failed; reconnecting")
+                self._stop.wait(self.retry_seconds)
+
+    def stats(self) -> Dict[str, float]:
+        if not self.cache.enabled:
+            return {}
+        return {"product_cache_listener_connected": int(self.connected)}
+
+
+product_cache_listener = ProductCacheListener(product_cache)
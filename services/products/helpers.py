@@ -0,0 +1,35 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from .queries import PRODUCT_PAGE_KEYS
+
+
+# Cursors carry the sort they were made for, so one cannot be replayed
+# against a listing ordered on a different key.
+def encode_cursor(row: Dict[str, Any], sort: str) -> str:
+    raw = json.dumps([sort, *(row[k[0]] for k in PRODUCT_PAGE_KEYS[sort])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], sort: str) -> Optional[Tuple[Any, ...]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, *after = json.loads(raw)
+        if cursor_sort != sort or len(after) != len(PRODUCT_PAGE_KEYS[sort]):
+            raise ValueError()
+        if sort == "name" and not isinstance(after[0], str):
+            raise ValueError()
+        after[-1] = int(after[-1])
+        return tuple(after)
+    except (ValueError, TypeError):
+        raise ValueError("INVALID_CURSOR")
+
+
+def products_page(rows: List[Dict[str, Any]], limit: int, sort: str) -> Dict[str, Any]:
+    # Callers fetch limit + 1 rows; the extra row only signals another page.
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1], sort) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
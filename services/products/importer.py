@@ -0,0 +1,254 @@
+import csv
+import io
+import json
+import tempfile
+from typing import IO, Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import anyio.from_thread
+from pydantic import ValidationError
+
+from shared.config import PRODUCT_IMPORT_MAX_ERRORS
+from shared.db import request_db
+from shared.product_events import (
+    NOTIFY_MAX_IDS,
+    PRODUCT_CHANGES_ENABLED,
+    notify_product_changes,
+)
+
+from .cache import product_cache
+from .models import ProductCreate
+from .queries import (
+    ANALYZE_PRODUCT_IMPORT_ROWS,
+    COPY_PRODUCT_IMPORT_ROWS,
+    COUNT_PRODUCT_IMPORT_DUPLICATES,
+    CREATE_PRODUCT_IMPORT_CHANGED,
+    CREATE_PRODUCT_IMPORT_ROWS,
+    LOCK_IMPORTED_PRODUCTS,
+    RESET_IMPORTED_STOCK_BUCKETS,
+    SELECT_PRODUCT_IMPORT_CHANGED,
+    SELECT_PRODUCT_IMPORT_DUPLICATES,
+    UPSERT_IMPORTED_PRODUCTS,
+)
+
+# Content type of the request body -> parser.
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+IMPORT_FIELDS = set(ProductCreate.model_fields)
+REQUIRED_FIELDS = {name for name, f in ProductCreate.model_fields.items() if f.is_required()}
+
+# Validated rows are kept in memory up to this size, then on disk.
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# (line, decoded row, error) per input row; rows that cannot even be
+# decoded carry the error instead.
+Record = Tuple[int, Any, Optional[str]]
+
+
+def iter_async_chunks(chunks: AsyncIterator[bytes]) -> Iterator[bytes]:
+    # Lets a worker thread started by run_in_threadpool read a request body
+    # as it arrives.
+    while True:
+        try:
+            yield anyio.from_thread.run(chunks.__anext__)
+        except StopAsyncIteration:
+            return
+
+
+class ChunkReader(io.RawIOBase):
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def csv_records(text: IO[str]) -> Iterator[Record]:
+    reader = csv.DictReader(text)
+    header = set(reader.fieldnames or [])
+    if not REQUIRED_FIELDS <= header or not header <= IMPORT_FIELDS:
+        raise ValueError(
+            f"CSV header must name the columns {sorted(REQUIRED_FIELDS)}"
+            f" and may add {sorted(IMPORT_FIELDS - REQUIRED_FIELDS)}"
+        )
+    for row in reader:
+        if None in row:
+            yield reader.line_num, row, "row has more fields than the header"
+            continue
+        # Empty cells take the ProductCreate default.
+        yield reader.line_num, {k: v for k, v in row.items() if v not in ("", None)}, None
+
+
+def ndjson_records(text: IO[str]) -> Iterator[Record]:
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw), None
+        except ValueError as e:
+            yield line, None, f"invalid JSON: {e}"
+
+
+def copy_text(value: Any) -> str:
+    # One field in COPY text format.
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def validation_detail(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}"
+        for err in e.errors()
+    )
+
+
+def spool_rows(
+    records: Iterable[Record], spool: IO[str], errors: List[Dict[str, Any]], max_errors: int
+) -> Tuple[int, int]:
+    # Writes the rows that pass ProductCreate validation to `spool` as COPY
+    # text and returns (valid, rejected).
+    valid = rejected = 0
+    for line, data, error in records:
+        product = None
+        if error is None:
+            try:
+                product = ProductCreate.model_validate(data)
+            except ValidationError as e:
+                error = validation_detail(e)
+        if product is not None and "\x00" in f"{product.sku}{product.name}{product.description}":
+            error = "text fields cannot contain NUL characters"
+        if error is not None:
+            rejected += 1
+            if len(errors) < max_errors:
+                sku = data.get("sku") if isinstance(data, dict) else None
+                errors.append(
+                    {
+                        "line": line,
+                        "sku": sku if isinstance(sku, str) else None,
+                        "code": "INVALID_ROW",
+                        "detail": error,
+                    }
+                )
+            continue
+        fields = (
+            line,
+            product.sku,
+            product.name,
+            product.description,
+            product.price_cents,
+            product.stock_quantity,
+            product.is_active,
+        )
+        spool.write("\t".join(copy_text(v) for v in fields) + "\n")
+        valid += 1
+    return valid, rejected
+
+
+def notify_imported_changes(conn) -> None:
+    # Changed ids are streamed from the server so memory stays flat however
+    # many products the import touched.
+    with conn.cursor(name="product_import_changed") as cur:
+        cur.itersize = NOTIFY_MAX_IDS
+        cur.execute(SELECT_PRODUCT_IMPORT_CHANGED)
+        while True:
+            rows = cur.fetchmany(NOTIFY_MAX_IDS)
+            if not rows:
+                return
+            product_ids = [r["product_id"] for r in rows]
+            notify_product_changes(conn, product_ids)
+            product_cache.invalidate(*product_ids)
+
+
+def upsert_products(
+    conn, spool: IO[str], errors: List[Dict[str, Any]], max_errors: int
+) -> Dict[str, int]:
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_PRODUCT_IMPORT_ROWS)
+            cur.execute(CREATE_PRODUCT_IMPORT_CHANGED)
+            cur.copy_expert(COPY_PRODUCT_IMPORT_ROWS, spool)
+            cur.execute(ANALYZE_PRODUCT_IMPORT_ROWS)
+
+            cur.execute(COUNT_PRODUCT_IMPORT_DUPLICATES)
+            duplicates = cur.fetchone()["duplicates"]
+            if duplicates and len(errors) < max_errors:
+                cur.execute(SELECT_PRODUCT_IMPORT_DUPLICATES, (max_errors - len(errors),))
+                errors.extend(
+                    {
+                        "line": r["line"],
+                        "sku": r["sku"],
+                        "code": "DUPLICATE_SKU",
+                        "detail": "a later row has the same SKU",
+                    }
+                    for r in cur.fetchall() or []
+                )
+
+            cur.execute(LOCK_IMPORTED_PRODUCTS)
+            cur.execute(UPSERT_IMPORTED_PRODUCTS)
+            counts = cur.fetchone()
+            if counts["updated"]:
+                cur.execute(RESET_IMPORTED_STOCK_BUCKETS)
+        if counts["updated"] and PRODUCT_CHANGES_ENABLED:
+            notify_imported_changes(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["products"] - counts["inserted"] - counts["updated"],
+        "duplicates": duplicates,
+    }
+
+
+# POST /products:import. Rows are validated as they stream in and spooled,
+# so memory stays bounded and no database connection is held while the
+# client uploads; the load itself is one transaction.
+def import_products(
+    chunks: Iterable[bytes], fmt: str, max_errors: int = PRODUCT_IMPORT_MAX_ERRORS
+) -> Dict[str, Any]:
+    text = io.TextIOWrapper(
+        io.BufferedReader(ChunkReader(chunks)), encoding="utf-8-sig", newline=""
+    )
+    records = csv_records(text) if fmt == "csv" else ndjson_records(text)
+    errors: List[Dict[str, Any]] = []
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+    with tempfile.SpooledTemporaryFile(SPOOL_MAX_BYTES, mode="w+", encoding="utf-8") as spool:
+        valid, rejected = spool_rows(records, spool, errors, max_errors)
+        if valid:
+            spool.seek(0)
+            with request_db() as conn:
+                counts = upsert_products(conn, spool, errors, max_errors)
+    errors.sort(key=lambda e: e["line"])
+    return {
+        "inserted": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "rejected": rejected + counts["duplicates"],
+        "errors": errors,
+    }
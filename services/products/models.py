@@ -1,15 +1,18 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Largest value of a Postgres INTEGER column.
+MAX_INTEGER = 2**31 - 1
 
 
 class ProductCreate(BaseModel):
     sku: str
     name: str
     description: Optional[str] = None
-    price_cents: int
-    stock_quantity: int
+    price_cents: int = Field(..., ge=0, le=MAX_INTEGER)
+    stock_quantity: int = Field(..., ge=0, le=MAX_INTEGER)
     is_active: bool = True
 
 
@@ -29,5 +32,62 @@ class ProductOut(BaseModel):
     price_cents: int
     stock_quantity: int
     is_active: bool
+    stock_buckets: int = 0
     created_at: datetime
     updated_at: datetime
+
+
+class ProductPageOut(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[str] = None
+
+
+class ProductMultiGetOut(BaseModel):
+    products: List[ProductOut]
+    missing: List[int]
+
+
+class StockBucketsUpdate(BaseModel):
+    buckets: int = Field(..., ge=0, le=64)
+
+
+class ProductImportError(BaseModel):
+    line: int
+    sku: Optional[str] = None
+    code: str
+    detail: Optional[str] = None
+
+
+class ProductImportOut(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    rejected: int
+    errors: List[ProductImportError]
+
+
+class StockAdjustment(BaseModel):
+    # Exactly one of id / sku, and one of an absolute quantity / a delta.
+    id: Optional[int] = None
+    sku: Optional[str] = None
+    quantity: Optional[int] = Field(None, ge=0, le=MAX_INTEGER)
+    delta: Optional[int] = Field(None, ge=-MAX_INTEGER, le=MAX_INTEGER)
+
+
+class StockBatchUpdate(BaseModel):
+    items: List[StockAdjustment]
+
+
+class StockBatchResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    sku: Optional[str] = None
+    previous_stock_quantity: Optional[int] = None
+    stock_quantity: Optional[int] = None
+    error: Optional[str] = None
+
+
+class StockBatchOut(BaseModel):
+    updated: int
+    failed: int
+    results: List[StockBatchResult]
@@ -0,0 +1,392 @@
+from typing import Any, List, Optional, Tuple
+
+# Bucketed products report their total stock: the central quantity plus the
+# sum of their stock buckets.
+PRODUCT_STOCK_TOTAL = """
+    CASE
+        WHEN products.stock_buckets > 0 THEN products.stock_quantity + COALESCE(
+            (
+                SELECT SUM(b.quantity)
+                FROM product_stock_buckets b
+                WHERE b.product_id = products.id
+            ),
+            0
+        )
+        ELSE products.stock_quantity
+    END
+"""
+
+PRODUCT_COLUMNS = f"""
+    id, sku, name, description, price_cents,
+    {PRODUCT_STOCK_TOTAL} AS stock_quantity,
+    is_active, stock_buckets, created_at, updated_at
+"""
+
+INSERT_PRODUCT = f"""
+    INSERT INTO products (sku, name, description, price_cents, stock_quantity, is_active)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING {PRODUCT_COLUMNS}
+"""
+
+SELECT_PRODUCT_BY_ID = f"""
+    SELECT {PRODUCT_COLUMNS}
+    FROM products
+    WHERE id = %s
+"""
+
+SELECT_PRODUCT_BY_SKU = f"""
+    SELECT {PRODUCT_COLUMNS}
+    FROM products
+    WHERE sku = %s
+"""
+
+SELECT_PRODUCTS_BY_IDS = f"""
+    SELECT {PRODUCT_COLUMNS}
+    FROM products
+    WHERE id = ANY(%s)
+"""
+
+RESET_STOCK_BUCKETS = """
+    UPDATE product_stock_buckets
+    SET quantity = 0
+    WHERE product_id = %s AND quantity <> 0
+"""
+
+DELETE_STOCK_BUCKETS = """
+    DELETE FROM product_stock_buckets
+    WHERE product_id = %s
+"""
+
+INSERT_STOCK_BUCKETS = """
+    INSERT INTO product_stock_buckets (product_id, bucket, quantity)
+    SELECT %s, t.bucket - 1, t.quantity
+    FROM unnest(%s::int[]) WITH ORDINALITY AS t(quantity, bucket)
+"""
+
+UPDATE_PRODUCT_STOCK_LAYOUT = f"""
+    UPDATE products
+    SET stock_quantity = %s, stock_buckets = %s, updated_at = now()
+    WHERE id = %s
+    RETURNING {PRODUCT_COLUMNS}
+"""
+
+DELETE_PRODUCT = """
+    DELETE FROM products
+    WHERE id = %s
+"""
+
+SELECT_PRODUCT_IDS_BY_SKUS = """
+    SELECT id, sku
+    FROM products
+    WHERE sku = ANY(%s)
+"""
+
+# One chunk of POST /products/stock:batch. Unbucketed products are locked in
+# id order, as the orders service locks them, and each gets either an absolute
+# quantity or a delta; rows that would leave the INTEGER range are not
+# applied. NO KEY UPDATE still excludes other stock writers but lets orders
+# insert items (whose foreign key check takes KEY SHARE) meanwhile. Bucketed
+# products are only reported, to be adjusted one by one after this.
+APPLY_STOCK_ADJUSTMENTS = """
+    WITH a AS (
+        SELECT product_id, quantity, delta
+        FROM unnest(%s::bigint[], %s::int[], %s::int[]) AS a(product_id, quantity, delta)
+    ),
+    locked AS MATERIALIZED (
+        SELECT p.id, p.stock_quantity
+        FROM products p
+        JOIN a ON a.product_id = p.id
+        WHERE p.stock_buckets = 0
+        ORDER BY p.id
+        FOR NO KEY UPDATE OF p
+    ),
+    target AS (
+        SELECT l.id, COALESCE(a.quantity, l.stock_quantity::bigint + a.delta) AS stock_quantity
+        FROM locked l
+        JOIN a ON a.product_id = l.id
+    ),
+    updated AS (
+        UPDATE products p
+        SET stock_quantity = t.stock_quantity, updated_at = now()
+        FROM target t
+        WHERE p.id = t.id AND t.stock_quantity BETWEEN 0 AND 2147483647
+        RETURNING p.id, p.stock_quantity
+    )
+    SELECT
+        p.id AS product_id,
+        p.stock_buckets > 0 AS bucketed,
+        l.stock_quantity AS previous_stock_quantity,
+        u.stock_quantity,
+        u.id IS NOT NULL AS applied
+    FROM products p
+    JOIN a ON a.product_id = p.id
+    LEFT JOIN locked l ON l.id = p.id
+    LEFT JOIN updated u ON u.id = p.id
+"""
+
+# POST /products:import loads validated rows into a temporary table with COPY
+# and upserts them from there in one statement. Both tables go away at commit.
+CREATE_PRODUCT_IMPORT_ROWS = """
+    CREATE TEMP TABLE product_import_rows (
+        line           BIGINT NOT NULL,
+        sku            TEXT NOT NULL,
+        name           TEXT NOT NULL,
+        description    TEXT,
+        price_cents    INTEGER NOT NULL,
+        stock_quantity INTEGER NOT NULL,
+        is_active      BOOLEAN NOT NULL
+    ) ON COMMIT DROP
+"""
+
+CREATE_PRODUCT_IMPORT_CHANGED = """
+    CREATE TEMP TABLE product_import_changed (
+        product_id    BIGINT NOT NULL,
+        stock_buckets INTEGER NOT NULL
+    ) ON COMMIT DROP
+"""
+
+COPY_PRODUCT_IMPORT_ROWS = """
+    COPY product_import_rows
+        (line, sku, name, description, price_cents, stock_quantity, is_active)
+    FROM STDIN
+"""
+
+ANALYZE_PRODUCT_IMPORT_ROWS = "ANALYZE product_import_rows"
+
+COUNT_PRODUCT_IMPORT_DUPLICATES = """
+    SELECT count(*) - count(DISTINCT sku) AS duplicates
+    FROM product_import_rows
+"""
+
+# Every row of a repeated SKU but its last one.
+SELECT_PRODUCT_IMPORT_DUPLICATES = """
+    SELECT line, sku
+    FROM (
+        SELECT line, sku, row_number() OVER (PARTITION BY sku ORDER BY line DESC) AS rn
+        FROM product_import_rows
+    ) r
+    WHERE rn > 1
+    ORDER BY line
+    LIMIT %s
+"""
+
+# Locks the products being updated in id order, the order the orders service
+# locks them in, before the upsert touches them in SKU order. NO KEY UPDATE,
+# as in shared.inventory: orders holding a bucket the import resets still
+# insert items, whose foreign key check takes KEY SHARE on the product. The
+# upsert never changes sku or id, so it needs nothing stronger.
+LOCK_IMPORTED_PRODUCTS = """
+    SELECT count(*) AS locked
+    FROM (
+        SELECT id
+        FROM products
+        WHERE sku IN (SELECT sku FROM product_import_rows)
+        ORDER BY id
+        FOR NO KEY UPDATE
+    ) locked
+"""
+
+# The last row of each SKU wins. Rows identical to the product are not
+# rewritten; bucketed products always are, their stock being reset to the
+# imported quantity as PUT /products/{id} does.
+UPSERT_IMPORTED_PRODUCTS = """
+    WITH latest AS (
+        SELECT DISTINCT ON (sku) sku, name, description, price_cents, stock_quantity, is_active
+        FROM product_import_rows
+        ORDER BY sku, line DESC
+    ),
+    upserted AS (
+        INSERT INTO products AS p
+            (sku, name, description, price_cents, stock_quantity, is_active)
+        SELECT sku, name, description, price_cents, stock_quantity, is_active
+        FROM latest
+        ON CONFLICT (sku) DO UPDATE
+        SET name = EXCLUDED.name,
+            description = EXCLUDED.description,
+            price_cents = EXCLUDED.price_cents,
+            stock_quantity = EXCLUDED.stock_quantity,
+            is_active = EXCLUDED.is_active,
+            updated_at = now()
+        WHERE (p.name, p.description, p.price_cents, p.stock_quantity, p.is_active, p.stock_buckets)
+            IS DISTINCT FROM (
+                EXCLUDED.name, EXCLUDED.description, EXCLUDED.price_cents,
+                EXCLUDED.stock_quantity, EXCLUDED.is_active, 0
+            )
+        RETURNING p.id, p.stock_buckets, p.xmax = 0 AS inserted
+    ),
+    changed AS (
+        INSERT INTO product_import_changed (product_id, stock_buckets)
+        SELECT id, stock_buckets FROM upserted WHERE NOT inserted
+    )
+    SELECT
+        count(*) FILTER (WHERE inserted) AS inserted,
+        count(*) FILTER (WHERE NOT inserted) AS updated,
+        (SELECT count(*) FROM latest) AS products
+    FROM upserted
+"""
+
+RESET_IMPORTED_STOCK_BUCKETS = """
+    UPDATE product_stock_buckets b
+    SET quantity = 0
+    FROM product_import_changed c
+    WHERE b.product_id = c.product_id AND c.stock_buckets > 0 AND b.quantity <> 0
+"""
+
+SELECT_PRODUCT_IMPORT_CHANGED = "SELECT product_id FROM product_import_changed"
+
+
+def build_update_product(
+    product_id: int,
+    name: Optional[str],
+    description: Optional[str],
+    price_cents: Optional[int],
+    stock_quantity: Optional[int],
+    is_active: Optional[bool],
+) -> Optional[Tuple[str, Tuple[Any, ...]]]:
+    fields = []
+    params: List[Any] = []
+
+    if name is not None:
+        fields.append("name = %s")
+        params.append(name)
+    if description is not None:
+        fields.append("description = %s")
+        params.append(description)
+    if price_cents is not None:
+        fields.append("price_cents = %s")
+        params.append(price_cents)
+    if stock_quantity is not None:
+        fields.append("stock_quantity = %s")
+        params.append(stock_quantity)
+    if is_active is not None:
+        fields.append("is_active = %s")
+        params.append(is_active)
+
+    if not fields:
+        return None
+    params.append(product_id)
+
+    sql = f"""
+        UPDATE products
+        SET {", ".join(fields)}, updated_at = now()
+        WHERE id = %s
+        RETURNING {PRODUCT_COLUMNS}
+    """
+    return sql, tuple(params)
+
+
+# Bucketed products count as in stock while any of their buckets is.
+PRODUCT_IN_STOCK = """
+    (
+        products.stock_quantity > 0
+        OR products.stock_buckets > 0 AND EXISTS (
+            SELECT 1
+            FROM product_stock_buckets b
+            WHERE b.product_id = products.id AND b.quantity > 0
+        )
+    )
+"""
+
+PRODUCT_NAME_KEY = 'lower(name) COLLATE "C"'
+
+# sort -> (row field, SQL expression, placeholder) per key of a GET /products
+# listing. Pages seek past the last row of the previous one with a row
+# comparison, through the primary key or idx_products_name_id.
+PRODUCT_PAGE_KEYS = {
+    "id": [("id", "id", "%s")],
+    "name": [("name", PRODUCT_NAME_KEY, 'lower(%s) COLLATE "C"'), ("id", "id", "%s")],
+}
+
+
+def like_prefix(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+# Each search has its index in 0007_product_listing_indexes: sku prefixes the
+# pattern-ops one, name prefixes idx_products_name_id and q the trigram ones.
+def build_list_products(
+    limit: int,
+    after: Optional[Tuple[Any, ...]] = None,
+    sort: str = "id",
+    is_active: Optional[bool] = None,
+    min_price_cents: Optional[int] = None,
+    max_price_cents: Optional[int] = None,
+    in_stock: Optional[bool] = None,
+    sku: Optional[str] = None,
+    name: Optional[str] = None,
+    q: Optional[str] = None,
+) -> Tuple[str, Tuple[Any, ...]]:
+    conditions = []
+    params: List[Any] = []
+
+    if is_active is not None:
+        conditions.append("is_active = %s")
+        params.append(is_active)
+    if min_price_cents is not None:
+        conditions.append("price_cents >= %s")
+        params.append(min_price_cents)
+    if max_price_cents is not None:
+        conditions.append("price_cents <= %s")
+        params.append(max_price_cents)
+    if in_stock is not None:
+        conditions.append(PRODUCT_IN_STOCK if in_stock else f"NOT {PRODUCT_IN_STOCK}")
+    if sku is not None:
+        conditions.append("sku LIKE %s")
+        params.append(like_prefix(sku))
+    if name is not None:
+        conditions.append(f"{PRODUCT_NAME_KEY} LIKE lower(%s)")
+        params.append(like_prefix(name))
+    if q is not None:
+        conditions.append("(sku ILIKE %s OR name ILIKE %s)")
+        params.extend(["%" + like_prefix(q)] * 2)
+
+    keys = PRODUCT_PAGE_KEYS[sort]
+    if after is not None:
+        conditions.append(
+            f"({', '.join(k[1] for k in keys)}) > ({', '.join(k[2] for k in keys)})"
+        )
+        params.extend(after)
+    sql = f"""
+        SELECT {PRODUCT_COLUMNS}
+        FROM products
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY {", ".join(k[1] for k in keys)}
+        LIMIT %s
+    """
+    return sql, (*params, limit)
+
+
+# Plans checked by `python -m shared.migrate --check` against seeded data.
+EXPLAIN_CHECKS = [
+    ("select_product_by_id", lambda s: (SELECT_PRODUCT_BY_ID, (s["product_id"],))),
+    ("select_product_by_sku", lambda s: (SELECT_PRODUCT_BY_SKU, (s["sku"],))),
+    ("select_products_by_ids", lambda s: (SELECT_PRODUCTS_BY_IDS, (s["product_ids"],))),
+    ("select_product_ids_by_skus", lambda s: (SELECT_PRODUCT_IDS_BY_SKUS, ([s["sku"]],))),
+    (
+        "apply_stock_adjustments",
+        lambda s: (
+            APPLY_STOCK_ADJUSTMENTS,
+            (s["product_ids"], [None] * len(s["product_ids"]), [1] * len(s["product_ids"])),
+        ),
+    ),
+    (
+        "update_product_stock_layout",
+        lambda s: (UPDATE_PRODUCT_STOCK_LAYOUT, (0, 0, s["product_id"])),
+    ),
+    ("delete_product", lambda s: (DELETE_PRODUCT, (s["product_id"],))),
+    ("list_products", lambda s: build_list_products(50, (s["product_id"],))),
+    (
+        "list_products_by_name",
+        lambda s: build_list_products(50, ("Explain check", s["product_id"]), sort="name"),
+    ),
+    (
+        "list_products_by_price",
+        lambda s: build_list_products(50, min_price_cents=100, max_price_cents=101),
+    ),
+    ("search_products_by_sku", lambda s: build_list_products(50, sku=s["sku"])),
+    (
+        "search_products_by_name",
+        lambda s: build_list_products(50, sort="name", name="explain ch"),
+    ),
+    ("search_products_by_text", lambda s: build_list_products(50, q=s["sku"])),
+]
@@ -0,0 +1,66 @@
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from shared.config import INVENTORY_REBALANCE_INTERVAL_SECONDS
+from shared.db import lifespan as db_lifespan
+from shared.db import pooled_conn
+from shared.inventory import list_bucketed_products
+
+from .cache import product_cache_listener
+from .service import rebalance_product_stock
+
+logger = logging.getLogger(__name__)
+
+
+class StockRebalancer:
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stock-rebalancer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds + 5)
+            self._thread = None
+
+    def run_once(self) -> int:
+        rebalanced = 0
+        with pooled_conn() as conn:
+            for product_id in list_bucketed_products(conn):
+                if rebalance_product_stock(conn, product_id):
+                    rebalanced += 1
+        return rebalanced
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Stock rebalance pass failed")
+
+
+rebalancer = StockRebalancer(INVENTORY_REBALANCE_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app) -> AsyncIterator[None]:
+    async with db_lifespan(app):
+        rebalancer.start()
+        product_cache_listener.start()
+        try:
+            yield
+        finally:
+            product_cache_listener.stop()
+            rebalancer.stop()
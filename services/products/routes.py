@@ -1,17 +1,49 @@
-from fastapi import APIRouter, HTTPException
+from typing import List, Literal, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from psycopg2.errors import IntegrityError, UniqueViolation
+from starlette.concurrency import run_in_threadpool
 
-from shared.db import get_conn
+from shared.config import (
+    PRODUCT_PAGE_DEFAULT_SIZE,
+    PRODUCT_PAGE_MAX_SIZE,
+    PRODUCT_STOCK_BATCH_CHUNK_SIZE,
+    PRODUCT_STOCK_BATCH_MAX_SIZE,
+)
+from shared.db import get_db, request_db
+from shared.multiget import requested_ids
 
-from .models import ProductCreate, ProductOut, ProductUpdate
-from .service import create_product, delete_product, get_product_by_id, update_product
+from .cache import body_has_sku, product_cache, product_json, sku_key
+from .importer import IMPORT_FORMATS, import_products, iter_async_chunks
+from .models import (
+    ProductCreate,
+    ProductImportOut,
+    ProductMultiGetOut,
+    ProductOut,
+    ProductPageOut,
+    ProductUpdate,
+    StockBatchOut,
+    StockBatchUpdate,
+    StockBucketsUpdate,
+)
+from .service import (
+    adjust_stock_batch,
+    create_product,
+    delete_product,
+    get_product_by_id,
+    get_product_by_sku,
+    get_products_by_ids,
+    list_products,
+    rebalance_product_stock,
+    set_stock_buckets,
+    update_product,
+)
 
 router = APIRouter()
 
 
 @router.post("/products", response_model=ProductOut, status_code=201)
-def create_product_endpoint(payload: ProductCreate):
-    conn = get_conn()
+def create_product_endpoint(payload: ProductCreate, conn=Depends(get_db)):
     try:
         return create_product(
             conn,
@@ -25,45 +57,143 @@ def create_product_endpoint(payload: ProductCreate):
     except UniqueViolation:
         conn.rollback()
         raise HTTPException(status_code=409, detail="SKU already exists")
-    finally:
-        conn.close()
 
 
-@router.get("/products/{product_id}", response_model=ProductOut)
-def get_product_endpoint(product_id: int):
-    conn = get_conn()
+# Async so the body can be read as it streams in; parsing and the load run on
+# a worker thread against the sync pool.
+@router.post("/products:import", response_model=ProductImportOut)
+async def import_products_endpoint(request: Request):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = IMPORT_FORMATS.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type must be one of {', '.join(IMPORT_FORMATS)}",
+        )
     try:
-        row = get_product_by_id(conn, product_id)
-        if not row:
-            raise HTTPException(status_code=404, detail="Product not found")
-        return row
-    finally:
-        conn.close()
+        return await run_in_threadpool(import_products, iter_async_chunks(request.stream()), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.put("/products/{product_id}", response_model=ProductOut)
-def update_product_endpoint(product_id: int, payload: ProductUpdate):
-    conn = get_conn()
+@router.post(
+    "/products/stock:batch", response_model=StockBatchOut, response_model_exclude_none=True
+)
+def adjust_stock_batch_endpoint(payload: StockBatchUpdate, conn=Depends(get_db)):
+    if len(payload.items) > PRODUCT_STOCK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"Batch exceeds {PRODUCT_STOCK_BATCH_MAX_SIZE} items"
+        )
+    results = adjust_stock_batch(
+        conn, [i.model_dump() for i in payload.items], PRODUCT_STOCK_BATCH_CHUNK_SIZE
+    )
+    failed = sum(1 for r in results if "error" in r)
+    return {"updated": len(results) - failed, "failed": failed, "results": results}
+
+
+@router.get("/products", response_model=Union[ProductPageOut, ProductMultiGetOut])
+def get_products_endpoint(
+    is_active: Optional[bool] = Query(None),
+    min_price_cents: Optional[int] = Query(None, ge=0),
+    max_price_cents: Optional[int] = Query(None, ge=0),
+    in_stock: Optional[bool] = Query(None, description="true: stock above 0, false: none"),
+    sku: Optional[str] = Query(None, min_length=1, description="SKU prefix"),
+    name: Optional[str] = Query(None, min_length=1, description="Name prefix, any case"),
+    q: Optional[str] = Query(None, min_length=3, description="Text in the SKU or name"),
+    sort: Literal["id", "name"] = Query("id"),
+    limit: int = Query(PRODUCT_PAGE_DEFAULT_SIZE, ge=1, le=PRODUCT_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    ids: Optional[List[str]] = Query(None, description="Comma-separated product ids"),
+    conn=Depends(get_db),
+):
+    if ids is not None:
+        return get_products_by_ids(conn, requested_ids(ids))
     try:
-        row = update_product(
+        return list_products(
             conn,
-            product_id,
-            payload.name,
-            payload.description,
-            payload.price_cents,
-            payload.stock_quantity,
-            payload.is_active,
+            limit,
+            cursor,
+            sort,
+            is_active=is_active,
+            min_price_cents=min_price_cents,
+            max_price_cents=max_price_cents,
+            in_stock=in_stock,
+            sku=sku,
+            name=name,
+            q=q,
         )
-        if not row:
-            raise HTTPException(status_code=404, detail="Product not found")
-        return row
-    finally:
-        conn.close()
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
+
+
+def cached_product(product_id: int) -> Optional[bytes]:
+    # A pooled connection is only checked out on a cache miss.
+    def load():
+        with request_db() as conn:
+            return product_json(get_product_by_id(conn, product_id))
+
+    return product_cache.load(product_id, load)
+
+
+@router.get("/products/by-sku/{sku}", response_model=ProductOut)
+def get_product_by_sku_endpoint(sku: str):
+    product_id = product_cache.get(sku_key(sku))
+    if product_id is not None:
+        body = cached_product(product_id)
+        if body_has_sku(body, sku):
+            return Response(content=body, media_type="application/json")
+        product_cache.invalidate(sku_key(sku))
+    with request_db() as conn:
+        row = get_product_by_sku(conn, sku)
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product_cache.set(sku_key(sku), row["id"])
+    return Response(content=product_json(row), media_type="application/json")
+
+
+@router.get("/products/{product_id}", response_model=ProductOut)
+def get_product_endpoint(product_id: int):
+    body = cached_product(product_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return Response(content=body, media_type="application/json")
+
+
+@router.put("/products/{product_id}", response_model=ProductOut)
+def update_product_endpoint(product_id: int, payload: ProductUpdate, conn=Depends(get_db)):
+    row = update_product(
+        conn,
+        product_id,
+        payload.name,
+        payload.description,
+        payload.price_cents,
+        payload.stock_quantity,
+        payload.is_active,
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return row
+
+
+@router.put("/products/{product_id}/stock-buckets", response_model=ProductOut)
+def set_stock_buckets_endpoint(
+    product_id: int, payload: StockBucketsUpdate, conn=Depends(get_db)
+):
+    row = set_stock_buckets(conn, product_id, payload.buckets)
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return row
+
+
+@router.post("/products/{product_id}/stock-buckets/rebalance")
+def rebalance_stock_buckets_endpoint(product_id: int, conn=Depends(get_db)):
+    return {"product_id": product_id, "rebalanced": rebalance_product_stock(conn, product_id)}
 
 
 @router.delete("/products/{product_id}", status_code=204)
-def delete_product_endpoint(product_id: int):
-    conn = get_conn()
+def delete_product_endpoint(product_id: int, conn=Depends(get_db)):
     try:
         deleted = delete_product(conn, product_id)
         if not deleted:
@@ -71,5 +201,3 @@ def delete_product_endpoint(product_id: int):
     except IntegrityError:
         conn.rollback()
         raise HTTPException(status_code=409, detail="Product is referenced by orders")
-    finally:
-        conn.close()
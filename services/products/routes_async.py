@@ -0,0 +1,143 @@
+from typing import List, Literal, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from psycopg.errors import IntegrityError, UniqueViolation
+
+from shared.config import PRODUCT_PAGE_DEFAULT_SIZE, PRODUCT_PAGE_MAX_SIZE
+from shared.db import async_request_db, get_async_db
+from shared.multiget import requested_ids
+
+from .cache import body_has_sku, product_cache, product_json, sku_key
+from .models import (
+    ProductCreate,
+    ProductMultiGetOut,
+    ProductOut,
+    ProductPageOut,
+    ProductUpdate,
+)
+from .service_async import (
+    create_product,
+    delete_product,
+    get_product_by_id,
+    get_product_by_sku,
+    get_products_by_ids,
+    list_products,
+    update_product,
+)
+
+router = APIRouter()
+
+
+@router.post("/products", response_model=ProductOut, status_code=201)
+async def create_product_endpoint(payload: ProductCreate, conn=Depends(get_async_db)):
+    try:
+        return await create_product(
+            conn,
+            payload.sku,
+            payload.name,
+            payload.description,
+            payload.price_cents,
+            payload.stock_quantity,
+            payload.is_active,
+        )
+    except UniqueViolation:
+        await conn.rollback()
+        raise HTTPException(status_code=409, detail="SKU already exists")
+
+
+@router.get("/products", response_model=Union[ProductPageOut, ProductMultiGetOut])
+async def get_products_endpoint(
+    is_active: Optional[bool] = Query(None),
+    min_price_cents: Optional[int] = Query(None, ge=0),
+    max_price_cents: Optional[int] = Query(None, ge=0),
+    in_stock: Optional[bool] = Query(None, description="true: stock above 0, false: none"),
+    sku: Optional[str] = Query(None, min_length=1, description="SKU prefix"),
+    name: Optional[str] = Query(None, min_length=1, description="Name prefix, any case"),
+    q: Optional[str] = Query(None, min_length=3, description="Text in the SKU or name"),
+    sort: Literal["id", "name"] = Query("id"),
+    limit: int = Query(PRODUCT_PAGE_DEFAULT_SIZE, ge=1, le=PRODUCT_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    ids: Optional[List[str]] = Query(None, description="Comma-separated product ids"),
+    conn=Depends(get_async_db),
+):
+    if ids is not None:
+        return await get_products_by_ids(conn, requested_ids(ids))
+    try:
+        return await list_products(
+            conn,
+            limit,
+            cursor,
+            sort,
+            is_active=is_active,
+            min_price_cents=min_price_cents,
+            max_price_cents=max_price_cents,
+            in_stock=in_stock,
+            sku=sku,
+            name=name,
+            q=q,
+        )
+    except ValueError as e:
+        if str(e) == "INVALID_CURSOR":
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        raise
+
+
+async def cached_product(product_id: int) -> Optional[bytes]:
+    async def load():
+        async with async_request_db() as conn:
+            return product_json(await get_product_by_id(conn, product_id))
+
+    return await product_cache.load_async(product_id, load)
+
+
+@router.get("/products/by-sku/{sku}", response_model=ProductOut)
+async def get_product_by_sku_endpoint(sku: str):
+    product_id = product_cache.get(sku_key(sku))
+    if product_id is not None:
+        body = await cached_product(product_id)
+        if body_has_sku(body, sku):
+            return Response(content=body, media_type="application/json")
+        product_cache.invalidate(sku_key(sku))
+    async with async_request_db() as conn:
+        row = await get_product_by_sku(conn, sku)
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    product_cache.set(sku_key(sku), row["id"])
+    return Response(content=product_json(row), media_type="application/json")
+
+
+@router.get("/products/{product_id}", response_model=ProductOut)
+async def get_product_endpoint(product_id: int):
+    body = await cached_product(product_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return Response(content=body, media_type="application/json")
+
+
+@router.put("/products/{product_id}", response_model=ProductOut)
+async def update_product_endpoint(
+    product_id: int, payload: ProductUpdate, conn=Depends(get_async_db)
+):
+    row = await update_product(
+        conn,
+        product_id,
+        payload.name,
+        payload.description,
+        payload.price_cents,
+        payload.stock_quantity,
+        payload.is_active,
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return row
+
+
+@router.delete("/products/{product_id}", status_code=204)
+async def delete_product_endpoint(product_id: int, conn=Depends(get_async_db)):
+    try:
+        deleted = await delete_product(conn, product_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Product not found")
+    except IntegrityError:
+        await conn.rollback()
+        raise HTTPException(status_code=409, detail="Product is referenced by orders")
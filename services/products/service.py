@@ -1,4 +1,39 @@
-from typing import Any, Dict, List, Optional
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.db import retry_on_conflict
+from shared.inventory import (
+    distribute,
+    lock_product_stock,
+    rebalance_stock_buckets,
+    write_stock_total,
+)
+from shared.multiget import order_by_ids
+from shared.product_events import notify_product_changes
+
+from .cache import product_cache
+from .helpers import decode_cursor, products_page
+from .models import MAX_INTEGER
+from .queries import (
+    APPLY_STOCK_ADJUSTMENTS,
+    DELETE_PRODUCT,
+    DELETE_STOCK_BUCKETS,
+    INSERT_PRODUCT,
+    INSERT_STOCK_BUCKETS,
+    RESET_STOCK_BUCKETS,
+    SELECT_PRODUCT_BY_ID,
+    SELECT_PRODUCT_BY_SKU,
+    SELECT_PRODUCT_IDS_BY_SKUS,
+    SELECT_PRODUCTS_BY_IDS,
+    UPDATE_PRODUCT_STOCK_LAYOUT,
+    build_list_products,
+    build_update_product,
+)
+
+
+logger = logging.getLogger(__name__)
+
+STOCK_UPDATE_FAILED = {"error": "STOCK_UPDATE_FAILED"}
 
 
 def create_product(
@@ -12,11 +47,7 @@ def create_product(
 ) -> Dict[str, Any]:
     with conn.cursor() as cur:
         cur.execute(
-            """
-            INSERT INTO products (sku, name, description, price_cents, stock_quantity, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id, sku, name, description, price_cents, stock_quantity, is_active, created_at, updated_at
-            """,
+            INSERT_PRODUCT,
             (sku, name, description, price_cents, stock_quantity, is_active),
         )
         row = cur.fetchone()
@@ -26,17 +57,33 @@ def create_product(
 
 def get_product_by_id(conn, product_id: int) -> Optional[Dict[str, Any]]:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, sku, name, description, price_cents, stock_quantity, is_active, created_at, updated_at
-            FROM products
-            WHERE id = %s
-            """,
-            (product_id,),
-        )
+        cur.execute(SELECT_PRODUCT_BY_ID, (product_id,))
+        return cur.fetchone()
+
+
+def get_product_by_sku(conn, sku: str) -> Optional[Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_PRODUCT_BY_SKU, (sku,))
         return cur.fetchone()
 
 
+def get_products_by_ids(conn, product_ids: List[int]) -> Dict[str, Any]:
+    with conn.cursor() as cur:
+        cur.execute(SELECT_PRODUCTS_BY_IDS, (product_ids,))
+        products, missing = order_by_ids(cur.fetchall() or [], product_ids)
+    return {"products": products, "missing": missing}
+
+
+# filters: the keyword filters of build_list_products.
+def list_products(
+    conn, limit: int, cursor: Optional[str] = None, sort: str = "id", **filters: Any
+) -> Dict[str, Any]:
+    sql, params = build_list_products(limit + 1, decode_cursor(cursor, sort), sort, **filters)
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return products_page(cur.fetchall() or [], limit, sort)
+
+
 def update_product(
     conn,
     product_id: int,
@@ -46,53 +93,196 @@ def update_product(
     stock_quantity: Optional[int],
     is_active: Optional[bool],
 ) -> Optional[Dict[str, Any]]:
-    fields = []
-    params: List[Any] = []
-
-    if name is not None:
-        fields.append("name = %s")
-        params.append(name)
-    if description is not None:
-        fields.append("description = %s")
-        params.append(description)
-    if price_cents is not None:
-        fields.append("price_cents = %s")
-        params.append(price_cents)
-    if stock_quantity is not None:
-        fields.append("stock_quantity = %s")
-        params.append(stock_quantity)
-    if is_active is not None:
-        fields.append("is_active = %s")
-        params.append(is_active)
-
-    if not fields:
+    update = build_update_product(
+        product_id, name, description, price_cents, stock_quantity, is_active
+    )
+    if update is None:
         return get_product_by_id(conn, product_id)
-    params.append(product_id)
 
     with conn.cursor() as cur:
-        cur.execute(
-            f"""
-            UPDATE products
-            SET {", ".join(fields)}, updated_at = now()
-            WHERE id = %s
-            RETURNING id, sku, name, description, price_cents, stock_quantity, is_active, created_at, updated_at
-            """,
-            tuple(params),
-        )
+        cur.execute(*update)
         row = cur.fetchone()
+        if row and stock_quantity is not None:
+            cur.execute(RESET_STOCK_BUCKETS, (product_id,))
+            row["stock_quantity"] = stock_quantity
+    if row:
+        notify_product_changes(conn, [product_id])
     conn.commit()
+    product_cache.invalidate(product_id)
     return row
 
 
+def set_stock_buckets(conn, product_id: int, buckets: int) -> Optional[Dict[str, Any]]:
+    try:
+        locked = lock_product_stock(conn, product_id)
+        if locked is None:
+            conn.rollback()
+            return None
+        central, bucket_rows = locked
+        total = central + sum(r["quantity"] for r in bucket_rows)
+
+        with conn.cursor() as cur:
+            cur.execute(DELETE_STOCK_BUCKETS, (product_id,))
+            if buckets > 0:
+                cur.execute(INSERT_STOCK_BUCKETS, (product_id, distribute(total, buckets)))
+                central = 0
+            else:
+                central = total
+            cur.execute(UPDATE_PRODUCT_STOCK_LAYOUT, (central, buckets, product_id))
+            row = cur.fetchone()
+        notify_product_changes(conn, [product_id])
+        conn.commit()
+        product_cache.invalidate(product_id)
+        return row
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def rebalance_product_stock(conn, product_id: int) -> bool:
+    try:
+        moved = rebalance_stock_buckets(conn, product_id)
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+
+
 def delete_product(conn, product_id: int) -> bool:
     with conn.cursor() as cur:
-        cur.execute(
-            """
-            DELETE FROM products
-            WHERE id = %s
-            """,
-            (product_id,),
-        )
+        cur.execute(DELETE_PRODUCT, (product_id,))
         deleted = cur.rowcount > 0
+    if deleted:
+        notify_product_changes(conn, [product_id])
     conn.commit()
+    product_cache.invalidate(product_id)
     return deleted
+
+
+# (product id, absolute quantity or None, delta or None)
+StockChange = Tuple[int, Optional[int], Optional[int]]
+
+
+@retry_on_conflict
+def apply_stock_adjustments(
+    conn, adjustments: List[StockChange]
+) -> Tuple[Dict[int, Dict[str, Any]], List[int]]:
+    # Adjusts the unbucketed products in one transaction. Returns their
+    # outcomes by product id and the ids of the bucketed products found.
+    product_ids, quantities, deltas = (list(column) for column in zip(*adjustments))
+    outcomes: Dict[int, Dict[str, Any]] = {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(APPLY_STOCK_ADJUSTMENTS, (product_ids, quantities, deltas))
+            rows = cur.fetchall() or []
+        for r in rows:
+            if r["bucketed"]:
+                continue
+            outcome = {"previous_stock_quantity": r["previous_stock_quantity"]}
+            if r["applied"]:
+                outcome["stock_quantity"] = r["stock_quantity"]
+            else:
+                outcome["error"] = "INVALID_STOCK_QUANTITY"
+            outcomes[r["product_id"]] = outcome
+        changed = [pid for pid, o in outcomes.items() if "error" not in o]
+        notify_product_changes(conn, changed)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    product_cache.invalidate(*changed)
+    return outcomes, sorted(r["product_id"] for r in rows if r["bucketed"])
+
+
+# Bucketed products get a transaction each: orders hold single buckets while
+# they lock other products, so holding the buckets of several products at
+# once could deadlock with them.
+@retry_on_conflict
+def adjust_bucketed_stock_total(
+    conn, product_id: int, quantity: Optional[int], delta: Optional[int]
+) -> Optional[Dict[str, Any]]:
+    try:
+        locked = lock_product_stock(conn, product_id)
+        if locked is None:
+            conn.rollback()
+            return None
+        central, bucket_rows = locked
+        previous = central + sum(b["quantity"] for b in bucket_rows)
+        total = quantity if quantity is not None else previous + delta
+        if not 0 <= total <= MAX_INTEGER:
+            conn.rollback()
+            return {"previous_stock_quantity": previous, "error": "INVALID_STOCK_QUANTITY"}
+        write_stock_total(conn, product_id, total, bucket_rows)
+        notify_product_changes(conn, [product_id])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    product_cache.invalidate(product_id)
+    return {"previous_stock_quantity": previous, "stock_quantity": total}
+
+
+def resolve_skus(conn, skus: List[str]) -> Dict[str, int]:
+    if not skus:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(SELECT_PRODUCT_IDS_BY_SKUS, (skus,))
+        found = {r["sku"]: r["id"] for r in cur.fetchall() or []}
+    conn.rollback()
+    return found
+
+
+# POST /products/stock:batch. Items are applied chunk_size at a time, each
+# chunk in its own transaction, so a long batch never holds many locks for
+# long; a failure leaves the chunks before it applied.
+def adjust_stock_batch(
+    conn, items: List[Dict[str, Any]], chunk_size: int
+) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = [{"index": i} for i in range(len(items))]
+    sku_ids = resolve_skus(conn, list({it["sku"] for it in items if it["sku"] is not None}))
+
+    pending: List[Tuple[int, StockChange]] = []
+    seen = set()
+    for i, item in enumerate(items):
+        result = results[i]
+        if (item["id"] is None) == (item["sku"] is None) or (
+            (item["quantity"] is None) == (item["delta"] is None)
+        ):
+            result["error"] = "INVALID_ADJUSTMENT"
+            continue
+        if item["sku"] is not None:
+            result["sku"] = item["sku"]
+        pid = item["id"] if item["id"] is not None else sku_ids.get(item["sku"])
+        result["id"] = pid
+        if pid is None:
+            result["error"] = "PRODUCT_NOT_FOUND"
+        elif pid in seen:
+            result["error"] = "DUPLICATE_PRODUCT"
+        else:
+            seen.add(pid)
+            pending.append((i, (pid, item["quantity"], item["delta"])))
+
+    # A chunk that fails (after retries) is rolled back and reported item by
+    # item; the chunks around it still apply.
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            outcomes, bucketed = apply_stock_adjustments(conn, [change for _, change in chunk])
+        except Exception:
+            logger.exception("Stock batch chunk at item %s failed", chunk[0][0])
+            conn.rollback()
+            outcomes, bucketed = {pid: STOCK_UPDATE_FAILED for _, (pid, _, _) in chunk}, []
+        changes = {pid: (quantity, delta) for _, (pid, quantity, delta) in chunk}
+        for pid in bucketed:
+            try:
+                outcome = adjust_bucketed_stock_total(conn, pid, *changes[pid])
+            except Exception:
+                logger.exception("Stock batch adjustment of product %s failed", pid)
+                conn.rollback()
+                outcome = STOCK_UPDATE_FAILED
+            if outcome is not None:
+                outcomes[pid] = outcome
+        for i, (pid, _, _) in chunk:
+            results[i].update(outcomes.get(pid, {"error": "PRODUCT_NOT_FOUND"}))
+    return results
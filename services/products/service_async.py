@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Optional
+
+from shared.multiget import order_by_ids
+from shared.product_events import notify_product_changes_async
+
+from .cache import product_cache
+from .helpers import decode_cursor, products_page
+from .queries import (
+    DELETE_PRODUCT,
+    INSERT_PRODUCT,
+    RESET_STOCK_BUCKETS,
+    SELECT_PRODUCT_BY_ID,
+    SELECT_PRODUCT_BY_SKU,
+    SELECT_PRODUCTS_BY_IDS,
+    build_list_products,
+    build_update_product,
+)
+
+
+async def create_product(
+    conn,
+    sku: str,
+    name: str,
+    description: Optional[str],
+    price_cents: int,
+    stock_quantity: int,
+    is_active: bool,
+) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(
+            INSERT_PRODUCT,
+            (sku, name, description, price_cents, stock_quantity, is_active),
+        )
+        row = await cur.fetchone()
+    await conn.commit()
+    return row
+
+
+async def get_product_by_id(conn, product_id: int) -> Optional[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_PRODUCT_BY_ID, (product_id,))
+        return await cur.fetchone()
+
+
+async def get_product_by_sku(conn, sku: str) -> Optional[Dict[str, Any]]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_PRODUCT_BY_SKU, (sku,))
+        return await cur.fetchone()
+
+
+async def get_products_by_ids(conn, product_ids: List[int]) -> Dict[str, Any]:
+    async with conn.cursor() as cur:
+        await cur.execute(SELECT_PRODUCTS_BY_IDS, (product_ids,))
+        products, missing = order_by_ids(await cur.fetchall() or [], product_ids)
+    return {"products": products, "missing": missing}
+
+
+async def list_products(
+    conn, limit: int, cursor: Optional[str] = None, sort: str = "id", **filters: Any
+) -> Dict[str, Any]:
+    sql, params = build_list_products(limit + 1, decode_cursor(cursor, sort), sort, **filters)
+    async with conn.cursor() as cur:
+        await cur.execute(sql, params)
+        return products_page(await cur.fetchall() or [], limit, sort)
+
+
+async def update_product(
+    conn,
+    product_id: int,
+    name: Optional[str],
+    description: Optional[str],
+    price_cents: Optional[int],
+    stock_quantity: Optional[int],
+    is_active: Optional[bool],
+) -> Optional[Dict[str, Any]]:
+    update = build_update_product(
+        product_id, name, description, price_cents, stock_quantity, is_active
+    )
+    if update is None:
+        return await get_product_by_id(conn, product_id)
+
+    async with conn.cursor() as cur:
+        await cur.execute(*update)
+        row = await cur.fetchone()
+        if row and stock_quantity is not None:
+            await cur.execute(RESET_STOCK_BUCKETS, (product_id,))
+            row["stock_quantity"] = stock_quantity
+    if row:
+        await notify_product_changes_async(conn, [product_id])
+    await conn.commit()
+    product_cache.invalidate(product_id)
+    return row
+
+
+async def delete_product(conn, product_id: int) -> bool:
+    async with conn.cursor() as cur:
+        await cur.execute(DELETE_PRODUCT, (product_id,))
+        deleted = cur.rowcount > 0
+    if deleted:
+        await notify_product_changes_async(conn, [product_id])
+    await conn.commit()
+    product_cache.invalidate(product_id)
+    return deleted
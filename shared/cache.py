@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from shared import metrics
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+# Thread-safe in-process LRU cache whose entries also expire after a TTL.
+# Concurrent loads of the same key share one loader call (single-flight).
+# Invalidating a key while a load for it is in flight detaches that load: its
+# value is not cached and later callers start a fresh one instead of joining
+# a pre-invalidation read.
+class TTLCache:
+    def __init__(self, name: str, max_size: int, ttl_seconds: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._async_flights: Dict[Hashable, _AsyncFlight] = {}
+        metrics.register_gauges(self.stats)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.incr(f"{self.name}_hits")
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        metrics.incr(f"{self.name}_misses")
+        return None
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key: Hashable, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            metrics.incr(f"{self.name}_evictions")
+
+    def _join(self, flights: Dict[Hashable, Any], key: Hashable, flight_type) -> Tuple[Any, bool]:
+        with self._lock:
+            flight = flights.get(key)
+            if flight is not None:
+                metrics.incr(f"{self.name}_coalesced")
+                return flight, False
+            flight = flights[key] = flight_type()
+            return flight, True
+
+    def _land(
+        self, flights: Dict[Hashable, Any], key: Hashable, flight: Any, ttl: Optional[float]
+    ) -> None:
+        with self._lock:
+            if flights.get(key) is not flight:
+                return
+            del flights[key]
+            if flight.value is not None and flight.error is None:
+                self._store(key, flight.value, self.ttl_seconds if ttl is None else ttl)
+
+    def load(
+        self, key: Hashable, loader: Callable[[], Any], ttl_seconds: Optional[float] = None
+    ) -> Any:
+        if not self.enabled:
+            return loader()
+        value = self.get(key)
+        if value is not None:
+            return value
+        flight, leader = self._join(self._flights, key, _Flight)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(self._flights, key, flight, ttl_seconds)
+            flight.done.set()
+        return flight.value
+
+    async def load_async(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_seconds: Optional[float] = None,
+    ) -> Any:
+        if not self.enabled:
+            return await loader()
+        value = self.get(key)
+        if value is not None:
+            return value
+        flight, leader = self._join(self._async_flights, key, _AsyncFlight)
+        if not leader:
+            await flight.done.wait()
+            if isinstance(flight.error, asyncio.CancelledError):
+                # The leading request went away; load for this one instead.
+                return await loader()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = await loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._land(self._async_flights, key, flight, ttl_seconds)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._flights.pop(key, None)
+                self._async_flights.pop(key, None)
+        metrics.incr(f"{self.name}_invalidations", len(keys))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._flights.clear()
+            self._async_flights.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {f"{self.name}_size": len(self._entries)}
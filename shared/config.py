@@ -5,3 +5,93 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.environ["DATABASE_URL"]
+
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.environ.get("DB_POOL_HEALTHCHECK_IDLE_SECONDS", "30"))
+
+# "sync" serves requests from the psycopg2 pool on the threadpool, "async" from
+# the psycopg (v3) async pool on the event loop.
+DB_DRIVER = os.environ.get("DB_DRIVER", "sync").lower()
+
+DB_RETRY_ATTEMPTS = int(os.environ.get("DB_RETRY_ATTEMPTS", "3"))
+DB_RETRY_BASE_DELAY_SECONDS = float(os.environ.get("DB_RETRY_BASE_DELAY_SECONDS", "0.02"))
+
+# How often the products service spreads stock evenly across the buckets of
+# bucketed products; 0 disables the background rebalancer.
+INVENTORY_REBALANCE_INTERVAL_SECONDS = float(
+    os.environ.get("INVENTORY_REBALANCE_INTERVAL_SECONDS", "5")
+)
+
+ORDER_BATCH_MAX_SIZE = int(os.environ.get("ORDER_BATCH_MAX_SIZE", "1000"))
+
+# In-process cache of serialized GET /orders/{id} responses; 0 disables it.
+# Invalidation is per process, so keep the TTL short when running several
+# workers.
+ORDER_CACHE_MAX_SIZE = int(os.environ.get("ORDER_CACHE_MAX_SIZE", "0"))
+ORDER_CACHE_TTL_SECONDS = float(os.environ.get("ORDER_CACHE_TTL_SECONDS", "2"))
+
+# In-process cache of GET /products/{id} and /products/by-sku/{sku} responses
+# in the products service; 0 disables it. Product changes made by any service
+# are published over Postgres LISTEN/NOTIFY and evicted by every products
+# process, so set the same size on the orders service to have its stock
+# changes published. The TTL bounds staleness if a notification is missed.
+PRODUCT_CACHE_MAX_SIZE = int(os.environ.get("PRODUCT_CACHE_MAX_SIZE", "0"))
+PRODUCT_CACHE_TTL_SECONDS = float(os.environ.get("PRODUCT_CACHE_TTL_SECONDS", "30"))
+
+# Most row errors listed in a POST /products:import response; every rejected
+# row is still counted.
+PRODUCT_IMPORT_MAX_ERRORS = int(os.environ.get("PRODUCT_IMPORT_MAX_ERRORS", "1000"))
+
+# Most items in one POST /products/stock:batch call, and how many of them are
+# applied per transaction.
+PRODUCT_STOCK_BATCH_MAX_SIZE = int(os.environ.get("PRODUCT_STOCK_BATCH_MAX_SIZE", "100000"))
+PRODUCT_STOCK_BATCH_CHUNK_SIZE = int(os.environ.get("PRODUCT_STOCK_BATCH_CHUNK_SIZE", "1000"))
+
+PRODUCT_PAGE_DEFAULT_SIZE = int(os.environ.get("PRODUCT_PAGE_DEFAULT_SIZE", "100"))
+PRODUCT_PAGE_MAX_SIZE = int(os.environ.get("PRODUCT_PAGE_MAX_SIZE", "500"))
+
+ORDER_PAGE_DEFAULT_SIZE = int(os.environ.get("ORDER_PAGE_DEFAULT_SIZE", "100"))
+ORDER_PAGE_MAX_SIZE = int(os.environ.get("ORDER_PAGE_MAX_SIZE", "500"))
+
+# Rows fetched per round trip from the server-side cursor behind GET /orders/export.
+ORDER_EXPORT_FETCH_SIZE = int(os.environ.get("ORDER_EXPORT_FETCH_SIZE", "2000"))
+
+# Most ids accepted by one multi-get (GET /orders?ids=, /products?ids=, /customers?ids=).
+MULTI_GET_MAX_IDS = int(os.environ.get("MULTI_GET_MAX_IDS", "500"))
+
+# Cached GET /reports/top-products results; 0 disables the cache. Windows are
+# widened to whole buckets so near-identical dashboard requests share an
+# entry. Windows that end before now are kept for the longer TTL.
+REPORT_CACHE_MAX_SIZE = int(os.environ.get("REPORT_CACHE_MAX_SIZE", "256"))
+REPORT_CACHE_BUCKET_SECONDS = int(os.environ.get("REPORT_CACHE_BUCKET_SECONDS", "60"))
+REPORT_CACHE_TTL_SECONDS = float(os.environ.get("REPORT_CACHE_TTL_SECONDS", "15"))
+REPORT_CACHE_PAST_TTL_SECONDS = float(os.environ.get("REPORT_CACHE_PAST_TTL_SECONDS", "600"))
+
+# Approximate live top products (GET /reports/top-products/live): counters
+# kept per bucket, bucket width and the longest window served. Counts are
+# per process; 0 capacity turns tracking off.
+LIVE_TOPK_CAPACITY = int(os.environ.get("LIVE_TOPK_CAPACITY", "100"))
+LIVE_TOPK_BUCKET_SECONDS = int(os.environ.get("LIVE_TOPK_BUCKET_SECONDS", "60"))
+LIVE_TOPK_WINDOW_MINUTES = int(os.environ.get("LIVE_TOPK_WINDOW_MINUTES", "60"))
+
+# In-memory analytics snapshot of orders and items that the reports are
+# computed from; 0 turns it off and GET /reports/top-products goes back to
+# SQL. A snapshot older than the refresh interval picks up orders whose
+# updated_at moved, re-reading the last lag seconds to catch transactions
+# that committed late; a full reload also drops deleted orders.
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", "0"))
+ANALYTICS_FULL_REFRESH_SECONDS = float(os.environ.get("ANALYTICS_FULL_REFRESH_SECONDS", "3600"))
+ANALYTICS_LAG_SECONDS = float(os.environ.get("ANALYTICS_LAG_SECONDS", "60"))
+
+# Report jobs (POST /reports/jobs): worker threads, most jobs queued or
+# running at once (more are refused with 503), most finished jobs kept, how
+# long a finished job's result is kept and the statement timeout per job.
+REPORT_JOB_WORKERS = int(os.environ.get("REPORT_JOB_WORKERS", "2"))
+REPORT_JOB_MAX_QUEUED = int(os.environ.get("REPORT_JOB_MAX_QUEUED", "100"))
+REPORT_JOB_MAX_STORED = int(os.environ.get("REPORT_JOB_MAX_STORED", "1000"))
+REPORT_JOB_TTL_SECONDS = float(os.environ.get("REPORT_JOB_TTL_SECONDS", "600"))
+REPORT_JOB_STATEMENT_TIMEOUT_SECONDS = float(
+    os.environ.get("REPORT_JOB_STATEMENT_TIMEOUT_SECONDS", "120")
+)
@@ -1,7 +1,44 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import psycopg
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 import psycopg2.extras
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout as AsyncPoolTimeout
+from starlette.background import BackgroundTask
 
-from shared.config import DATABASE_URL
+from shared import metrics
+from shared.config import (
+    DATABASE_URL,
+    DB_DRIVER,
+    DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_RETRY_ATTEMPTS,
+    DB_RETRY_BASE_DELAY_SECONDS,
+)
 
 
 def get_conn():
@@ -9,3 +46,392 @@ def get_conn():
         DATABASE_URL,
         cursor_factory=psycopg2.extras.RealDictCursor,
     )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect: Callable[[], "psycopg2.extensions.connection"],
+        min_size: int,
+        max_size: int,
+        timeout: float,
+        healthcheck_idle_seconds: float,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_idle_seconds = healthcheck_idle_seconds
+        self._cond = threading.Condition()
+        self._idle: List[Tuple["psycopg2.extensions.connection", float]] = []
+        self._size = 0
+        self._closed = False
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def getconn(self):
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                if not waited:
+                    waited = True
+                    metrics.incr("db_pool_waits")
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    metrics.incr("db_pool_timeouts")
+                    raise PoolTimeout(f"No connection available within {self.timeout}s")
+                self._cond.wait(remaining)
+
+        if waited:
+            metrics.incr("db_pool_wait_seconds", time.monotonic() - start)
+        metrics.incr("db_pool_checkouts")
+
+        if conn is not None and not self._is_healthy(conn, idle_since):
+            metrics.incr("db_pool_healthcheck_failures")
+            self._close_quietly(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+    def putconn(self, conn) -> None:
+        if not conn.closed:
+            status = conn.info.transaction_status
+            if status in (
+                psycopg2.extensions.TRANSACTION_STATUS_INTRANS,
+                psycopg2.extensions.TRANSACTION_STATUS_INERROR,
+            ):
+                metrics.incr("db_pool_resets")
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._close_quietly(conn)
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                self._close_quietly(conn)
+
+        if conn.closed:
+            self._release_slot()
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._cond.notify()
+                self._close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator["psycopg2.extensions.connection"]:
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "db_pool_size": self._size,
+                "db_pool_idle": len(self._idle),
+                "db_pool_in_use": self._size - len(self._idle),
+                "db_pool_max_size": self.max_size,
+            }
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_idle_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_conn,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT_SECONDS,
+                    healthcheck_idle_seconds=DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+                )
+    return _pool
+
+
+def _pool_stats():
+    pool = _pool
+    return pool.stats() if pool is not None else {}
+
+
+metrics.register_gauges(_pool_stats)
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def pooled_conn() -> Iterator["psycopg2.extensions.connection"]:
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def checkout_db() -> "psycopg2.extensions.connection":
+    try:
+        return get_pool().getconn()
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted")
+
+
+def get_db() -> Iterator["psycopg2.extensions.connection"]:
+    conn = checkout_db()
+    try:
+        yield conn
+    finally:
+        get_pool().putconn(conn)
+
+
+# For streaming responses, which outlive the request handler: the connection
+# is checked out up front (so pool exhaustion is still a 503) and returned
+# once, by whichever runs first of the stream's end and the response's
+# background task. The latter covers a body that is never iterated, e.g.
+# when the client disconnects before the first chunk.
+def streaming_db_response(
+    build: Callable[["psycopg2.extensions.connection"], Generator[Any, None, None]],
+    media_type: str,
+) -> StreamingResponse:
+    conn = checkout_db()
+    returned = threading.Event()
+
+    def release() -> None:
+        if not returned.is_set():
+            returned.set()
+            get_pool().putconn(conn)
+
+    try:
+        chunks = build(conn)
+    except BaseException:
+        release()
+        raise
+
+    def stream() -> Iterator[Any]:
+        try:
+            yield from chunks
+        finally:
+            chunks.close()
+            release()
+
+    return StreamingResponse(stream(), media_type=media_type, background=BackgroundTask(release))
+
+
+F = TypeVar("F", bound=Callable)
+
+# Transaction conflicts that are safe to retry from the top, for both drivers.
+RETRYABLE_ERRORS = (
+    (psycopg2.errors.SerializationFailure, "serialization"),
+    (psycopg2.errors.DeadlockDetected, "deadlock"),
+    (psycopg.errors.SerializationFailure, "serialization"),
+    (psycopg.errors.DeadlockDetected, "deadlock"),
+)
+
+
+def _retry_reason(exc: BaseException) -> Optional[str]:
+    for error_class, reason in RETRYABLE_ERRORS:
+        if isinstance(exc, error_class):
+            return reason
+    return None
+
+
+def _retry_delay(attempt: int) -> float:
+    return random.uniform(0, DB_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+
+
+def retry_on_conflict(fn: F) -> F:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except (psycopg2.Error, psycopg.Error) as e:
+                reason = _retry_reason(e)
+                if reason is None:
+                    raise
+                if attempt + 1 >= DB_RETRY_ATTEMPTS:
+                    metrics.incr(f"db_retry_exhausted_{reason}")
+                    raise
+                metrics.incr(f"db_retries_{reason}")
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+
+    return wrapper
+
+
+def retry_on_conflict_async(fn: F) -> F:
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except (psycopg2.Error, psycopg.Error) as e:
+                reason = _retry_reason(e)
+                if reason is None:
+                    raise
+                if attempt + 1 >= DB_RETRY_ATTEMPTS:
+                    metrics.incr(f"db_retry_exhausted_{reason}")
+                    raise
+                metrics.incr(f"db_retries_{reason}")
+                await asyncio.sleep(_retry_delay(attempt))
+                attempt += 1
+
+    return wrapper
+
+
+_async_pool: Optional[AsyncConnectionPool] = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT_SECONDS,
+                    kwargs={"row_factory": dict_row},
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+def _async_pool_stats():
+    pool = _async_pool
+    if pool is None:
+        return {}
+    stats = pool.get_stats()
+    return {
+        "async_db_pool_size": stats.get("pool_size", 0),
+        "async_db_pool_idle": stats.get("pool_available", 0),
+        "async_db_pool_waiting": stats.get("requests_waiting", 0),
+        "async_db_pool_waits": stats.get("requests_queued", 0),
+        "async_db_pool_wait_seconds": stats.get("requests_wait_ms", 0) / 1000,
+        "async_db_pool_timeouts": stats.get("requests_errors", 0),
+        "async_db_pool_max_size": pool.max_size,
+    }
+
+
+metrics.register_gauges(_async_pool_stats)
+
+
+async def close_async_pool() -> None:
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            await _async_pool.close()
+            _async_pool = None
+
+
+async def get_async_db() -> AsyncIterator["psycopg.AsyncConnection"]:
+    pool = await get_async_pool()
+    try:
+        conn = await pool.getconn()
+    except AsyncPoolTimeout:
+        raise HTTPException(status_code=503, detail="Database connection pool exhausted")
+    try:
+        yield conn
+    finally:
+        try:
+            if conn.info.transaction_status in (
+                TransactionStatus.INTRANS,
+                TransactionStatus.INERROR,
+            ):
+                metrics.incr("async_db_pool_resets")
+                await conn.rollback()
+        except psycopg.Error:
+            # Broken connection; the pool discards it on return.
+            await conn.close()
+        finally:
+            await pool.putconn(conn)
+
+
+# For handlers that only need a connection on some paths, such as cache
+# misses: the same 503 on pool exhaustion as the dependencies, without
+# holding a connection for the whole request.
+request_db = contextmanager(get_db)
+async_request_db = asynccontextmanager(get_async_db)
+
+
+@asynccontextmanager
+async def lifespan(_app) -> AsyncIterator[None]:
+    if DB_DRIVER == "async":
+        await get_async_pool()
+    yield
+    close_pool()
+    await close_async_pool()
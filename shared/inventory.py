@@ -0,0 +1,212 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared import metrics
+
+# Stock for a bucketed product (products.stock_buckets > 0) is the central
+# products.stock_quantity plus the sum of its product_stock_buckets rows.
+# Orders adjust a single unlocked bucket so concurrent orders for the same
+# product do not queue on one row; locks are always taken central row first,
+# then buckets in bucket order. The central row is locked FOR NO KEY UPDATE:
+# an order that holds a bucket still inserts its items, whose foreign key
+# check takes KEY SHARE on the product, and FOR UPDATE would block that while
+# waiting on the bucket.
+
+ADJUST_STOCK_BUCKET = """
+    UPDATE product_stock_buckets b
+    SET quantity = b.quantity - %(delta)s
+    FROM (
+        SELECT product_id, bucket
+        FROM product_stock_buckets
+        WHERE product_id = %(product_id)s
+          AND quantity >= %(delta)s
+        ORDER BY random()
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ) pick
+    WHERE b.product_id = pick.product_id AND b.bucket = pick.bucket
+    RETURNING b.bucket
+"""
+
+LOCK_CENTRAL_STOCK = """
+    SELECT stock_quantity
+    FROM products
+    WHERE id = %s
+    FOR NO KEY UPDATE
+"""
+
+LOCK_CENTRAL_STOCK_SKIP_LOCKED = """
+    SELECT stock_quantity
+    FROM products
+    WHERE id = %s
+    FOR NO KEY UPDATE SKIP LOCKED
+"""
+
+LOCK_STOCK_BUCKETS = """
+    SELECT bucket, quantity
+    FROM product_stock_buckets
+    WHERE product_id = %s
+    ORDER BY bucket
+    FOR UPDATE
+"""
+
+LOCK_STOCK_BUCKETS_SKIP_LOCKED = """
+    SELECT bucket, quantity
+    FROM product_stock_buckets
+    WHERE product_id = %s
+    ORDER BY bucket
+    FOR UPDATE SKIP LOCKED
+"""
+
+WRITE_STOCK_DISTRIBUTION = """
+    WITH central AS (
+        UPDATE products
+        SET stock_quantity = %(central)s, updated_at = now()
+        WHERE id = %(product_id)s
+    )
+    UPDATE product_stock_buckets b
+    SET quantity = n.quantity
+    FROM unnest(%(buckets)s::int[], %(quantities)s::int[]) AS n(bucket, quantity)
+    WHERE b.product_id = %(product_id)s AND b.bucket = n.bucket
+"""
+
+LIST_BUCKETED_PRODUCTS = """
+    SELECT id
+    FROM products
+    WHERE stock_buckets > 0
+    ORDER BY id
+"""
+
+
+def distribute(total: int, n: int) -> List[int]:
+    base, extra = divmod(total, n)
+    return [base + 1 if i < extra else base for i in range(n)]
+
+
+def plan_distribution(
+    product_id: int, total: int, buckets: List[int]
+) -> Dict[str, Any]:
+    if not buckets:
+        return {"product_id": product_id, "central": total, "buckets": [], "quantities": []}
+    return {
+        "product_id": product_id,
+        "central": 0,
+        "buckets": buckets,
+        "quantities": distribute(total, len(buckets)),
+    }
+
+
+def is_balanced(central: int, quantities: List[int]) -> bool:
+    if not quantities:
+        return True
+    return central == 0 and max(quantities) - min(quantities) <= 1
+
+
+def _bucket_totals(bucket_rows: List[Dict[str, Any]]) -> Tuple[List[int], int]:
+    return [r["bucket"] for r in bucket_rows], sum(r["quantity"] for r in bucket_rows)
+
+
+def adjust_bucketed_stock(
+    conn, product_id: int, delta: int, out_of_stock_error, snapshot_total: int
+) -> int:
+    with conn.cursor() as cur:
+        cur.execute(ADJUST_STOCK_BUCKET, {"product_id": product_id, "delta": delta})
+        if cur.fetchone():
+            metrics.incr("inventory_bucket_fast_path")
+            return snapshot_total - delta
+
+        # No single unlocked bucket can absorb the delta: lock everything for
+        # this product, check the exact total and spread what is left evenly.
+        metrics.incr("inventory_bucket_slow_path")
+        cur.execute(LOCK_CENTRAL_STOCK, (product_id,))
+        central = cur.fetchone()["stock_quantity"]
+        cur.execute(LOCK_STOCK_BUCKETS, (product_id,))
+        buckets, bucket_total = _bucket_totals(cur.fetchall() or [])
+        total = central + bucket_total
+        if total < delta:
+            raise out_of_stock_error(product_id, total, delta)
+        cur.execute(
+            WRITE_STOCK_DISTRIBUTION, plan_distribution(product_id, total - delta, buckets)
+        )
+        return total - delta
+
+
+async def adjust_bucketed_stock_async(
+    conn, product_id: int, delta: int, out_of_stock_error, snapshot_total: int
+) -> int:
+    async with conn.cursor() as cur:
+        await cur.execute(ADJUST_STOCK_BUCKET, {"product_id": product_id, "delta": delta})
+        if await cur.fetchone():
+            metrics.incr("inventory_bucket_fast_path")
+            return snapshot_total - delta
+
+        metrics.incr("inventory_bucket_slow_path")
+        await cur.execute(LOCK_CENTRAL_STOCK, (product_id,))
+        central = (await cur.fetchone())["stock_quantity"]
+        await cur.execute(LOCK_STOCK_BUCKETS, (product_id,))
+        buckets, bucket_total = _bucket_totals(await cur.fetchall() or [])
+        total = central + bucket_total
+        if total < delta:
+            raise out_of_stock_error(product_id, total, delta)
+        await cur.execute(
+            WRITE_STOCK_DISTRIBUTION, plan_distribution(product_id, total - delta, buckets)
+        )
+        return total - delta
+
+
+def rebalance_stock_buckets(conn, product_id: int) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(LOCK_CENTRAL_STOCK_SKIP_LOCKED, (product_id,))
+        row = cur.fetchone()
+        if not row:
+            return False
+        cur.execute(LOCK_STOCK_BUCKETS_SKIP_LOCKED, (product_id,))
+        bucket_rows = cur.fetchall() or []
+        if not bucket_rows:
+            return False
+        if is_balanced(row["stock_quantity"], [r["quantity"] for r in bucket_rows]):
+            return False
+        buckets, bucket_total = _bucket_totals(bucket_rows)
+        cur.execute(
+            WRITE_STOCK_DISTRIBUTION,
+            plan_distribution(product_id, row["stock_quantity"] + bucket_total, buckets),
+        )
+    metrics.incr("inventory_rebalances")
+    return True
+
+
+def list_bucketed_products(conn) -> List[int]:
+    with conn.cursor() as cur:
+        cur.execute(LIST_BUCKETED_PRODUCTS)
+        return [r["id"] for r in cur.fetchall() or []]
+
+
+def lock_product_stock(conn, product_id: int) -> Optional[Tuple[int, List[Dict[str, Any]]]]:
+    with conn.cursor() as cur:
+        cur.execute(LOCK_CENTRAL_STOCK, (product_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+        cur.execute(LOCK_STOCK_BUCKETS, (product_id,))
+        return row["stock_quantity"], cur.fetchall() or []
+
+
+# Sets a locked bucketed product's total stock, spread evenly over its buckets.
+def write_stock_total(
+    conn, product_id: int, total: int, bucket_rows: List[Dict[str, Any]]
+) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            WRITE_STOCK_DISTRIBUTION,
+            plan_distribution(product_id, total, [r["bucket"] for r in bucket_rows]),
+        )
+
+
+# Plans checked by `python -m shared.migrate --check` against seeded data.
+EXPLAIN_CHECKS = [
+    ("list_bucketed_products", lambda s: (LIST_BUCKETED_PRODUCTS, None)),
+    (
+        "adjust_stock_bucket",
+        lambda s: (ADJUST_STOCK_BUCKET, {"product_id": s["product_id"], "delta": 1}),
+    ),
+    ("lock_central_stock", lambda s: (LOCK_CENTRAL_STOCK, (s["product_id"],))),
+]
@@ -0,0 +1,35 @@
+import threading
+from typing import Callable, Dict, List
+
+from fastapi import APIRouter
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauge_providers: List[Callable[[], Dict[str, float]]] = []
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauges(provider: Callable[[], Dict[str, float]]) -> None:
+    with _lock:
+        _gauge_providers.append(provider)
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        out = dict(_counters)
+        providers = list(_gauge_providers)
+    for provider in providers:
+        out.update(provider())
+    return out
+
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def metrics_endpoint():
+    return snapshot()
@@ -0,0 +1,299 @@
+import argparse
+import hashlib
+import importlib
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from shared.db import get_conn
+
+MIGRATIONS_DIR = Path(__file__).with_name("migrations")
+OPTIONAL_DIR = MIGRATIONS_DIR / "optional"
+
+# Arbitrary constant; keeps two runners (e.g. several containers starting at
+# once) from applying the same migration concurrently.
+MIGRATION_LOCK_KEY = 7_300_113
+
+# Modules that may define EXPLAIN_CHECKS: (name, fn(sample) -> (sql, params)).
+# Services missing from the current image are skipped.
+EXPLAIN_CHECK_MODULES = [
+    "shared.inventory",
+    "services.customers.queries",
+    "services.products.queries",
+    "services.orders.queries",
+]
+SEEDED_TABLES = {"customers", "products", "orders", "order_items", "product_daily_sales"}
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version    TEXT PRIMARY KEY,
+        name       TEXT NOT NULL,
+        checksum   TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+SELECT_APPLIED_MIGRATIONS = "SELECT version, name, checksum, applied_at FROM schema_migrations"
+
+INSERT_MIGRATION = """
+    INSERT INTO schema_migrations (version, name, checksum)
+    VALUES (%s, %s, %s)
+"""
+
+SEED_CUSTOMERS = """
+    WITH c AS (
+        INSERT INTO customers (email, first_name, last_name)
+        SELECT 'explain-check-' || g || '@example.invalid', 'Explain', 'Check'
+        FROM generate_series(1, %(count)s) g
+        RETURNING id
+    )
+    SELECT min(id) AS first_id, count(*) AS n FROM c
+"""
+
+SEED_PRODUCTS = """
+    WITH p AS (
+        INSERT INTO products (sku, name, price_cents, stock_quantity)
+        SELECT 'explain-check-' || g, 'Explain check', 100 + g %% 900, 1000000
+        FROM generate_series(1, %(count)s) g
+        RETURNING id
+    )
+    SELECT min(id) AS first_id, count(*) AS n FROM p
+"""
+
+SEED_ORDERS = """
+    WITH o AS (
+        INSERT INTO orders (customer_id, status, total_cents, created_at, updated_at)
+        SELECT
+            %(first_customer)s + g %% %(customers)s,
+            (enum_range(NULL::order_status))[1 + g %% 5],
+            1000,
+            now() - interval '365 days' + g * (interval '365 days' / %(count)s),
+            now()
+        FROM generate_series(1, %(count)s) g
+        RETURNING id
+    ),
+    i AS (
+        INSERT INTO order_items (order_id, product_id, quantity, unit_price_cents, line_total_cents)
+        SELECT o.id, %(first_product)s + (o.id * 7 + k) %% %(products)s, 1 + k, 500, 500 * (1 + k)
+        FROM o
+        CROSS JOIN generate_series(0, 1) k
+    )
+    SELECT min(id) AS first_id, count(*) AS n FROM o
+"""
+
+SEED_DAILY_SALES = """
+    INSERT INTO product_daily_sales (day, product_id, shard, quantity, sales_cents)
+    SELECT (o.created_at AT TIME ZONE 'UTC')::date, oi.product_id, 0, SUM(oi.quantity),
+        SUM(oi.line_total_cents)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE o.id >= %(first_order)s AND o.status <> 'CANCELLED'
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, product_id, shard) DO UPDATE
+    SET quantity = product_daily_sales.quantity + EXCLUDED.quantity,
+        sales_cents = product_daily_sales.sales_cents + EXCLUDED.sales_cents
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+def _checksum(sql: str) -> str:
+    return hashlib.sha256(sql.encode()).hexdigest()
+
+
+def discover_migrations(directory: Path = MIGRATIONS_DIR) -> List[Tuple[str, str, Path]]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", path.name)
+        if not match:
+            raise MigrationError(f"Unexpected migration file name: {path.name}")
+        migrations.append((match.group(1), match.group(2), path))
+    versions = [v for v, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError("Duplicate migration versions")
+    return migrations
+
+
+def optional_migration(name: str) -> Tuple[str, str, Path]:
+    path = OPTIONAL_DIR / f"{name}.sql"
+    if not path.exists():
+        raise MigrationError(f"Unknown optional migration: {name}")
+    return f"optional:{name}", name, path
+
+
+def applied_migrations(conn) -> Dict[str, Dict[str, Any]]:
+    with conn.cursor() as cur:
+        cur.execute(CREATE_MIGRATIONS_TABLE)
+        cur.execute(SELECT_APPLIED_MIGRATIONS)
+        rows = cur.fetchall() or []
+    conn.commit()
+    return {r["version"]: r for r in rows}
+
+
+def pending_migrations(
+    applied: Dict[str, Dict[str, Any]], migrations: List[Tuple[str, str, Path]]
+) -> List[Tuple[str, str, Path]]:
+    pending = []
+    for version, name, path in migrations:
+        row = applied.get(version)
+        if row is None:
+            pending.append((version, name, path))
+        elif row["checksum"] != _checksum(path.read_text()):
+            raise MigrationError(f"Migration {version}_{name} changed after it was applied")
+    return pending
+
+
+def migrate(conn, optional: Optional[List[str]] = None) -> List[str]:
+    migrations = discover_migrations() + [optional_migration(n) for n in optional or []]
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        applied = []
+        for version, name, path in pending_migrations(applied_migrations(conn), migrations):
+            sql = path.read_text()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute(INSERT_MIGRATION, (version, name, _checksum(sql)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version if version.startswith("optional:") else f"{version}_{name}")
+        return applied
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+
+ExplainCheck = Callable[[Dict[str, Any]], Tuple[str, Any]]
+
+
+def iter_explain_checks() -> Iterator[Tuple[str, str, ExplainCheck]]:
+    for module_name in EXPLAIN_CHECK_MODULES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for name, build in getattr(module, "EXPLAIN_CHECKS", []):
+            yield module_name, name, build
+
+
+def find_seq_scans(plan: Dict[str, Any]) -> List[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+def seed_check_data(conn, orders: int) -> Dict[str, Any]:
+    customers, products = max(100, orders // 20), max(100, min(orders // 40, 20000))
+    with conn.cursor() as cur:
+        cur.execute(SEED_CUSTOMERS, {"count": customers})
+        first_customer = cur.fetchone()["first_id"]
+        cur.execute(SEED_PRODUCTS, {"count": products})
+        first_product = cur.fetchone()["first_id"]
+        cur.execute(
+            SEED_ORDERS,
+            {
+                "count": orders,
+                "first_customer": first_customer,
+                "customers": customers,
+                "first_product": first_product,
+                "products": products,
+            },
+        )
+        first_order = cur.fetchone()["first_id"]
+        cur.execute(SEED_DAILY_SALES, {"first_order": first_order})
+        cur.execute("ANALYZE customers, products, orders, order_items, product_daily_sales")
+    now = datetime.now(timezone.utc)
+    return {
+        "customer_id": first_customer,
+        "product_id": first_product,
+        "product_ids": [first_product + i for i in range(5)],
+        "sku": f"explain-check-{products // 2}",
+        "order_id": first_order + orders // 2,
+        "order_ids": [first_order + orders // 2 + i for i in range(5)],
+        "start": now - timedelta(days=1),
+        "end": now,
+        "after": (now - timedelta(hours=12), first_order + orders),
+    }
+
+
+# Seeds a realistic volume of rows inside a transaction, EXPLAINs every
+# registered query against it and rolls everything back. Returns one line
+# per query that plans a sequential scan over a seeded table.
+def check_query_plans(conn, orders: int) -> List[str]:
+    problems = []
+    try:
+        sample = seed_check_data(conn, orders)
+        with conn.cursor() as cur:
+            for module_name, name, build in iter_explain_checks():
+                sql, params = build(sample)
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()["QUERY PLAN"][0]["Plan"]
+                scanned = sorted(set(find_seq_scans(plan)) & SEEDED_TABLES)
+                if scanned:
+                    problems.append(f"{module_name}.{name}: seq scan on {', '.join(scanned)}")
+    finally:
+        conn.rollback()
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply OMS schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    parser.add_argument(
+        "--optional",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="also apply shared/migrations/optional/NAME.sql (e.g. orders_created_at_brin)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="EXPLAIN the services' queries against seeded data; fail on sequential scans",
+    )
+    parser.add_argument(
+        "--seed-orders", type=int, default=200_000, help="orders seeded for --check"
+    )
+    args = parser.parse_args(argv)
+
+    conn = get_conn()
+    try:
+        if args.status:
+            applied = applied_migrations(conn)
+            for version, name, _ in discover_migrations():
+                row = applied.get(version)
+                state = row["applied_at"].isoformat() if row else "pending"
+                print(f"{version}_{name}: {state}")
+            for version, row in sorted(applied.items()):
+                if version.startswith("optional:"):
+                    print(f"{version}: {row['applied_at'].isoformat()}")
+            return 0
+
+        for name in migrate(conn, args.optional):
+            print(f"applied {name}")
+
+        if args.check:
+            problems = check_query_plans(conn, args.seed_orders)
+            for problem in problems:
+                print(problem, file=sys.stderr)
+            if problems:
+                return 1
+            print("query plans OK")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+-- Optional per-product stock buckets for hot SKUs. When stock_buckets > 0 the
+-- product's stock is products.stock_quantity plus the sum of its buckets.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS stock_buckets INTEGER NOT NULL DEFAULT 0 CHECK (stock_buckets >= 0);
+
+CREATE TABLE IF NOT EXISTS product_stock_buckets (
+  product_id BIGINT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  bucket     INTEGER NOT NULL,
+  quantity   INTEGER NOT NULL CHECK (quantity >= 0),
+  PRIMARY KEY (product_id, bucket)
+);
@@ -0,0 +1,6 @@
+-- Keyset pagination walks (created_at, id) newest first; these replace the
+-- earlier created_at-only indexes and also serve the range reports.
+DROP INDEX IF EXISTS idx_orders_customer_created;
+DROP INDEX IF EXISTS idx_orders_created_at;
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created_id ON orders(customer_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_created_id ON orders(created_at DESC, id DESC);
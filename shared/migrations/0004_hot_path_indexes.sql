@@ -0,0 +1,7 @@
+-- The stock rebalancer lists bucketed products on every pass.
+CREATE INDEX IF NOT EXISTS idx_products_bucketed ON products(id) WHERE stock_buckets > 0;
+
+-- Both duplicate the indexes behind the UNIQUE constraints on these columns
+-- and only add write cost.
+DROP INDEX IF EXISTS idx_customers_email;
+DROP INDEX IF EXISTS idx_products_sku;
@@ -0,0 +1,27 @@
+-- Per product, per UTC day sales of orders that are not cancelled, kept in
+-- step with order_items by the order mutations. Orders for bucketed
+-- products write to shard order id % 16 so they do not all queue on one
+-- row; everything else, including backfills, uses shard 0. Readers sum
+-- over the shards.
+CREATE TABLE IF NOT EXISTS product_daily_sales (
+  day         DATE NOT NULL,
+  product_id  BIGINT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  shard       SMALLINT NOT NULL,
+  quantity    BIGINT NOT NULL DEFAULT 0,
+  sales_cents BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, product_id, shard)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_daily_sales_product ON product_daily_sales(product_id);
+
+INSERT INTO product_daily_sales (day, product_id, shard, quantity, sales_cents)
+SELECT
+  (o.created_at AT TIME ZONE 'UTC')::date,
+  oi.product_id,
+  0,
+  SUM(oi.quantity),
+  SUM(oi.line_total_cents)
+FROM orders o
+JOIN order_items oi ON oi.order_id = o.id
+WHERE o.status <> 'CANCELLED'
+GROUP BY 1, 2, 3;
@@ -0,0 +1,4 @@
+-- Lets the analytics snapshot pick up changed orders without scanning the
+-- table. Every order update sets updated_at, so with this index none of them
+-- can be HOT; status changes already were not, status being indexed.
+CREATE INDEX IF NOT EXISTS idx_orders_updated_at ON orders(updated_at);
@@ -0,0 +1,17 @@
+-- GET /products listings and search. None of these cover stock_quantity or
+-- updated_at, so stock updates stay HOT.
+
+-- sort=name pages walk names case-insensitively in code point order; under
+-- the "C" collation the same index also seeks to a name=<prefix> range.
+-- sort=id uses the primary key.
+CREATE INDEX IF NOT EXISTS idx_products_name_id ON products((lower(name) COLLATE "C"), id);
+CREATE INDEX IF NOT EXISTS idx_products_price ON products(price_cents);
+
+-- sku=<prefix>: LIKE 'prefix%' needs a pattern-ops index under non-C
+-- collations; the UNIQUE index on sku cannot serve it.
+CREATE INDEX IF NOT EXISTS idx_products_sku_prefix ON products(sku text_pattern_ops);
+
+-- q=<text>: ILIKE '%text%' on sku or name through trigram indexes.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_products_sku_trgm ON products USING gin (sku gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm ON products USING gin (name gin_trgm_ops);
@@ -0,0 +1,4 @@
+-- A compact alternative for range scans over large, append-mostly orders
+-- tables (reports and exports spanning weeks or months). created_at grows
+-- with insertion order, so block ranges stay tight.
+CREATE INDEX IF NOT EXISTS idx_orders_created_brin ON orders USING brin (created_at) WITH (pages_per_range = 32);
@@ -0,0 +1,45 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from shared.config import MULTI_GET_MAX_IDS
+
+MAX_ID = 2**63 - 1
+
+
+def parse_ids(values: Iterable[str]) -> List[int]:
+    # Accepts ?ids=1,2,3 as well as ?ids=1&ids=2; keeps the first occurrence
+    # of each id so results come back in request order.
+    ids: Dict[int, None] = {}
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                parsed = int(part)
+            except ValueError:
+                raise ValueError("INVALID_IDS")
+            if not 0 < parsed <= MAX_ID:
+                raise ValueError("INVALID_IDS")
+            ids.setdefault(parsed)
+    if not ids:
+        raise ValueError("INVALID_IDS")
+    return list(ids)
+
+
+def requested_ids(values: Optional[List[str]]) -> List[int]:
+    try:
+        ids = parse_ids(values or [])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be positive integers")
+    if len(ids) > MULTI_GET_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Request exceeds {MULTI_GET_MAX_IDS} ids")
+    return ids
+
+
+def order_by_ids(
+    rows: Iterable[Dict[str, Any]], ids: List[int]
+) -> Tuple[List[Dict[str, Any]], List[int]]:
+    by_id = {r["id"]: r for r in rows}
+    return [by_id[i] for i in ids if i in by_id], [i for i in ids if i not in by_id]
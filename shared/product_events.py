@@ -0,0 +1,50 @@
+import json
+import time
+from typing import Iterable, List, Tuple
+
+from shared.config import PRODUCT_CACHE_MAX_SIZE, PRODUCT_CACHE_TTL_SECONDS
+
+# Writers that change what GET /products/{id} returns publish the product ids
+# on this channel inside their own transaction, so Postgres delivers the
+# notification only if and when the change commits. Every products process
+# listens and evicts the ids from its product cache.
+PRODUCT_CHANGES_CHANNEL = "product_changes"
+
+NOTIFY_PRODUCT_CHANGES = "SELECT pg_notify(%s, %s)"
+
+# NOTIFY payloads must stay under 8000 bytes.
+NOTIFY_MAX_IDS = 500
+
+# NOTIFY serializes committing transactions on a global lock, so nothing is
+# published while the product cache is off.
+PRODUCT_CHANGES_ENABLED = PRODUCT_CACHE_MAX_SIZE > 0 and PRODUCT_CACHE_TTL_SECONDS > 0
+
+
+def product_changes_payloads(product_ids: Iterable[int]) -> List[str]:
+    ids = sorted(set(product_ids))
+    sent_at = time.time()
+    return [
+        json.dumps({"ids": ids[i:i + NOTIFY_MAX_IDS], "at": sent_at})
+        for i in range(0, len(ids), NOTIFY_MAX_IDS)
+    ]
+
+
+def parse_product_changes(payload: str) -> Tuple[List[int], float]:
+    message = json.loads(payload)
+    return [int(pid) for pid in message["ids"]], float(message["at"])
+
+
+def notify_product_changes(conn, product_ids: Iterable[int]) -> None:
+    if not PRODUCT_CHANGES_ENABLED:
+        return
+    with conn.cursor() as cur:
+        for payload in product_changes_payloads(product_ids):
+            cur.execute(NOTIFY_PRODUCT_CHANGES, (PRODUCT_CHANGES_CHANNEL, payload))
+
+
+async def notify_product_changes_async(conn, product_ids: Iterable[int]) -> None:
+    if not PRODUCT_CHANGES_ENABLED:
+        return
+    async with conn.cursor() as cur:
+        for payload in product_changes_payloads(product_ids):
+            await cur.execute(NOTIFY_PRODUCT_CHANGES, (PRODUCT_CHANGES_CHANNEL, payload))
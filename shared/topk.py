@@ -0,0 +1,133 @@
+import heapq
+import threading
+import time
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+# Space-Saving heavy hitters (Metwally et al.) over weighted counts, kept to
+# `capacity` counters. A monitored key's true count lies in
+# [count - error, count]; an unmonitored key's is at most `floor`, the
+# largest count ever evicted. Decrements are applied to monitored keys only,
+# which keeps both bounds valid.
+class SpaceSaving:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters: Dict[Hashable, List[int]] = {}
+        self.floor = 0
+
+    def add(self, key: Hashable, amount: int) -> None:
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] = max(counter[0] + amount, 0)
+            return
+        if amount <= 0:
+            return
+        if len(self.counters) >= self.capacity:
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            self.floor = max(self.floor, self.counters.pop(victim)[0])
+        self.counters[key] = [self.floor + amount, self.floor]
+
+    def summary(self) -> "Summary":
+        return Summary(
+            {k: (c, max(c - e, 0)) for k, (c, e) in self.counters.items()}, self.floor
+        )
+
+
+# Upper and lower count bounds per key, plus an upper bound for every key not
+# listed. Summaries of disjoint streams merge by adding bounds.
+class Summary:
+    def __init__(self, bounds: Dict[Hashable, Tuple[int, int]], floor: int):
+        self.bounds = bounds
+        self.floor = floor
+
+    @classmethod
+    def merge(cls, summaries: List["Summary"], capacity: int) -> "Summary":
+        floor = sum(s.floor for s in summaries)
+        upper: Dict[Hashable, int] = {}
+        lower: Dict[Hashable, int] = {}
+        for s in summaries:
+            for key, (hi, lo) in s.bounds.items():
+                upper[key] = upper.get(key, floor) + hi - s.floor
+                lower[key] = lower.get(key, 0) + lo
+        kept = heapq.nlargest(capacity, upper, key=upper.__getitem__)
+        if len(kept) < len(upper):
+            floor = max(floor, max(upper[k] for k in upper.keys() - set(kept)))
+        return cls({k: (upper[k], lower[k]) for k in kept}, floor)
+
+    def top(self, k: int) -> List[Tuple[Hashable, int, int]]:
+        keys = heapq.nlargest(k, self.bounds, key=lambda key: self.bounds[key][0])
+        return [(key, *self.bounds[key]) for key in keys if self.bounds[key][0] > 0]
+
+
+# Space-Saving summaries in fixed time buckets covering the last
+# `bucket_seconds * buckets` seconds. Queries merge the closed buckets of a
+# window once per bucket (cached) and then only the open one, so they cost
+# O(capacity) rather than O(window * capacity).
+class SlidingTopK:
+    def __init__(self, capacity: int, bucket_seconds: int, buckets: int):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._summaries: Dict[int, SpaceSaving] = {}
+        self._closed: Dict[int, Tuple[int, Summary]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.bucket_seconds > 0 and self.buckets > 0
+
+    def _index(self, ts: float) -> int:
+        return int(ts // self.bucket_seconds)
+
+    def _expire(self, current: int) -> None:
+        for index in [i for i in self._summaries if i <= current - self.buckets]:
+            del self._summaries[index]
+
+    def add(self, ts: float, counts: Iterable[Tuple[Hashable, int]]) -> None:
+        if not self.enabled:
+            return
+        current = self._index(time.time())
+        index = min(self._index(ts), current)
+        if index <= current - self.buckets:
+            return
+        with self._lock:
+            summary = self._summaries.get(index)
+            if summary is None:
+                self._expire(current)
+                summary = self._summaries[index] = SpaceSaving(self.capacity)
+            for key, amount in counts:
+                if amount:
+                    summary.add(key, amount)
+            if index < current:
+                self._closed.clear()
+
+    def window_start(self, window_buckets: int, now: Optional[float] = None) -> float:
+        # Events before this timestamp fall outside the window.
+        current = self._index(time.time() if now is None else now)
+        return (current - window_buckets + 1) * self.bucket_seconds
+
+    def top(
+        self, window_buckets: int, k: int, now: Optional[float] = None
+    ) -> Tuple[List[Tuple[Hashable, int, int]], int]:
+        if not self.enabled:
+            return [], 0
+        window_buckets = max(1, min(window_buckets, self.buckets))
+        current = self._index(time.time() if now is None else now)
+        with self._lock:
+            self._expire(current)
+            cached = self._closed.get(window_buckets)
+            if cached is None or cached[0] != current:
+                closed = Summary.merge(
+                    [
+                        s.summary()
+                        for i, s in self._summaries.items()
+                        if current - window_buckets < i < current
+                    ],
+                    self.capacity,
+                )
+                self._closed[window_buckets] = cached = (current, closed)
+            parts = [cached[1]]
+            if current in self._summaries:
+                parts.append(self._summaries[current].summary())
+        merged = Summary.merge(parts, self.capacity)
+        return merged.top(k), merged.floor
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+from shared import metrics
+from shared.cache import TTLCache
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache("test_lru_cache", max_size=2, ttl_seconds=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+    assert metrics.snapshot()["test_lru_cache_evictions"] == 1
+
+
+def test_cache_expires_entries_after_ttl():
+    cache = TTLCache("test_ttl_cache", max_size=10, ttl_seconds=60)
+    cache.set(1, "a", ttl_seconds=-1)
+    assert cache.get(1) is None
+
+
+def test_cache_drops_load_invalidated_in_flight():
+    cache = TTLCache("test_fill_cache", max_size=10, ttl_seconds=60)
+
+    def stale_loader():
+        cache.invalidate(1)
+        return "stale"
+
+    assert cache.load(1, stale_loader) == "stale"
+    assert cache.get(1) is None
+    assert cache.load(1, lambda: "fresh") == "fresh"
+    assert cache.load(1, lambda: "unused") == "fresh"
+
+
+def test_cache_coalesces_concurrent_loads():
+    cache = TTLCache("test_flight_cache", max_size=10, ttl_seconds=60)
+    release = threading.Event()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.load(1, slow_loader)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    while metrics.snapshot().get("test_flight_cache_coalesced", 0) < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+
+
+def test_async_cache_coalesces_and_uses_entry_ttl():
+    cache = TTLCache("test_async_flight_cache", max_size=10, ttl_seconds=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        loads = (cache.load_async(1, loader, ttl_seconds=-1) for _ in range(5))
+        return await asyncio.gather(*loads)
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.get(1) is None
@@ -5,6 +5,7 @@ from psycopg2.errors import IntegrityError, UniqueViolation
 
 from services.customers.main import app
 import services.customers.routes as routes
+from shared.db import get_db
 
 
 def test_create_customer_success(monkeypatch, dummy_conn):
@@ -22,7 +23,7 @@ def test_create_customer_success(monkeypatch, dummy_conn):
             "updated_at": datetime.now(timezone.utc),
         }
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "create_customer", fake_create_customer)
 
     client = TestClient(app)
@@ -41,7 +42,7 @@ def test_create_customer_duplicate(monkeypatch, dummy_conn):
     def fake_create_customer(*_args, **_kwargs):
         raise UniqueViolation()
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "create_customer", fake_create_customer)
 
     client = TestClient(app)
@@ -59,7 +60,7 @@ def test_get_customer_not_found(monkeypatch, dummy_conn):
     def fake_get_customer_by_id(*_args, **_kwargs):
         return None
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "get_customer_by_id", fake_get_customer_by_id)
 
     client = TestClient(app)
@@ -67,6 +68,17 @@ def test_get_customer_not_found(monkeypatch, dummy_conn):
     assert resp.status_code == 404
 
 
+def test_get_customers_rejects_invalid_ids(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+
+    client = TestClient(app)
+    assert client.get("/customers", params={"ids": "1,abc"}).status_code == 400
+    assert client.get("/customers", params={"ids": "0"}).status_code == 400
+
+
 def test_delete_customer_has_orders(monkeypatch, dummy_conn):
     def fake_get_conn():
         return dummy_conn
@@ -74,7 +86,7 @@ def test_delete_customer_has_orders(monkeypatch, dummy_conn):
     def fake_delete_customer(*_args, **_kwargs):
         raise IntegrityError()
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "delete_customer", fake_delete_customer)
 
     client = TestClient(app)
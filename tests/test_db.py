@@ -0,0 +1,172 @@
+import asyncio
+import threading
+
+import psycopg2.errors
+import psycopg2.extensions
+import pytest
+
+from shared import db, metrics
+from shared.db import ConnectionPool, PoolTimeout
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.info = FakeInfo()
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    opts = {"min_size": 0, "max_size": 2, "timeout": 0.05, "healthcheck_idle_seconds": 60}
+    opts.update(kwargs)
+    return ConnectionPool(FakeConn, **opts)
+
+
+def test_pool_reuses_returned_connection():
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert pool.stats()["db_pool_size"] == 1
+
+
+def test_pool_rolls_back_dangling_transaction_on_return():
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.stats()["db_pool_idle"] == 1
+
+
+def test_pool_replaces_closed_connection_on_checkout():
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 1
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.stats()["db_pool_size"] == 1
+
+
+def test_pool_exhaustion_waits_then_times_out():
+    pool = make_pool(max_size=1)
+    held = pool.getconn()
+    before = metrics.snapshot().get("db_pool_timeouts", 0)
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert metrics.snapshot()["db_pool_timeouts"] == before + 1
+
+    timer = threading.Timer(0.01, pool.putconn, args=(held,))
+    timer.start()
+    pool.timeout = 1
+    assert pool.getconn() is held
+    timer.join()
+
+
+def test_retry_on_conflict_retries_deadlocks(monkeypatch):
+    monkeypatch.setattr(db, "DB_RETRY_BASE_DELAY_SECONDS", 0)
+    calls = []
+
+    @db.retry_on_conflict
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise psycopg2.errors.DeadlockDetected()
+        return "ok"
+
+    before = metrics.snapshot().get("db_retries_deadlock", 0)
+    assert flaky() == "ok"
+    assert len(calls) == 3
+    assert metrics.snapshot()["db_retries_deadlock"] == before + 2
+
+
+def test_retry_on_conflict_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(db, "DB_RETRY_BASE_DELAY_SECONDS", 0)
+    monkeypatch.setattr(db, "DB_RETRY_ATTEMPTS", 2)
+    calls = []
+
+    @db.retry_on_conflict
+    def always_conflicts():
+        calls.append(1)
+        raise psycopg2.errors.SerializationFailure()
+
+    with pytest.raises(psycopg2.errors.SerializationFailure):
+        always_conflicts()
+    assert len(calls) == 2
+
+
+def test_streaming_db_response_returns_unread_connection_once(monkeypatch):
+    pool = make_pool()
+    monkeypatch.setattr(db, "_pool", pool)
+
+    resp = db.streaming_db_response(lambda conn: (chunk for chunk in [b"a", b"b"]), "text/plain")
+    assert pool.stats()["db_pool_in_use"] == 1
+    # The body is never iterated, as when the client goes away first.
+    asyncio.run(resp.background())
+    assert pool.stats()["db_pool_in_use"] == 0
+
+    resp = db.streaming_db_response(lambda conn: (chunk for chunk in [b"a"]), "text/plain")
+
+    async def drain():
+        return [chunk async for chunk in resp.body_iterator]
+
+    assert asyncio.run(drain()) == [b"a"]
+    asyncio.run(resp.background())
+    assert (pool.stats()["db_pool_size"], pool.stats()["db_pool_idle"]) == (1, 1)
+
+    def fail(_conn):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        db.streaming_db_response(fail, "text/plain")
+    assert pool.stats()["db_pool_in_use"] == 0
+
+
+def test_get_async_db_returns_connection_when_rollback_fails(monkeypatch):
+    class BrokenConn:
+        closed = False
+
+        class info:
+            transaction_status = db.TransactionStatus.INERROR
+
+        async def rollback(self):
+            raise db.psycopg.OperationalError("connection lost")
+
+        async def close(self):
+            self.closed = True
+
+    class FakeAsyncPool:
+        returned = []
+
+        async def getconn(self):
+            return BrokenConn()
+
+        async def putconn(self, conn):
+            self.returned.append(conn)
+
+    pool = FakeAsyncPool()
+
+    async def fake_get_async_pool():
+        return pool
+
+    monkeypatch.setattr(db, "get_async_pool", fake_get_async_pool)
+
+    async def use():
+        async with db.async_request_db():
+            pass
+
+    asyncio.run(use())
+    assert len(pool.returned) == 1 and pool.returned[0].closed
@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from shared import migrate
+from shared.migrate import MigrationError
+
+
+def test_migrations_are_numbered_and_unique():
+    versions = [version for version, _, _ in migrate.discover_migrations()]
+    assert versions == sorted(versions)
+    assert versions[0] == "0001"
+
+
+def test_discover_rejects_unnumbered_files(tmp_path):
+    (tmp_path / "0001_ok.sql").write_text("SELECT 1;")
+    (tmp_path / "add_index.sql").write_text("SELECT 1;")
+    with pytest.raises(MigrationError):
+        migrate.discover_migrations(tmp_path)
+
+
+def test_pending_migrations_refuses_edited_migration(tmp_path):
+    path = tmp_path / "0001_ok.sql"
+    path.write_text("SELECT 1;")
+    migrations = migrate.discover_migrations(tmp_path)
+    applied = {"0001": {"checksum": migrate._checksum("SELECT 1;")}}
+    assert migrate.pending_migrations(applied, migrations) == []
+    assert migrate.pending_migrations({}, migrations) == migrations
+
+    path.write_text("SELECT 2;")
+    with pytest.raises(MigrationError):
+        migrate.pending_migrations(applied, migrations)
+
+
+def test_find_seq_scans_walks_nested_plans():
+    plan = {
+        "Node Type": "Hash Join",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "orders"},
+            {
+                "Node Type": "Hash",
+                "Plans": [{"Node Type": "Seq Scan", "Relation Name": "products"}],
+            },
+        ],
+    }
+    assert migrate.find_seq_scans(plan) == ["products"]
+
+
+def test_explain_checks_build_sql_and_params():
+    sample = {
+        "customer_id": 1,
+        "product_id": 1,
+        "product_ids": [1, 2],
+        "sku": "SKU-1",
+        "order_id": 1,
+        "order_ids": [1, 2],
+        "start": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "end": datetime(2024, 1, 2, tzinfo=timezone.utc),
+        "after": (datetime(2024, 1, 1, 12, tzinfo=timezone.utc), 1),
+    }
+    checks = list(migrate.iter_explain_checks())
+    assert {module for module, _, _ in checks} == set(migrate.EXPLAIN_CHECK_MODULES)
+    for _, _, build in checks:
+        sql, _params = build(sample)
+        assert sql.strip()
@@ -1,10 +1,32 @@
-from datetime import datetime, timezone
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, datetime, timezone
 
+import threading
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
+from services.orders.analytics import SalesSnapshot, to_us
+from services.orders.cache import align_report_window
+from services.orders.columnar import open_partitions, partition_days, top_products, write_partition
+from services.orders.export import csv_chunks
+from services.orders.jobs import REPORTS, ReportJobs, ReportQueueFull
+from services.orders.queries import build_top_selling_products
 from services.orders.main import app
 import services.orders.routes as routes
+import services.orders.routes_async as routes_async
 import services.orders.service as service
+from services.orders.helpers import (
+    check_stock_levels,
+    decode_cursor,
+    order_item_params,
+    orders_page,
+    price_lines,
+)
+from shared.db import get_db
+from shared.multiget import order_by_ids
 
 
 def test_create_order_out_of_stock(monkeypatch, dummy_conn):
@@ -14,7 +36,7 @@ def test_create_order_out_of_stock(monkeypatch, dummy_conn):
     def fake_create_order(*_args, **_kwargs):
         raise service.OutOfStockError(product_id=1, available=1, requested=5)
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "create_order", fake_create_order)
 
     client = TestClient(app)
@@ -28,13 +50,14 @@ def test_create_order_out_of_stock(monkeypatch, dummy_conn):
 
 
 def test_get_order_not_found(monkeypatch, dummy_conn):
-    def fake_get_conn():
-        return dummy_conn
+    @contextmanager
+    def fake_request_db():
+        yield dummy_conn
 
     def fake_get_order_by_id(*_args, **_kwargs):
         return None
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setattr(routes, "request_db", fake_request_db)
     monkeypatch.setattr(routes, "get_order_by_id", fake_get_order_by_id)
 
     client = TestClient(app)
@@ -49,7 +72,7 @@ def test_update_order_invalid_status(monkeypatch, dummy_conn):
     def fake_update_order_status(*_args, **_kwargs):
         raise ValueError("INVALID_STATUS")
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "update_order_status", fake_update_order_status)
 
     client = TestClient(app)
@@ -62,21 +85,411 @@ def test_list_customer_orders(monkeypatch, dummy_conn):
         return dummy_conn
 
     def fake_list_orders_by_customer(*_args, **_kwargs):
+        return {
+            "items": [
+                {
+                    "id": 1,
+                    "customer_id": 1,
+                    "status": "PENDING",
+                    "total_cents": 1999,
+                    "created_at": datetime.now(timezone.utc),
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            ],
+            "next_cursor": None,
+        }
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "list_orders_by_customer", fake_list_orders_by_customer)
+
+    client = TestClient(app)
+    resp = client.get("/customers/1/orders")
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["id"] == 1
+    assert resp.json()["next_cursor"] is None
+
+
+def test_list_customer_orders_embeds_items_on_request(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    calls = []
+
+    def fake_list_orders_by_customer(_conn, _customer_id, _limit, _cursor, include_items):
+        calls.append(include_items)
+        order = {
+            "id": 1,
+            "customer_id": 1,
+            "status": "PENDING",
+            "total_cents": 500,
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc),
+        }
+        if include_items:
+            order["items"] = [
+                {"product_id": 2, "quantity": 1, "unit_price_cents": 500, "line_total_cents": 500}
+            ]
+        return {"items": [order], "next_cursor": None}
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "list_orders_by_customer", fake_list_orders_by_customer)
+
+    client = TestClient(app)
+    plain = client.get("/customers/1/orders").json()
+    assert "items" not in plain["items"][0]
+    assert plain["next_cursor"] is None
+    embedded = client.get("/customers/1/orders", params={"include": "items"}).json()
+    assert embedded["items"][0]["items"][0]["product_id"] == 2
+    assert calls == [False, True]
+
+
+def test_get_orders_by_ids_keeps_request_order(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    now = datetime.now(timezone.utc)
+    seen = []
+
+    def fake_get_orders_by_ids(_conn, order_ids):
+        seen.append(order_ids)
+        return {
+            "orders": [
+                {
+                    "id": 3,
+                    "customer_id": 1,
+                    "status": "PENDING",
+                    "total_cents": 500,
+                    "items": [],
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            ],
+            "missing": [1],
+        }
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "get_orders_by_ids", fake_get_orders_by_ids)
+
+    client = TestClient(app)
+    resp = client.get("/orders", params={"ids": "3,1,3"})
+    assert resp.status_code == 200
+    assert seen == [[3, 1]]
+    assert resp.json()["orders"][0]["id"] == 3
+    assert resp.json()["missing"] == [1]
+
+
+def test_order_by_ids_reports_missing():
+    rows = [{"id": 2}, {"id": 5}]
+    found, missing = order_by_ids(rows, [5, 4, 2])
+    assert [r["id"] for r in found] == [5, 2]
+    assert missing == [4]
+
+
+def test_async_get_order_not_found(monkeypatch, dummy_conn):
+    @asynccontextmanager
+    async def fake_async_request_db():
+        yield dummy_conn
+
+    async def fake_get_order_by_id(*_args, **_kwargs):
+        return None
+
+    async_app = FastAPI()
+    async_app.include_router(routes_async.router)
+    monkeypatch.setattr(routes_async, "async_request_db", fake_async_request_db)
+    monkeypatch.setattr(routes_async, "get_order_by_id", fake_get_order_by_id)
+
+    client = TestClient(async_app)
+    resp = client.get("/orders/123")
+    assert resp.status_code == 404
+
+
+def test_order_item_params_are_column_arrays():
+    by_id = {1: {"price_cents": 250}, 2: {"price_cents": 100}}
+    lines = price_lines(by_id, [(1, 2), (2, 3)])
+    assert order_item_params(7, lines) == (7, [1, 2], [2, 3], [250, 100], [500, 300])
+
+
+def test_check_stock_levels_raises_for_rejected_row():
+    rows = [
+        {"product_id": 1, "delta": 2, "stock_quantity": 8, "applied": True, "bucketed": False},
+        {"product_id": 2, "delta": 5, "stock_quantity": 3, "applied": False, "bucketed": False},
+    ]
+    with pytest.raises(service.OutOfStockError) as exc:
+        check_stock_levels(rows, service.OutOfStockError)
+    assert (exc.value.product_id, exc.value.available, exc.value.requested) == (2, 3, 5)
+    assert check_stock_levels(rows[:1], service.OutOfStockError) == {1: 8}
+
+
+def test_create_orders_batch_reports_partial_success(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    def fake_create_orders_batch(_conn, orders):
+        now = datetime.now(timezone.utc)
         return [
             {
-                "id": 1,
-                "customer_id": 1,
-                "status": "PENDING",
-                "total_cents": 1999,
-                "created_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc),
-            }
+                "index": 0,
+                "order": {
+                    "id": 1,
+                    "customer_id": orders[0]["customer_id"],
+                    "status": "PENDING",
+                    "total_cents": 100,
+                    "items": [],
+                    "created_at": now,
+                    "updated_at": now,
+                },
+            },
+            {"index": 1, "error": service.batch_error(service.OutOfStockError(2, 0, 3))},
         ]
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
-    monkeypatch.setattr(routes, "list_orders_by_customer", fake_list_orders_by_customer)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "create_orders_batch", fake_create_orders_batch)
 
     client = TestClient(app)
-    resp = client.get("/customers/1/orders")
+    resp = client.post(
+        "/orders:batch",
+        json=[
+            {"customer_id": 1, "items": [{"product_id": 1, "quantity": 1}]},
+            {"customer_id": 1, "items": [{"product_id": 2, "quantity": 3}]},
+        ],
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["created"], body["failed"]) == (1, 1)
+    assert body["results"][1]["error"]["code"] == "OUT_OF_STOCK"
+
+
+def test_batch_error_codes():
+    assert service.batch_error(ValueError("PRODUCT_INACTIVE:7")) == {
+        "code": "PRODUCT_INACTIVE",
+        "product_id": 7,
+    }
+    assert service.batch_error(KeyError("CUSTOMER_NOT_FOUND")) == {"code": "CUSTOMER_NOT_FOUND"}
+    assert service.batch_error(ValueError("Order must have at least one item"))["code"] == (
+        "INVALID_ORDER"
+    )
+
+
+def test_update_orders_status_batch_is_compact(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    def fake_update_orders_status_batch(_conn, order_ids, status, include_items):
+        assert include_items is False
+        return [
+            {"id": order_ids[0], "status": "CONFIRMED", "previous_status": "PENDING"},
+            {"id": order_ids[1], "error": "ORDER_NOT_FOUND"},
+        ]
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "update_orders_status_batch", fake_update_orders_status_batch)
+
+    client = TestClient(app)
+    resp = client.post("/orders/status:batch", json={"order_ids": [1, 2], "status": "confirmed"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["updated"], body["failed"]) == (1, 1)
+    assert body["results"][0] == {"id": 1, "status": "CONFIRMED", "previous_status": "PENDING"}
+    assert body["results"][1] == {"id": 2, "error": "ORDER_NOT_FOUND"}
+
+
+def test_orders_page_cursor_round_trips_last_row():
+    created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    rows = [{"id": 9, "created_at": created}, {"id": 7, "created_at": created}]
+    page = orders_page(rows, 1)
+    assert page["items"] == rows[:1]
+    assert decode_cursor(page["next_cursor"]) == (created, 9)
+    assert orders_page(rows, 2)["next_cursor"] is None
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_csv_export_writes_one_line_per_item():
+    created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    order = {
+        "id": 1,
+        "customer_id": 2,
+        "status": "PENDING",
+        "total_cents": 300,
+        "created_at": created,
+        "updated_at": created,
+    }
+    items = [
+        {"product_id": 5, "quantity": 1, "unit_price_cents": 100, "line_total_cents": 100},
+        {"product_id": 6, "quantity": 2, "unit_price_cents": 100, "line_total_cents": 200},
+    ]
+    chunks = [[{**order, "items": items}, {**order, "id": 3, "items": []}]]
+    lines = b"".join(csv_chunks(iter(chunks), include_items=True)).decode().splitlines()
+    assert lines[0].startswith("id,customer_id,status") and lines[0].endswith("line_total_cents")
+    assert len(lines) == 4
+    assert lines[2].split(",")[-4:] == ["6", "2", "100", "200"]
+    assert lines[3].split(",")[0] == "3" and lines[3].endswith(",,,")
+
+
+def test_top_selling_products_reads_whole_days_from_rollup():
+    start = datetime(2024, 3, 1, 15, 30, tzinfo=timezone.utc)
+    end = datetime(2024, 3, 5, 8, 0, tzinfo=timezone.utc)
+    _sql, params = build_top_selling_products(start, end, 10)
+    assert (params["first_day"].isoformat(), params["last_day"].isoformat()) == (
+        "2024-03-02",
+        "2024-03-05",
+    )
+    assert params["head_end"] == datetime(2024, 3, 2, tzinfo=timezone.utc)
+    assert params["tail_start"] == datetime(2024, 3, 5, tzinfo=timezone.utc)
+
+    # Within a single day nothing comes from the rollup.
+    _sql, params = build_top_selling_products(start, start.replace(hour=20), 10)
+    assert params["first_day"] == params["last_day"]
+    assert params["head_end"] == params["tail_start"] == start
+
+
+def test_align_report_window_widens_to_buckets():
+    start = datetime(2024, 3, 1, 10, 0, 41, 5000, tzinfo=timezone.utc)
+    end = datetime(2024, 3, 1, 12, 30, 2, tzinfo=timezone.utc)
+    aligned = align_report_window(start, end, 60)
+    assert aligned == (
+        datetime(2024, 3, 1, 10, 0, tzinfo=timezone.utc),
+        datetime(2024, 3, 1, 12, 30, 59, 999999, tzinfo=timezone.utc),
+    )
+    assert align_report_window(start.replace(second=59), end.replace(second=30), 60) == aligned
+
+
+def test_live_top_products_reports_error_bounds(monkeypatch):
+    def fake_live_top_products(window_minutes, limit):
+        assert (window_minutes, limit) == (15, 3)
+        return {
+            "window_start": "2024-03-01T10:00:00Z",
+            "as_of": "2024-03-01T10:14:10Z",
+            "max_unlisted_quantity": 2,
+            "items": [{"product_id": 4, "quantity": 12, "error": 2}],
+        }
+
+    monkeypatch.setattr(routes, "live_top_products", fake_live_top_products)
+    client = TestClient(app)
+    resp = client.get("/reports/top-products/live", params={"window_minutes": 15, "limit": 3})
     assert resp.status_code == 200
-    assert resp.json()[0]["id"] == 1
+    assert resp.json()["items"] == [{"product_id": 4, "quantity": 12, "error": 2}]
+    assert client.get("/reports/top-products/live", params={"window_minutes": 0}).status_code == 422
+
+
+def test_sales_snapshot_groups_orders_and_merges_changes():
+    day = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    created = [to_us(day), to_us(day.replace(hour=5)), to_us(day.replace(day=2))]
+    # id, customer_id, status (PENDING=0 ... CANCELLED=4), total_cents, created_us
+    orders = np.array(
+        [[2, 10, 0, 300, created[1]], [1, 11, 3, 500, created[0]], [3, 10, 4, 900, created[2]]]
+    )
+    items = np.array([[1, 7, 5, 500], [2, 7, 1, 100], [2, 8, 2, 200], [3, 8, 9, 900]])
+    snapshot = SalesSnapshot(orders, items, day)
+    start, end = day, day.replace(day=3)
+
+    assert snapshot.top_products(start, end, 10) == [(7, 6, 600), (8, 2, 200)]
+    days = snapshot.sales_by_day(start, end)
+    assert [(d["day"].isoformat(), d["orders"], d["units"]) for d in days] == [
+        ("2024-03-01", 2, 8)
+    ]
+    assert snapshot.top_customers(start, end, 1) == [
+        {"customer_id": 11, "orders": 1, "sales_cents": 500}
+    ]
+    assert snapshot.basket_sizes(start, end) == [
+        {"units": 3, "orders": 1},
+        {"units": 5, "orders": 1},
+    ]
+    funnel = {f["status"]: (f["orders"], f["reached"]) for f in snapshot.status_funnel(start, end)}
+    assert funnel == {
+        "PENDING": (1, 2),
+        "CONFIRMED": (0, 1),
+        "SHIPPED": (0, 1),
+        "DELIVERED": (1, 1),
+        "CANCELLED": (1, 1),
+    }
+
+    # Order 2 is cancelled and order 3 reinstated with a new line set.
+    merged = snapshot.merged(
+        np.array([[2, 10, 4, 300, created[1]], [3, 10, 0, 200, created[2]]]),
+        np.array([[2, 7, 1, 100], [2, 8, 2, 200], [3, 7, 2, 200]]),
+        day,
+    )
+    assert merged.top_products(start, end, 10) == [(7, 7, 700)]
+    assert len(merged.order_ids) == 3 and len(merged.item_rows) == 4
+
+
+def test_columnar_partitions_round_trip_through_memmap(tmp_path):
+    statuses = ["PENDING", "CONFIRMED", "SHIPPED", "DELIVERED", "CANCELLED"]
+    write_partition(
+        tmp_path,
+        date(2024, 3, 1),
+        statuses,
+        np.array([[1, 10, 0, 500, 1], [2, 11, 4, 300, 2]]),
+        np.array([[1, 7, 5, 500], [2, 7, 3, 300]]),
+    )
+    write_partition(
+        tmp_path,
+        date(2024, 3, 2),
+        statuses,
+        np.array([[3, 10, 3, 800, 3]]),
+        np.array([[3, 7, 1, 100], [3, 8, 7, 700]]),
+    )
+    write_partition(tmp_path, date(2024, 3, 3), statuses, np.empty((0, 5)), np.empty((0, 4)))
+    (tmp_path / "day=2024-03-04").mkdir()  # interrupted dump, no _meta.json
+
+    assert partition_days(tmp_path) == [date(2024, 3, 1), date(2024, 3, 2), date(2024, 3, 3)]
+    parts = open_partitions(tmp_path)
+    assert isinstance(parts[0].orders["id"], np.memmap)
+    assert parts[0].order_items["quantity"].dtype == np.int32
+    assert top_products(parts, 10) == [(8, 7, 700), (7, 6, 600)]
+    assert top_products(open_partitions(tmp_path, end=date(2024, 3, 1)), 10) == [(7, 5, 500)]
+
+
+def test_report_jobs_deduplicate_pending_and_keep_results(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def fake_report(params, timeout_ms):
+        calls.append((params["limit"], timeout_ms))
+        release.wait(5)
+        if params["limit"] == 2:
+            raise RuntimeError("boom")
+        return [{"limit": params["limit"]}]
+
+    monkeypatch.setitem(REPORTS, "fake", fake_report)
+    jobs = ReportJobs(
+        workers=1, max_queued=2, max_stored=10, ttl_seconds=60, statement_timeout_seconds=1.5
+    )
+    first = jobs.submit("fake", {"limit": 1})
+    assert jobs.submit("fake", {"limit": 1})["id"] == first["id"]
+    failing = jobs.submit("fake", {"limit": 2})
+    with pytest.raises(ReportQueueFull):
+        jobs.submit("fake", {"limit": 3})
+
+    release.set()
+    jobs._executor.shutdown(wait=True)
+    assert calls == [(1, 1500), (2, 1500)]
+    done = jobs.get(first["id"])
+    assert done["status"] == "succeeded" and done["result"] == [{"limit": 1}]
+    assert done["expires_at"] > done["finished_at"]
+    assert jobs.get(failing["id"])["error"] == "REPORT_FAILED"
+    assert jobs.get("missing") is None
+
+
+def test_report_job_endpoints(monkeypatch):
+    submitted = {}
+
+    def fake_submit(report, params):
+        submitted.update(params, report=report)
+        return {"id": "j1", "report": report, "status": "queued", "created_at": params["end"]}
+
+    monkeypatch.setattr(routes.report_jobs, "submit", fake_submit)
+    monkeypatch.setattr(routes.report_jobs, "get", lambda job_id: None)
+    client = TestClient(app)
+    resp = client.post(
+        "/reports/jobs",
+        json={
+            "report": "top-products",
+            "start": "2024-01-01T00:00:00Z",
+            "end": "2024-12-31T00:00:00Z",
+        },
+    )
+    assert resp.status_code == 202
+    assert resp.json()["id"] == "j1" and submitted["limit"] == 10
+    assert client.get("/reports/jobs/j1").status_code == 404
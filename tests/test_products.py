@@ -1,10 +1,30 @@
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
+import pytest
 from fastapi.testclient import TestClient
 from psycopg2.errors import IntegrityError, UniqueViolation
 
 from services.products.main import app
+import services.products.importer as importer
 import services.products.routes as routes
+import services.products.service as service
+from services.products.cache import apply_product_changes
+from services.products.helpers import decode_cursor, products_page
+from services.products.queries import (
+    APPLY_STOCK_ADJUSTMENTS,
+    LOCK_IMPORTED_PRODUCTS,
+    build_list_products,
+)
+from shared.cache import TTLCache
+from shared.db import get_db
+from shared.inventory import (
+    LOCK_CENTRAL_STOCK,
+    LOCK_CENTRAL_STOCK_SKIP_LOCKED,
+    distribute,
+    is_balanced,
+)
+from shared.product_events import NOTIFY_MAX_IDS, product_changes_payloads
 
 
 def test_create_product_success(monkeypatch, dummy_conn):
@@ -24,7 +44,7 @@ def test_create_product_success(monkeypatch, dummy_conn):
             "updated_at": datetime.now(timezone.utc),
         }
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "create_product", fake_create_product)
 
     client = TestClient(app)
@@ -49,7 +69,7 @@ def test_create_product_duplicate(monkeypatch, dummy_conn):
     def fake_create_product(*_args, **_kwargs):
         raise UniqueViolation()
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "create_product", fake_create_product)
 
     client = TestClient(app)
@@ -73,7 +93,7 @@ def test_delete_product_referenced(monkeypatch, dummy_conn):
     def fake_delete_product(*_args, **_kwargs):
         raise IntegrityError()
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
     monkeypatch.setattr(routes, "delete_product", fake_delete_product)
 
     client = TestClient(app)
@@ -82,15 +102,245 @@ def test_delete_product_referenced(monkeypatch, dummy_conn):
 
 
 def test_get_product_not_found(monkeypatch, dummy_conn):
-    def fake_get_conn():
-        return dummy_conn
+    @contextmanager
+    def fake_request_db():
+        yield dummy_conn
 
     def fake_get_product_by_id(*_args, **_kwargs):
         return None
 
-    monkeypatch.setattr(routes, "get_conn", fake_get_conn)
+    monkeypatch.setattr(routes, "request_db", fake_request_db)
     monkeypatch.setattr(routes, "get_product_by_id", fake_get_product_by_id)
 
     client = TestClient(app)
     resp = client.get("/products/999")
     assert resp.status_code == 404
+
+
+def product_row(product_id, sku):
+    now = datetime.now(timezone.utc)
+    return {
+        "id": product_id,
+        "sku": sku,
+        "name": "Widget",
+        "description": None,
+        "price_cents": 1999,
+        "stock_quantity": 10,
+        "is_active": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def test_get_product_by_sku_rechecks_cached_id(monkeypatch, dummy_conn):
+    @contextmanager
+    def fake_request_db():
+        yield dummy_conn
+
+    products = {1: product_row(1, "SKU-1")}
+    monkeypatch.setattr(routes, "product_cache", TTLCache("test_product_cache", 10, 60))
+    monkeypatch.setattr(routes, "request_db", fake_request_db)
+    monkeypatch.setattr(routes, "get_product_by_id", lambda _conn, pid: products.get(pid))
+    monkeypatch.setattr(
+        routes,
+        "get_product_by_sku",
+        lambda _conn, sku: next((p for p in products.values() if p["sku"] == sku), None),
+    )
+
+    client = TestClient(app)
+    assert client.get("/products/by-sku/SKU-1").json()["id"] == 1
+    assert client.get("/products/by-sku/SKU-1").json()["id"] == 1
+
+    # The SKU moved to a new product; the cached SKU -> id entry is stale.
+    products = {2: product_row(2, "SKU-1")}
+    routes.product_cache.invalidate(1)
+    assert client.get("/products/by-sku/SKU-1").json()["id"] == 2
+    products = {}
+    routes.product_cache.invalidate(2)
+    assert client.get("/products/by-sku/SKU-1").status_code == 404
+
+
+def test_product_change_notifications_evict_ids():
+    cache = TTLCache("test_product_cache", 2000, 60)
+    for pid in range(1200):
+        cache.set(pid, b"{}")
+    cache.set(("sku", "SKU-1"), 1)
+
+    payloads = product_changes_payloads(list(range(1000)) + [5, 5])
+    assert len(payloads) == -(-1000 // NOTIFY_MAX_IDS)
+    assert all(len(p.encode()) < 8000 for p in payloads)
+    for payload in payloads:
+        apply_product_changes(cache, payload)
+
+    assert cache.get(999) is None
+    assert cache.get(1000) == b"{}"
+    assert cache.get(("sku", "SKU-1")) == 1
+
+
+def test_import_products_spools_valid_rows_and_reports_errors(monkeypatch, dummy_conn):
+    @contextmanager
+    def fake_request_db():
+        yield dummy_conn
+
+    loaded = []
+
+    def fake_upsert_products(_conn, spool, _errors, _max_errors):
+        loaded.extend(line.rstrip("\n").split("\t") for line in spool)
+        return {"inserted": 1, "updated": 1, "unchanged": 0, "duplicates": 0}
+
+    monkeypatch.setattr(importer, "request_db", fake_request_db)
+    monkeypatch.setattr(importer, "upsert_products", fake_upsert_products)
+
+    body = (
+        "sku,name,description,price_cents,stock_quantity\n"
+        'A-1,"Tab\tand\nnewline",,100,5\n'
+        "A-2,Negative,x,-1,5\n"
+        "A-3,Extra,x,1,1,oops\n"
+        "A-4,Plain,back\\slash,200,0\n"
+    )
+    client = TestClient(app)
+    resp = client.post("/products:import", content=body, headers={"content-type": "text/csv"})
+    assert resp.status_code == 200
+    out = resp.json()
+    assert (out["inserted"], out["updated"], out["rejected"]) == (1, 1, 2)
+    assert [(e["line"], e["sku"]) for e in out["errors"]] == [(4, "A-2"), (5, "A-3")]
+    assert loaded == [
+        ["3", "A-1", "Tab\\tand\\nnewline", "\\N", "100", "5", "t"],
+        ["6", "A-4", "Plain", "back\\\\slash", "200", "0", "t"],
+    ]
+
+    csv_header = {"content-type": "text/csv"}
+    resp = client.post("/products:import", content="sku,name\n", headers=csv_header)
+    assert resp.status_code == 400
+    resp = client.post("/products:import", content="{}", headers={"content-type": "text/plain"})
+    assert resp.status_code == 415
+
+
+def test_product_stock_locks_leave_key_share_to_order_items():
+    # Orders holding a stock bucket still insert items, whose foreign key
+    # check needs KEY SHARE on the product; FOR UPDATE here would deadlock.
+    for sql in (
+        LOCK_IMPORTED_PRODUCTS,
+        APPLY_STOCK_ADJUSTMENTS,
+        LOCK_CENTRAL_STOCK,
+        LOCK_CENTRAL_STOCK_SKIP_LOCKED,
+    ):
+        assert "FOR NO KEY UPDATE" in sql
+        assert "FOR UPDATE" not in sql
+
+
+def test_adjust_stock_batch_reports_outcome_per_item(monkeypatch, dummy_conn):
+    chunks = []
+
+    def fake_apply_stock_adjustments(_conn, changes):
+        chunks.append(changes)
+        outcomes = {
+            pid: {"previous_stock_quantity": 5, "stock_quantity": quantity}
+            for pid, quantity, _ in changes
+            if pid != 2 and pid != 7
+        }
+        return outcomes, [7] if any(pid == 7 for pid, _, _ in changes) else []
+
+    def fake_adjust_bucketed_stock_total(_conn, pid, quantity, delta):
+        return {"previous_stock_quantity": 10, "error": "INVALID_STOCK_QUANTITY"}
+
+    monkeypatch.setattr(service, "resolve_skus", lambda _conn, skus: {"SKU-7": 7})
+    monkeypatch.setattr(service, "apply_stock_adjustments", fake_apply_stock_adjustments)
+    monkeypatch.setattr(service, "adjust_bucketed_stock_total", fake_adjust_bucketed_stock_total)
+
+    items = [
+        {"id": 1, "sku": None, "quantity": 3, "delta": None},
+        {"id": None, "sku": "SKU-7", "quantity": None, "delta": -20},
+        {"id": 2, "sku": None, "quantity": 4, "delta": None},
+        {"id": 1, "sku": None, "quantity": None, "delta": 1},
+        {"id": None, "sku": "SKU-X", "quantity": 1, "delta": None},
+        {"id": 3, "sku": None, "quantity": 1, "delta": 1},
+    ]
+    results = service.adjust_stock_batch(dummy_conn, items, chunk_size=2)
+
+    assert chunks == [[(1, 3, None), (7, None, -20)], [(2, 4, None)]]
+    assert [r.get("error") for r in results] == [
+        None,
+        "INVALID_STOCK_QUANTITY",
+        "PRODUCT_NOT_FOUND",
+        "DUPLICATE_PRODUCT",
+        "PRODUCT_NOT_FOUND",
+        "INVALID_ADJUSTMENT",
+    ]
+    assert results[0] == {"index": 0, "id": 1, "previous_stock_quantity": 5, "stock_quantity": 3}
+    assert results[1]["sku"] == "SKU-7" and results[1]["id"] == 7
+
+
+def test_adjust_stock_batch_reports_failed_chunk_and_continues(monkeypatch, dummy_conn):
+    def fake_apply_stock_adjustments(_conn, changes):
+        if any(pid == 3 for pid, _, _ in changes):
+            raise RuntimeError("deadlock after retries")
+        outcomes = {
+            pid: {"previous_stock_quantity": 0, "stock_quantity": quantity}
+            for pid, quantity, _ in changes
+        }
+        return outcomes, []
+
+    monkeypatch.setattr(service, "resolve_skus", lambda _conn, skus: {})
+    monkeypatch.setattr(service, "apply_stock_adjustments", fake_apply_stock_adjustments)
+
+    items = [{"id": pid, "sku": None, "quantity": pid, "delta": None} for pid in range(1, 6)]
+    results = service.adjust_stock_batch(dummy_conn, items, chunk_size=2)
+    assert [r.get("stock_quantity") for r in results] == [1, 2, None, None, 5]
+    assert [r.get("error") for r in results[2:4]] == ["STOCK_UPDATE_FAILED"] * 2
+
+
+def test_list_products_passes_filters_and_rejects_bad_cursor(monkeypatch, dummy_conn):
+    calls = []
+
+    def fake_list_products(_conn, limit, cursor, sort, **filters):
+        calls.append((limit, cursor, sort, filters))
+        if cursor == "bad":
+            raise ValueError("INVALID_CURSOR")
+        return {"items": [product_row(1, "SKU-1")], "next_cursor": None}
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, lambda: dummy_conn)
+    monkeypatch.setattr(routes, "list_products", fake_list_products)
+
+    client = TestClient(app)
+    resp = client.get("/products?is_active=true&in_stock=true&name=wid&sort=name&limit=5")
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["sku"] == "SKU-1"
+    assert calls[0][:3] == (5, None, "name")
+    assert calls[0][3]["name"] == "wid" and calls[0][3]["in_stock"] is True
+    assert client.get("/products?cursor=bad").status_code == 400
+    assert client.get("/products?q=ab").status_code == 422
+
+
+def test_products_page_cursor_is_tied_to_its_sort():
+    rows = [{"id": 4, "name": "Widget"}, {"id": 2, "name": "Widget"}]
+    cursor = products_page(rows, 1, "name")["next_cursor"]
+    assert decode_cursor(cursor, "name") == ("Widget", 4)
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "id")
+    assert products_page(rows, 2, "id")["next_cursor"] is None
+
+    sql, params = build_list_products(11, ("Widget", 4), "name", name="50%_off")
+    assert 'ORDER BY lower(name) COLLATE "C", id' in sql
+    assert params == ("50\\%\\_off%", "Widget", 4, 11)
+
+
+def test_set_stock_buckets_not_found(monkeypatch, dummy_conn):
+    def fake_get_conn():
+        return dummy_conn
+
+    def fake_set_stock_buckets(*_args, **_kwargs):
+        return None
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, fake_get_conn)
+    monkeypatch.setattr(routes, "set_stock_buckets", fake_set_stock_buckets)
+
+    client = TestClient(app)
+    resp = client.put("/products/999/stock-buckets", json={"buckets": 4})
+    assert resp.status_code == 404
+
+
+def test_distribute_spreads_remainder_over_first_buckets():
+    assert distribute(10, 4) == [3, 3, 2, 2]
+    assert is_balanced(0, distribute(10, 4))
+    assert not is_balanced(2, [2, 2, 2, 2])
@@ -0,0 +1,48 @@
+import random
+import time
+
+from shared.topk import SlidingTopK, SpaceSaving, Summary
+
+
+def test_space_saving_bounds_hold_for_skewed_stream():
+    rng = random.Random(7)
+    sketch = SpaceSaving(20)
+    truth = {}
+    for _ in range(5000):
+        key = int(rng.paretovariate(1.2)) % 500
+        amount = rng.randint(1, 3)
+        sketch.add(key, amount)
+        truth[key] = truth.get(key, 0) + amount
+
+    summary = sketch.summary()
+    assert len(summary.bounds) == 20
+    for key, (upper, lower) in summary.bounds.items():
+        assert lower <= truth[key] <= upper
+    for key, count in truth.items():
+        if key not in summary.bounds:
+            assert count <= summary.floor
+    assert summary.top(1)[0][0] == max(truth, key=truth.get)
+
+
+def test_summary_merge_adds_bounds_and_raises_floor():
+    a = Summary({"x": (10, 8), "y": (4, 4)}, 2)
+    b = Summary({"x": (5, 5), "z": (9, 6)}, 1)
+    merged = Summary.merge([a, b], 2)
+    # y was dropped with an upper bound of 4 + b's floor.
+    assert merged.bounds == {"x": (15, 13), "z": (11, 6)}
+    assert merged.floor == 5
+
+
+def test_sliding_top_k_forgets_expired_buckets_and_applies_cancellations():
+    topk = SlidingTopK(capacity=10, bucket_seconds=60, buckets=5)
+    now = time.time()
+    topk.add(now - 600, [(1, 100)])
+    topk.add(now - 120, [(2, 7), (3, 5)])
+    topk.add(now, [(3, 4)])
+    topk.add(now - 120, [(2, -7)])
+
+    top, floor = topk.top(5, 10, now)
+    assert top == [(3, 9, 9)]
+    assert floor == 0
+    # A one-bucket window only sees the open bucket.
+    assert topk.top(1, 10, now)[0] == [(3, 4, 4)]